@@ -9,6 +9,9 @@ def create_app(test_config=None):
         CSV_PATH="receipts.csv",
         IMAGE_DIR="app/captured_receipts",
         SECRET_KEY="change-me",
+        # Re-uploads of an already known image redirect to the existing
+        # receipt instead of creating a copy of it.
+        DEDUP_LINK_EXISTING=True,
     )
 
     if test_config:
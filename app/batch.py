@@ -0,0 +1,135 @@
+"""Parallel batch ingestion of a directory of receipt images.
+
+OCR runs across a process pool sized to the CPU count; results are written
+in batches with one transaction each and ``receipts.csv`` is rewritten once
+at the end. Images already in the database (by path) are skipped, so an
+interrupted run can simply be started again.
+"""
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import signal
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from .jobs import parsed_updates, pending_record
+from .models import (
+    export_to_csv,
+    get_cached_ocr,
+    get_receipt,
+    init_db,
+    insert_receipts,
+    receipt_image_paths,
+)
+from .ocr import PIPELINE_VERSION, process_image
+from .storage import hash_file
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".webp"}
+BATCH_SIZE = 50
+
+
+def find_images(root: str) -> List[str]:
+    found = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                found.append(os.path.relpath(os.path.join(dirpath, name), start="."))
+    return sorted(found)
+
+
+def _ocr_one(db_path: str, path: str) -> Tuple[str, str, Optional[Dict[str, object]], Optional[str]]:
+    try:
+        digest = hash_file(path)
+        # Duplicates of already ingested images skip OCR entirely.
+        cached = get_cached_ocr(db_path, digest, PIPELINE_VERSION)
+        if cached and cached["result"]:
+            return path, digest, json.loads(cached["result"]), None
+        # Layout mode saves latency only by deferring the full-page pass,
+        # which a bulk import would have to run anyway.
+        updates = parsed_updates(process_image(path, mode="full"))
+    except Exception as exc:  # reported by the parent, retried on the next run
+        return path, "", None, str(exc)
+    updates.pop("updated_at")
+    return path, digest, updates, None
+
+
+def ingest_directory(
+    root: str,
+    db_path: str = "receipts.db",
+    csv_path: str = "receipts.csv",
+    workers: Optional[int] = None,
+    batch_size: int = BATCH_SIZE,
+) -> Dict[str, float]:
+    init_db(db_path)
+    done = receipt_image_paths(db_path)
+    todo = [path for path in find_images(root) if path not in done]
+    workers = workers or os.cpu_count() or 1
+    print(f"{len(todo)} image(s) to ingest ({len(done)} already in the database), {workers} worker(s)")
+
+    counts = {"ingested": 0, "duplicates": 0, "failed": 0}
+    records: List[Dict[str, object]] = []
+    cache_entries = []
+    seen_hashes = set()
+    start = time.perf_counter()
+
+    def flush() -> None:
+        if records:
+            insert_receipts(db_path, records, cache_entries)
+            counts["ingested"] += len(records)
+            records.clear()
+            cache_entries.clear()
+        elapsed = time.perf_counter() - start
+        processed = sum(counts.values())
+        print(f"  {processed}/{len(todo)} processed, {processed / elapsed:.2f} receipts/s")
+
+    pool = multiprocessing.Pool(workers, initializer=signal.signal, initargs=(signal.SIGINT, signal.SIG_IGN))
+    try:
+        for path, digest, result, error in pool.imap_unordered(functools.partial(_ocr_one, db_path), todo):
+            if error is not None:
+                counts["failed"] += 1
+                print(f"  failed: {path}: {error}")
+                continue
+            cached = get_cached_ocr(db_path, digest, PIPELINE_VERSION)
+            if digest in seen_hashes or (cached and get_receipt(db_path, cached["receipt_id"])):
+                counts["duplicates"] += 1
+                continue
+            seen_hashes.add(digest)
+            receipt_id = str(uuid.uuid4())
+            record = pending_record(receipt_id, path)
+            record.update(result)
+            records.append(record)
+            cache_entries.append((digest, PIPELINE_VERSION, receipt_id, result))
+            if len(records) >= batch_size:
+                flush()
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        print("Interrupted; saving finished receipts. Re-run to resume.")
+    finally:
+        pool.join()
+        flush()
+        export_to_csv(db_path, csv_path)
+
+    elapsed = time.perf_counter() - start
+    processed = sum(counts.values())
+    counts["seconds"] = round(elapsed, 2)
+    counts["receipts_per_second"] = round(processed / elapsed, 2) if elapsed else 0.0
+    print(
+        f"Done: {counts['ingested']} ingested, {counts['duplicates']} duplicate(s), "
+        f"{counts['failed']} failed in {elapsed:.1f}s ({counts['receipts_per_second']} receipts/s)"
+    )
+    return counts
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Ingest a directory of receipt images.")
+    parser.add_argument("directory")
+    parser.add_argument("--db", default="receipts.db")
+    parser.add_argument("--csv", default="receipts.csv")
+    parser.add_argument("--workers", type=int, default=None, help="default: one per CPU core")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+    ingest_directory(args.directory, args.db, args.csv, args.workers, args.batch_size)
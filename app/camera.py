@@ -1,30 +1,139 @@
+import fcntl
 import os
 import subprocess
-from typing import Optional
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .capture_service import request_capture
+from .metrics import timed
+from .models import activate_camera_request, camera_queue_position, delete_camera_request, enqueue_camera_request
+from .storage import hash_file
 
 LIBCAMERA_CMD = "libcamera-still"
+# flock()ed by whoever is capturing, across gunicorn workers and CLIs alike.
+CAMERA_LOCK_PATH = os.environ.get("RECEIPT_CAMERA_LOCK", os.path.join(tempfile.gettempdir(), "receipt-camera.lock"))
+CAMERA_WAIT_TIMEOUT = 30.0
+CAMERA_POLL_INTERVAL = 0.05
+
+
+class CameraBusyError(RuntimeError):
+    """Timed out waiting in line for the camera."""
+
+
+@contextmanager
+def camera_lock(
+    timeout: float = CAMERA_WAIT_TIMEOUT,
+    queue_db: Optional[str] = None,
+    client: Optional[str] = None,
+    hold_limit: float = 60.0,
+) -> Iterator[None]:
+    """Hold the camera exclusively, waiting up to ``timeout`` seconds.
+
+    With ``queue_db`` the caller takes a ticket in the ``camera_requests``
+    table and is served in arrival order; ``client`` lets a browser look up
+    its position (``camera_queue_status``). Tickets of crashed processes
+    expire, and a crashed holder's flock is released by the kernel.
+    """
+
+    now = time.time()
+    ticket = enqueue_camera_request(queue_db, client, now + timeout + hold_limit) if queue_db else None
+    deadline = time.monotonic() + timeout
+    fd = os.open(CAMERA_LOCK_PATH, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        while True:
+            if ticket is None or camera_queue_position(queue_db, ticket) == 0:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    pass
+            if time.monotonic() >= deadline:
+                raise CameraBusyError(f"camera still busy after waiting {timeout:g}s, try again")
+            time.sleep(CAMERA_POLL_INTERVAL)
+        if ticket is not None:
+            activate_camera_request(queue_db, ticket, time.time() + hold_limit)
+        yield
+    finally:
+        os.close(fd)  # releases the flock if held
+        if ticket is not None:
+            delete_camera_request(queue_db, ticket)
 
 
-def capture_receipt(output_path: str, timeout: int = 10, resolution: Optional[str] = "1536x864") -> None:
-    """Capture a still image using libcamera-still.
+def capture_receipt(
+    output_path: str,
+    timeout: int = 10,
+    resolution: Optional[str] = "1536x864",
+    queue_db: Optional[str] = None,
+    client: Optional[str] = None,
+) -> str:
+    """Capture a still image to ``output_path`` and return its SHA-256.
 
-    Falls back to creating a blank file if libcamera is unavailable so
-    development on non-Pi hosts still works.
+    See ``capture_frame``; this variant does not keep the pixels.
     """
 
+    digest, _ = _capture(output_path, timeout, resolution, False, queue_db, client)
+    return digest
+
+
+def capture_frame(
+    output_path: str,
+    timeout: int = 10,
+    resolution: Optional[str] = "1536x864",
+    queue_db: Optional[str] = None,
+    client: Optional[str] = None,
+) -> Tuple[str, Optional[np.ndarray]]:
+    """Capture a still image and return ``(sha256, gray frame)``.
+
+    Through the camera daemon (``camera_daemon.py``), which keeps the camera
+    open and converged, the frame comes back in memory and the archival JPEG
+    is written to ``output_path`` in the background; the hash is then of the
+    frame's pixels. Without the daemon this falls back to spawning
+    libcamera-still and decoding its file, and to creating a blank file
+    (frame ``None``) if libcamera is not installed so development on non-Pi
+    hosts still works. Concurrent captures are serialised by ``camera_lock``;
+    raises ``CameraBusyError`` when the wait times out and ``RuntimeError``
+    when the camera fails.
+    """
+
+    return _capture(output_path, timeout, resolution, True, queue_db, client)
+
+
+def _capture(
+    output_path: str,
+    timeout: int,
+    resolution: Optional[str],
+    return_frame: bool,
+    queue_db: Optional[str],
+    client: Optional[str],
+) -> Tuple[str, Optional[np.ndarray]]:
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    cmd = [
-        LIBCAMERA_CMD,
-        "-o",
-        output_path,
-        "--timeout",
-        str(timeout * 1000),
-    ]
-    if resolution:
-        cmd.extend(["--width", resolution.split("x")[0], "--height", resolution.split("x")[1]])
+    with camera_lock(queue_db=queue_db, client=client), timed("capture"):
+        try:
+            return request_capture(output_path, timeout=timeout, return_frame=return_frame)
+        except (FileNotFoundError, ConnectionRefusedError):
+            pass  # daemon not running; spawn libcamera-still instead
 
-    try:
-        subprocess.run(cmd, check=True)
-    except (FileNotFoundError, subprocess.CalledProcessError):
-        # Development fallback: create an empty placeholder so later steps don't break
-        open(output_path, "wb").close()
+        cmd = [
+            LIBCAMERA_CMD,
+            "-o",
+            output_path,
+            "--timeout",
+            str(timeout * 1000),
+        ]
+        if resolution:
+            cmd.extend(["--width", resolution.split("x")[0], "--height", resolution.split("x")[1]])
+
+        try:
+            subprocess.run(cmd, check=True)
+        except FileNotFoundError:
+            # Development fallback: create an empty placeholder so later steps don't break
+            open(output_path, "wb").close()
+        except subprocess.CalledProcessError as exc:
+            raise RuntimeError(f"{LIBCAMERA_CMD} failed with exit status {exc.returncode}") from None
+        frame = cv2.imread(output_path, cv2.IMREAD_GRAYSCALE) if return_frame else None
+        return hash_file(output_path), frame
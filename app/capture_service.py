@@ -0,0 +1,554 @@
+"""Long-lived camera capture daemon.
+
+``libcamera-still`` opens the camera, initialises the sensor and waits for
+auto-exposure to converge on every scan. The daemon started by
+``camera_daemon.py`` does that once and keeps the camera streaming, so a
+capture is just grabbing the next few frames and keeping the sharpest
+(``BURST_FRAMES``, scored by ``focus_score``). Requests arrive as one JSON
+line on a Unix socket::
+
+    {"cmd": "capture", "path": "app/captured_receipts/x.jpg"}
+
+and are answered with ``{"ok": true, "path": ..., "sha256": ..., "seconds": ...}``
+or ``{"ok": false, "error": ...}``. The archival JPEG is written by a
+background thread after the reply (send ``"wait": true`` to block on it),
+and the gray frame is kept in memory under its path so the OCR worker can
+fetch it with ``{"cmd": "frame", "path": ...}`` instead of decoding the
+JPEG. Replies that carry a frame announce ``frame_shape`` and are followed
+by the raw uint8 pixels. ``{"cmd": "discard", "path": ...}`` deletes a
+recent capture that turned out to be a duplicate; it goes through the same
+writer thread, so the JPEG is removed after it is written, never before.
+
+``{"cmd": "preview"}`` turns the connection into a stream of low-resolution
+JPEG frames, each announced by a JSON line with ``jpeg_bytes``. With
+``"auto_dir"`` set, ``AutoTrigger`` watches the stream and captures into
+that directory whenever a receipt has been held still in frame, reporting
+the capture in the frame's JSON line. Frame sources are pluggable;
+``FakeFrameSource`` replays images from a directory for development on
+hosts without a camera.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+try:
+    from picamera2 import Picamera2
+except ImportError:  # pragma: no cover - only available on Raspberry Pi OS
+    Picamera2 = None
+
+from .ocr import find_paper_roi
+
+CAMERA_SOCKET = os.environ.get("RECEIPT_CAMERA_SOCKET", "/tmp/receipt-camera.sock")
+CAPTURE_TIMEOUT = 10.0
+JPEG_QUALITY = 92
+# Gray frames kept for OCR workers to fetch; a 1536x864 frame is 1.3 MB.
+RECENT_FRAMES = 8
+# Recent captures a client may still discard; older paths are refused.
+DISCARDABLE_CAPTURES = 256
+# Frames grabbed per capture; the sharpest one is kept.
+BURST_FRAMES = int(os.environ.get("RECEIPT_BURST_FRAMES", "3"))
+FOCUS_PROXY_WIDTH = 480
+PREVIEW_SIZE = (640, 360)
+PREVIEW_FPS = 8
+PREVIEW_JPEG_QUALITY = 70
+# Auto-capture fires once the paper has moved less than AUTO_MOTION_THRESHOLD
+# gray levels (mean absolute frame difference) for AUTO_STABLE_SECONDS.
+AUTO_STABLE_SECONDS = float(os.environ.get("RECEIPT_AUTO_STABLE_SECONDS", "0.8"))
+AUTO_MOTION_THRESHOLD = 3.0
+AUTO_PROXY_WIDTH = 320
+DEFAULT_RESOLUTION = "1536x864"
+
+logger = logging.getLogger(__name__)
+
+
+class FrameSource:
+    """A camera that stays open between captures and returns BGR frames."""
+
+    name = "base"
+
+    def start(self) -> None:
+        pass
+
+    def capture(self) -> np.ndarray:
+        raise NotImplementedError
+
+    def preview(self) -> np.ndarray:
+        """A low-resolution gray or BGR frame for the live preview."""
+
+        frame = self.capture()
+        scale = PREVIEW_SIZE[0] / frame.shape[1]
+        return cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    def close(self) -> None:
+        pass
+
+
+class Picamera2Source(FrameSource):
+    name = "picamera2"
+
+    def __init__(self, resolution: str = DEFAULT_RESOLUTION):
+        if Picamera2 is None:
+            raise RuntimeError("picamera2 is not installed")
+        width, height = (int(v) for v in resolution.split("x"))
+        self.camera = Picamera2()
+        # RGB888 is stored B, G, R in memory, which is what OpenCV expects.
+        config = self.camera.create_still_configuration(
+            main={"size": (width, height), "format": "RGB888"},
+            lores={"size": PREVIEW_SIZE, "format": "YUV420"},
+        )
+        self.camera.configure(config)
+
+    def start(self) -> None:
+        self.camera.start()
+        # Let auto-exposure and white balance settle before the first request.
+        time.sleep(1.0)
+
+    def capture(self) -> np.ndarray:
+        return self.camera.capture_array("main")
+
+    def preview(self) -> np.ndarray:
+        # The Y plane of the YUV420 low-res stream is a gray image already.
+        return self.camera.capture_array("lores")[: PREVIEW_SIZE[1], : PREVIEW_SIZE[0]]
+
+    def close(self) -> None:
+        self.camera.stop()
+        self.camera.close()
+
+
+class FakeFrameSource(FrameSource):
+    """Replays the images in ``directory`` in order, looping forever.
+
+    Like a stack of receipts under the camera: the same image stays in view
+    until it has been captured, and is replaced by the next one once the
+    preview runs again or a second has passed.
+    """
+
+    name = "fake"
+
+    def __init__(self, directory: str, delay: float = 0.0):
+        extensions = (".jpg", ".jpeg", ".png", ".bmp")
+        paths = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory) if name.lower().endswith(extensions)
+        )
+        if not paths:
+            raise RuntimeError(f"no images in {directory}")
+        self._paths = itertools.cycle(paths)
+        self._frame: Optional[np.ndarray] = None
+        self._captured_at: Optional[float] = None
+        self.delay = delay
+
+    def _next(self) -> None:
+        self._frame = cv2.imread(next(self._paths), cv2.IMREAD_COLOR)
+        self._captured_at = None
+        if self._frame is None:
+            raise RuntimeError("could not decode fake frame")
+
+    def capture(self) -> np.ndarray:
+        if self.delay:
+            time.sleep(self.delay)
+        now = time.monotonic()
+        if self._frame is None or (self._captured_at is not None and now - self._captured_at > 1.0):
+            self._next()
+        self._captured_at = now
+        return self._frame
+
+    def preview(self) -> np.ndarray:
+        if self._frame is None or self._captured_at is not None:
+            self._next()
+        scale = PREVIEW_SIZE[0] / self._frame.shape[1]
+        return cv2.resize(self._frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def create_source(name: str, resolution: str = DEFAULT_RESOLUTION, fake_dir: Optional[str] = None) -> FrameSource:
+    if name == "fake":
+        return FakeFrameSource(fake_dir or "app/captured_receipts")
+    return Picamera2Source(resolution)
+
+
+def focus_score(image: np.ndarray) -> float:
+    """Sharpness of a gray or BGR ``image`` as the variance of its Laplacian.
+
+    Computed on a copy subsampled to about ``FOCUS_PROXY_WIDTH`` pixels wide
+    so it costs around a millisecond per frame; only the ranking within a
+    burst matters.
+    """
+
+    # Plain subsampling rather than an area resize: averaging would itself
+    # blur away the fine detail being measured, and it costs more.
+    step = max(1, image.shape[1] // FOCUS_PROXY_WIDTH)
+    small = np.ascontiguousarray(image[::step, ::step])
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    _, stddev = cv2.meanStdDev(cv2.Laplacian(small, cv2.CV_16S))
+    return float(stddev[0, 0] ** 2)
+
+
+def sharpest_frame(frames: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray, List[float]]:
+    """Pick the sharpest of ``frames``; returns (frame, its gray copy, all scores)."""
+
+    scores = [focus_score(frame) for frame in frames]
+    best = frames[int(np.argmax(scores))]
+    return best, best if best.ndim == 2 else cv2.cvtColor(best, cv2.COLOR_BGR2GRAY), scores
+
+
+class AutoTrigger:
+    """Decides from preview frames when a receipt is steady enough to capture.
+
+    ``update`` returns the state: ``empty`` (no paper in view), ``moving``,
+    ``steady`` (counting down), ``capture`` (fire now) or ``captured``
+    (waiting for the receipt to be swapped before arming again).
+    """
+
+    def __init__(self, stable_seconds: float = AUTO_STABLE_SECONDS, motion_threshold: float = AUTO_MOTION_THRESHOLD):
+        self.stable_seconds = stable_seconds
+        self.motion_threshold = motion_threshold
+        self.previous: Optional[np.ndarray] = None
+        self.steady_since: Optional[float] = None
+        self.armed = True
+        self.roi: Optional[Tuple[int, int, int, int]] = None
+        self.scale = 1.0
+
+    def update(self, gray: np.ndarray, now: float) -> str:
+        self.scale = AUTO_PROXY_WIDTH / gray.shape[1]
+        small = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        blurred = cv2.GaussianBlur(small, (5, 5), 0)
+        moving = (
+            self.previous is None
+            or self.previous.shape != blurred.shape
+            or float(cv2.absdiff(blurred, self.previous).mean()) > self.motion_threshold
+        )
+        self.previous = blurred
+        self.roi = find_paper_roi(small)
+        if moving or self.roi is None:
+            # A hand in view or an empty table means the next receipt is coming.
+            self.armed = True
+            self.steady_since = None
+            return "empty" if self.roi is None else "moving"
+        if not self.armed:
+            return "captured"
+        if self.steady_since is None:
+            self.steady_since = now
+        if now - self.steady_since < self.stable_seconds:
+            return "steady"
+        self.armed = False
+        self.steady_since = None
+        return "capture"
+
+
+def write_jpeg(frame: np.ndarray, path: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ok:
+        raise RuntimeError("JPEG encoding failed")
+    # Write to a temp name first so readers never see a half-written image.
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(encoded.tobytes())
+    os.replace(tmp_path, path)
+
+
+def remove_jpeg(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class CaptureServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, source: FrameSource, burst: int = BURST_FRAMES):
+        self.source = source
+        self.burst = max(1, burst)
+        self.camera_lock = threading.Lock()
+        self.frames: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.frames_lock = threading.Lock()
+        self.captured: "OrderedDict[str, None]" = OrderedDict()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jpeg-writer")
+        self.preview_state = "off"
+        self.auto_session = {"captures": 0, "started": None}
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, CaptureHandler)
+        # The web app may run as another user in the same group.
+        os.chmod(socket_path, 0o660)
+
+    def capture_to(
+        self, path: str, wait: bool = False, burst: Optional[int] = None
+    ) -> Tuple[np.ndarray, str, float, List[float]]:
+        """Grab a burst for ``path`` and keep its sharpest frame.
+
+        Returns (gray frame, sha256 of it, seconds, focus score per frame).
+        """
+
+        start = time.perf_counter()
+        with self.camera_lock:
+            frames = [self.source.capture() for _ in range(max(1, burst or self.burst))]
+        frame, gray, scores = sharpest_frame(frames)
+        gray = np.ascontiguousarray(gray)
+        with self.frames_lock:
+            self.frames[path] = gray
+            while len(self.frames) > RECENT_FRAMES:
+                self.frames.popitem(last=False)
+            self.captured[path] = None
+            while len(self.captured) > DISCARDABLE_CAPTURES:
+                self.captured.popitem(last=False)
+        written = self.writer.submit(write_jpeg, frame, path)
+        if wait:
+            written.result()
+        return gray, hashlib.sha256(gray.data).hexdigest(), time.perf_counter() - start, scores
+
+    def status(self) -> Dict[str, object]:
+        captures, started = self.auto_session["captures"], self.auto_session["started"]
+        minutes = (time.time() - started) / 60 if started else 0
+        return {
+            "ok": True,
+            "source": self.source.name,
+            "preview_state": self.preview_state,
+            "auto_captures": captures,
+            "receipts_per_minute": round(captures / minutes, 1) if minutes else 0.0,
+        }
+
+    def frame_for(self, path: str) -> Optional[np.ndarray]:
+        with self.frames_lock:
+            return self.frames.get(path)
+
+    def discard(self, path: str) -> bool:
+        """Delete a recent capture, once its JPEG is written; False if ``path`` is not one."""
+
+        with self.frames_lock:
+            if path not in self.captured:
+                return False
+            del self.captured[path]
+            self.frames.pop(path, None)
+        # The single writer thread runs this after the capture's own write.
+        self.writer.submit(remove_jpeg, path)
+        return True
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.writer.shutdown(wait=True)
+
+
+class CaptureHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        frame = None
+        try:
+            request = json.loads(self.rfile.readline())
+            if request.get("cmd") == "preview":
+                self.stream_preview(request.get("auto_dir"))
+                return
+            response, frame = self.dispatch(request)
+        except Exception as exc:
+            logger.exception("capture request failed")
+            response = {"ok": False, "error": str(exc)}
+        if frame is not None:
+            response["frame_shape"] = list(frame.shape)
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+        if frame is not None:
+            self.wfile.write(frame.data)
+
+    def dispatch(self, request: Dict[str, object]) -> Tuple[Dict[str, object], Optional[np.ndarray]]:
+        cmd = request.get("cmd")
+        if cmd == "ping":
+            return {"ok": True, "source": self.server.source.name}, None
+        if cmd == "status":
+            return self.server.status(), None
+        if cmd == "capture":
+            path = str(request["path"])
+            gray, digest, seconds, scores = self.server.capture_to(path, bool(request.get("wait")), request.get("burst"))
+            response = {
+                "ok": True,
+                "path": path,
+                "sha256": digest,
+                "seconds": round(seconds, 4),
+                "focus_scores": [round(score, 1) for score in scores],
+            }
+            return response, gray if request.get("return_frame") else None
+        if cmd == "frame":
+            gray = self.server.frame_for(str(request["path"]))
+            if gray is None:
+                return {"ok": False, "error": "frame not available"}, None
+            return {"ok": True}, gray
+        if cmd == "discard":
+            if not self.server.discard(str(request["path"])):
+                return {"ok": False, "error": "not a recent capture"}, None
+            return {"ok": True}, None
+        return {"ok": False, "error": f"unknown command {cmd!r}"}, None
+
+    def stream_preview(self, auto_dir: Optional[str]) -> None:
+        """Send preview frames until the client goes away, auto-capturing if asked."""
+
+        server = self.server
+        trigger = AutoTrigger() if auto_dir else None
+        if trigger is not None:
+            server.auto_session = {"captures": 0, "started": time.time()}
+        try:
+            while True:
+                started = time.monotonic()
+                with server.camera_lock:
+                    frame = server.source.preview()
+                gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                event: Dict[str, object] = {"state": "preview"}
+                if trigger is not None:
+                    event["state"] = trigger.update(gray, started)
+                    if event["state"] == "capture":
+                        path = os.path.join(auto_dir, f"{uuid.uuid4()}.jpg")
+                        _, digest, _, _ = server.capture_to(path)
+                        server.auto_session["captures"] += 1
+                        event.update(state="captured", captured=path, sha256=digest)
+                    if trigger.roi is not None:
+                        x, y, w, h = (int(v / trigger.scale) for v in trigger.roi)
+                        frame = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+                        color = (0, 200, 0) if event["state"] in ("steady", "captured") else (0, 160, 255)
+                        cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+                server.preview_state = event["state"]
+                ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_JPEG_QUALITY])
+                if not ok:
+                    continue
+                event["jpeg_bytes"] = len(jpeg)
+                self.wfile.write(json.dumps(event).encode("utf-8") + b"\n")
+                self.wfile.write(jpeg.tobytes())
+                self.wfile.flush()
+                time.sleep(max(0.0, 1 / PREVIEW_FPS - (time.monotonic() - started)))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            server.preview_state = "off"
+
+
+def send_request(
+    request: Dict[str, object], socket_path: str = CAMERA_SOCKET, timeout: float = CAPTURE_TIMEOUT
+) -> Tuple[Dict, Optional[np.ndarray]]:
+    """Send one request to the daemon; returns (response, frame or ``None``).
+
+    Raises ``OSError`` if the daemon is not running (nothing is listening on
+    ``socket_path``) and ``RuntimeError`` if it hangs or drops the connection.
+    """
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socket_path)
+        except socket.timeout:
+            raise RuntimeError("capture daemon is not accepting connections") from None
+        try:
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as reader:
+                line = reader.readline()
+                if not line:
+                    raise RuntimeError("capture daemon closed the connection")
+                response = json.loads(line)
+                frame = None
+                if "frame_shape" in response:
+                    shape = tuple(response["frame_shape"])
+                    data = reader.read(int(np.prod(shape)))
+                    frame = np.frombuffer(data, dtype=np.uint8).reshape(shape)
+        except socket.timeout:
+            raise RuntimeError("capture daemon timed out") from None
+        except OSError as exc:
+            raise RuntimeError(f"lost the connection to the capture daemon: {exc}") from None
+    return response, frame
+
+
+def request_capture(
+    output_path: str, socket_path: str = CAMERA_SOCKET, timeout: float = CAPTURE_TIMEOUT, return_frame: bool = False
+) -> Tuple[str, Optional[np.ndarray]]:
+    """Have the daemon capture to ``output_path``; returns (sha256, gray frame).
+
+    The JPEG lands on disk shortly after this returns. The frame is only
+    sent back when ``return_frame`` is set. Raises ``FileNotFoundError`` or
+    ``ConnectionRefusedError`` when no daemon is listening and
+    ``RuntimeError`` when it could not capture.
+    """
+
+    request = {"cmd": "capture", "path": os.path.abspath(output_path), "return_frame": return_frame}
+    response, frame = send_request(request, socket_path, timeout)
+    if not response.get("ok"):
+        raise RuntimeError(f"capture daemon: {response.get('error')}")
+    return response["sha256"], frame
+
+
+def discard_capture(path: str, socket_path: str = CAMERA_SOCKET, timeout: float = CAPTURE_TIMEOUT) -> None:
+    """Have the daemon delete its capture at ``path``, e.g. a duplicate scan.
+
+    Raises ``FileNotFoundError`` or ``ConnectionRefusedError`` when no daemon
+    is listening and ``RuntimeError`` when it refuses.
+    """
+
+    response, _ = send_request({"cmd": "discard", "path": os.path.abspath(path)}, socket_path, timeout)
+    if not response.get("ok"):
+        raise RuntimeError(f"capture daemon: {response.get('error')}")
+
+
+def fetch_frame(image_path: str, socket_path: str = CAMERA_SOCKET, timeout: float = CAPTURE_TIMEOUT) -> Optional[np.ndarray]:
+    """The daemon's in-memory gray frame for ``image_path``, or ``None``."""
+
+    try:
+        response, frame = send_request({"cmd": "frame", "path": os.path.abspath(image_path)}, socket_path, timeout)
+    except (OSError, RuntimeError):
+        return None
+    return frame if response.get("ok") else None
+
+
+def preview_stream(
+    auto_dir: Optional[str] = None, socket_path: str = CAMERA_SOCKET, timeout: float = CAPTURE_TIMEOUT
+) -> Iterator[Tuple[Dict, bytes]]:
+    """Yield ``(event, jpeg)`` preview frames from the daemon until closed.
+
+    With ``auto_dir`` the daemon captures into it whenever the receipt in
+    view is steady; such events carry ``captured`` (the path) and ``sha256``.
+    """
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps({"cmd": "preview", "auto_dir": auto_dir}).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as reader:
+            for line in reader:
+                event = json.loads(line)
+                if "jpeg_bytes" not in event:
+                    raise RuntimeError(f"capture daemon: {event.get('error')}")
+                yield event, reader.read(event["jpeg_bytes"])
+
+
+def serve(source: FrameSource, socket_path: str = CAMERA_SOCKET, burst: int = BURST_FRAMES) -> None:
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    source.start()
+    server = CaptureServer(socket_path, source, burst)
+    logger.info("Capture daemon (%s) listening on %s", source.name, socket_path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        source.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Keep the camera open and serve captures over a Unix socket.")
+    parser.add_argument("--source", choices=("picamera2", "fake"), default="picamera2")
+    parser.add_argument("--fake-dir", help="images replayed by the fake source")
+    parser.add_argument("--socket", default=CAMERA_SOCKET)
+    parser.add_argument("--resolution", default=DEFAULT_RESOLUTION)
+    parser.add_argument("--burst", type=int, default=BURST_FRAMES, help="frames per capture; the sharpest is kept")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    serve(create_source(args.source, args.resolution, args.fake_dir), args.socket, args.burst)
@@ -0,0 +1,186 @@
+"""Background OCR workers.
+
+The web routes only store the image and enqueue a row in the ``jobs`` table;
+a pool of worker processes started by ``ocr_worker.py`` claims queued jobs,
+runs the OCR pipeline and fills in the pending receipt. Because the queue
+lives in SQLite, jobs survive restarts of both the web app and the pool.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from .models import (
+    claim_job,
+    complete_cached_ocr,
+    enqueue_job,
+    finish_job,
+    get_receipt,
+    init_db,
+    requeue_jobs,
+    schedule_csv_export,
+    timestamp_now,
+    update_receipt,
+)
+from .capture_service import fetch_frame
+from .ocr import PIPELINE_VERSION, ReceiptParser, ocr_full_text, process_image
+
+POLL_INTERVAL = 1.0
+SUPERVISE_INTERVAL = 2.0
+CACHED_FIELDS = ("date", "vendor", "total_amount", "tax_amount", "currency", "raw_text")
+PARSED_FIELDS = ("date", "vendor", "total_amount", "tax_amount", "currency")
+
+_parser = ReceiptParser()
+
+logger = logging.getLogger(__name__)
+
+
+def pending_record(receipt_id: str, image_path: str) -> Dict[str, object]:
+    """Placeholder receipt row shown while its OCR job is queued or running."""
+
+    now = timestamp_now()
+    return {
+        "id": receipt_id,
+        "date": datetime.now().date().isoformat(),
+        "vendor": "Unknown",
+        "total_amount": 0.0,
+        "tax_amount": 0.0,
+        "currency": "USD",
+        "payment_method": "Unknown",
+        "category": "Uncategorized",
+        "notes": "",
+        "image_path": image_path,
+        "raw_text": "",
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def parsed_updates(parsed: Dict[str, Optional[str]]) -> Dict[str, object]:
+    return {
+        "date": parsed.get("date") or datetime.now().date().isoformat(),
+        "vendor": parsed.get("vendor") or "Unknown",
+        "total_amount": parsed.get("total_amount") or 0.0,
+        "tax_amount": parsed.get("tax_amount") or 0.0,
+        "currency": parsed.get("currency") or "USD",
+        "raw_text": parsed.get("raw_text") or "",
+        "updated_at": timestamp_now(),
+    }
+
+
+def run_job(db_path: str, csv_path: str, job) -> None:
+    if job["kind"] == "fulltext":
+        run_fulltext_job(db_path, csv_path, job)
+        return
+    # Fresh camera captures are still in the daemon's memory; OCR those
+    # pixels rather than decoding the JPEG it may still be writing.
+    frame = fetch_frame(job["image_path"])
+    parsed = process_image(frame if frame is not None else job["image_path"])
+    updates = parsed_updates(parsed)
+    result = {k: v for k, v in updates.items() if k != "updated_at"}
+    update_receipt(db_path, job["receipt_id"], updates)
+    if parsed.get("raw_text_partial"):
+        # Layout mode only read the header and totals; fetch the full text
+        # once the queue has no receipts waiting for their fields.
+        enqueue_job(db_path, job["receipt_id"], job["image_path"], kind="fulltext")
+    else:
+        complete_cached_ocr(db_path, job["receipt_id"], PIPELINE_VERSION, result)
+    schedule_csv_export(db_path, csv_path)
+
+
+def run_fulltext_job(db_path: str, csv_path: str, job) -> None:
+    """Store the full-page text of a layout-mode receipt and fill in what its regions lacked.
+
+    A field the header and totals did not yield is taken from the full page,
+    unless it was edited since: it must still hold the placeholder that
+    ``parsed_updates`` wrote for it.
+    """
+
+    raw_text = ocr_full_text(job["image_path"])
+    receipt = get_receipt(db_path, job["receipt_id"], with_artifacts=True)
+    if receipt is None:
+        return
+    placeholders = parsed_updates(_parser.parse(receipt["raw_text"] or ""))
+    # A vendor that is only the first line read is no better than a miss.
+    partial = _parser.parse(receipt["raw_text"] or "", fallback_vendor=False)
+    full = _parser.parse(raw_text)
+    updates: Dict[str, object] = {"raw_text": raw_text}
+    for field in PARSED_FIELDS:
+        if partial[field] is None and full[field] is not None and receipt[field] == placeholders[field]:
+            updates[field] = full[field]
+    # update_receipt() consumes the dict it is given.
+    update_receipt(db_path, job["receipt_id"], dict(updates))
+    result = {key: updates.get(key, receipt[key]) for key in CACHED_FIELDS}
+    complete_cached_ocr(db_path, job["receipt_id"], PIPELINE_VERSION, result)
+    schedule_csv_export(db_path, csv_path)
+
+
+def worker_loop(db_path: str, csv_path: str, poll_interval: float = POLL_INTERVAL) -> None:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    worker = worker_id(os.getpid())
+    while not stopping:
+        job = claim_job(db_path, worker)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        try:
+            run_job(db_path, csv_path, job)
+        except Exception as exc:
+            logger.exception("OCR job %s failed", job["id"])
+            finish_job(db_path, job["id"], "failed", str(exc))
+        else:
+            finish_job(db_path, job["id"], "done")
+
+
+def worker_id(pid: int) -> str:
+    return f"{socket.gethostname()}:{pid}"
+
+
+def run_pool(
+    db_path: str = "receipts.db",
+    csv_path: str = "receipts.csv",
+    workers: Optional[int] = None,
+) -> None:
+    """Run ``workers`` OCR processes until SIGTERM/SIGINT.
+
+    Jobs left ``running`` by a previous pool (crash, power loss) are put back
+    on the queue at startup, and a worker that dies mid-job is replaced and
+    its job requeued.
+    """
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    init_db(db_path)
+    requeued = requeue_jobs(db_path)
+    if requeued:
+        logger.info("Requeued %d interrupted job(s)", requeued)
+
+    workers = workers or os.cpu_count() or 1
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+
+    def spawn() -> multiprocessing.Process:
+        proc = multiprocessing.Process(target=worker_loop, args=(db_path, csv_path), daemon=True)
+        proc.start()
+        return proc
+
+    procs = [spawn() for _ in range(workers)]
+    logger.info("Started %d OCR worker(s)", workers)
+    while not stopping:
+        time.sleep(SUPERVISE_INTERVAL)
+        for i, proc in enumerate(procs):
+            if not proc.is_alive() and not stopping:
+                logger.warning("OCR worker %s exited (%s); restarting", proc.pid, proc.exitcode)
+                requeue_jobs(db_path, worker_id(proc.pid))
+                procs[i] = spawn()
+
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        proc.join()
@@ -1,33 +1,71 @@
+import csv
+import io
+import itertools
+import json
 import os
 import uuid
+import zlib
 from datetime import datetime
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
 
 from flask import (
     Blueprint,
+    Response,
+    abort,
     current_app,
     flash,
+    jsonify,
     redirect,
     render_template,
     request,
     send_file,
+    stream_with_context,
     url_for,
 )
+from markupsafe import Markup, escape
 
 from .camera import capture_receipt
+from .capture_service import discard_capture, preview_stream, send_request
 from .models import (
+    RECEIPT_FIELDS,
+    SNIPPET_END,
+    SNIPPET_START,
+    auto_captures,
+    camera_queue_status,
     delete_receipt,
-    export_to_csv,
+    enqueue_job,
+    get_job,
+    get_cached_ocr,
+    get_job_for_receipt,
     get_receipt,
+    has_pending_job,
     insert_receipt,
+    iter_receipts,
+    link_cached_ocr,
     list_receipts,
+    record_auto_capture,
+    reserve_cached_ocr,
+    schedule_csv_export,
     stats,
     timestamp_now,
     update_receipt,
 )
-from .ocr import process_image
+from .jobs import pending_record
+from .metrics import render_metrics
+from .ocr import PIPELINE_VERSION
+from .storage import save_stream
 
 bp = Blueprint("main", __name__)
 
+API_MAX_PER_PAGE = 200
+
+
+@bp.app_template_filter("highlight")
+def highlight(snippet: str) -> Markup:
+    """Escape a search snippet and mark up the matched terms."""
+
+    return Markup(str(escape(snippet)).replace(SNIPPET_START, "<mark>").replace(SNIPPET_END, "</mark>"))
+
 
 @bp.route("/")
 def index():
@@ -37,39 +75,70 @@ def index():
 
 @bp.route("/receipts")
 def receipt_list():
-    page = int(request.args.get("page", 1))
     search = request.args.get("search")
     category = request.args.get("category")
-    rows, total = list_receipts(
-        current_app.config["DATABASE_PATH"], search=search, category=category, page=page
-    )
-    per_page = 10
+    try:
+        page = list_receipts(
+            current_app.config["DATABASE_PATH"],
+            search=search,
+            category=category,
+            cursor=request.args.get("cursor"),
+            # Browsing totals come from the rollups; counting every match of
+            # a search on each page is not worth it.
+            with_total=not search,
+        )
+    except ValueError:
+        abort(400)
     return render_template(
         "receipts.html",
-        receipts=rows,
-        total=total,
-        page=page,
-        per_page=per_page,
+        receipts=page["receipts"],
+        total=page["total"],
+        pages={name: page[name] for name in ("prev", "next", "last")},
         search=search,
         category=category,
     )
 
 
+@bp.route("/api/receipts")
+def receipt_list_api():
+    """Receipts as JSON for clients that scroll: follow ``next`` until it is null.
+
+    The total is only counted when asked for with ``total=1``, so fetching
+    a page costs the same at any depth.
+    """
+
+    try:
+        per_page = min(max(int(request.args.get("per_page", 50)), 1), API_MAX_PER_PAGE)
+        page = list_receipts(
+            current_app.config["DATABASE_PATH"],
+            search=request.args.get("search"),
+            category=request.args.get("category"),
+            cursor=request.args.get("cursor"),
+            per_page=per_page,
+            with_total=request.args.get("total") == "1",
+        )
+    except ValueError:
+        return jsonify({"error": "invalid cursor or per_page"}), 400
+    page["receipts"] = [dict(row) for row in page["receipts"]]
+    return jsonify(page)
+
+
 @bp.route("/receipts/<receipt_id>", methods=["GET", "POST"])
 def receipt_detail(receipt_id):
     if request.method == "POST":
         updates = {k: request.form.get(k) for k in request.form.keys()}
         updates["updated_at"] = timestamp_now()
         update_receipt(current_app.config["DATABASE_PATH"], receipt_id, updates)
-        export_to_csv(current_app.config["DATABASE_PATH"], current_app.config["CSV_PATH"])
+        schedule_csv_export(current_app.config["DATABASE_PATH"], current_app.config["CSV_PATH"])
         flash("Receipt updated.", "success")
         return redirect(url_for("main.receipt_detail", receipt_id=receipt_id))
 
-    receipt = get_receipt(current_app.config["DATABASE_PATH"], receipt_id)
+    receipt = get_receipt(current_app.config["DATABASE_PATH"], receipt_id, with_artifacts=True)
     if not receipt:
         flash("Receipt not found", "danger")
         return redirect(url_for("main.receipt_list"))
-    return render_template("receipt_detail.html", receipt=receipt)
+    job = get_job_for_receipt(current_app.config["DATABASE_PATH"], receipt_id)
+    return render_template("receipt_detail.html", receipt=receipt, job=job)
 
 
 @bp.route("/scan", methods=["GET", "POST"])
@@ -79,33 +148,83 @@ def scan():
         os.makedirs(image_dir, exist_ok=True)
         filename = f"{uuid.uuid4()}.jpg"
         image_path = os.path.join(image_dir, filename)
-        capture_receipt(image_path)
-
-        parsed = process_image(image_path)
-        receipt_id = parsed.get("id") or str(uuid.uuid4())
-        now = timestamp_now()
-        record = {
-            "id": receipt_id,
-            "date": parsed.get("date") or datetime.now().date().isoformat(),
-            "vendor": parsed.get("vendor") or "Unknown",
-            "total_amount": parsed.get("total_amount") or 0.0,
-            "tax_amount": parsed.get("tax_amount") or 0.0,
-            "currency": parsed.get("currency") or "USD",
-            "payment_method": parsed.get("payment_method") or "Unknown",
-            "category": parsed.get("category") or "Uncategorized",
-            "notes": parsed.get("notes") or "",
-            "image_path": os.path.relpath(image_path, start="."),
-            "raw_text": parsed.get("raw_text") or "",
-            "created_at": now,
-            "updated_at": now,
-        }
-        insert_receipt(current_app.config["DATABASE_PATH"], record)
-        export_to_csv(current_app.config["DATABASE_PATH"], current_app.config["CSV_PATH"])
-        flash("Receipt captured and processed.", "success")
+        try:
+            digest = capture_receipt(
+                image_path,
+                queue_db=current_app.config["DATABASE_PATH"],
+                client=request.form.get("client"),
+            )
+        except (OSError, RuntimeError) as exc:
+            flash(f"Capture failed: {exc}", "danger")
+            return redirect(url_for("main.scan"))
+
+        receipt_id, _ = _ingest_image(image_path, digest, "captured", discard=_discard_capture)
         return redirect(url_for("main.receipt_detail", receipt_id=receipt_id))
     return render_template("scan.html")
 
 
+@bp.route("/scan/preview")
+def scan_preview():
+    """MJPEG live preview; with ``?auto=1`` steady receipts are captured and ingested.
+
+    Auto-captures are reported through ``/scan/status`` for the ``?client=``
+    the page passes, since flashed messages cannot reach a streamed response.
+    """
+
+    db_path = current_app.config["DATABASE_PATH"]
+    client = request.args.get("client")
+    image_dir = current_app.config["IMAGE_DIR"]
+    os.makedirs(image_dir, exist_ok=True)
+    auto = request.args.get("auto") == "1"
+    stream = preview_stream(os.path.abspath(image_dir) if auto else None)
+    try:
+        first = next(stream)
+    except (OSError, RuntimeError, StopIteration):
+        return jsonify({"error": "camera daemon not running"}), 503
+
+    def frames():
+        for event, jpeg in itertools.chain([first], stream):
+            if event.get("captured"):
+                image_path = os.path.join(image_dir, os.path.basename(event["captured"]))
+                receipt_id, existing = _ingest_image(
+                    image_path, event["sha256"], "captured", notify=False, discard=_discard_capture
+                )
+                record_auto_capture(db_path, client, receipt_id, existing)
+            yield b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + jpeg + b"\r\n"
+
+    return Response(stream_with_context(frames()), mimetype="multipart/x-mixed-replace; boundary=frame")
+
+
+@bp.route("/scan/queue")
+def scan_queue():
+    """Camera queue length and, for ``?client=``, that browser's place in it."""
+
+    return jsonify(camera_queue_status(current_app.config["DATABASE_PATH"], request.args.get("client")))
+
+
+@bp.route("/scan/status")
+def scan_status():
+    """The camera daemon's status, plus ``?client=``'s auto-captures after ``?after=`` (a capture id)."""
+
+    try:
+        status, _ = send_request({"cmd": "status"}, timeout=2)
+    except (OSError, RuntimeError):
+        return jsonify({"error": "camera daemon not running"}), 503
+    client = request.args.get("client")
+    if client:
+        captures = auto_captures(current_app.config["DATABASE_PATH"], client, request.args.get("after", 0, type=int))
+        status["captures"] = [
+            {
+                "id": row["id"],
+                "receipt_id": row["receipt_id"],
+                "existing": bool(row["existing"]),
+                "url": url_for("main.receipt_detail", receipt_id=row["receipt_id"]),
+            }
+            for row in captures
+        ]
+    return jsonify(status)
+
+
 @bp.route("/upload", methods=["GET", "POST"])
 def upload():
     if request.method == "POST":
@@ -117,36 +236,161 @@ def upload():
         os.makedirs(image_dir, exist_ok=True)
         filename = f"{uuid.uuid4()}_{file.filename}"
         path = os.path.join(image_dir, filename)
-        file.save(path)
-        parsed = process_image(path)
-        receipt_id = parsed.get("id") or str(uuid.uuid4())
-        now = timestamp_now()
-        record = {
-            "id": receipt_id,
-            "date": parsed.get("date") or datetime.now().date().isoformat(),
-            "vendor": parsed.get("vendor") or "Unknown",
-            "total_amount": parsed.get("total_amount") or 0.0,
-            "tax_amount": parsed.get("tax_amount") or 0.0,
-            "currency": parsed.get("currency") or "USD",
-            "payment_method": parsed.get("payment_method") or "Unknown",
-            "category": parsed.get("category") or "Uncategorized",
-            "notes": parsed.get("notes") or "",
-            "image_path": os.path.relpath(path, start="."),
-            "raw_text": parsed.get("raw_text") or "",
-            "created_at": now,
-            "updated_at": now,
-        }
-        insert_receipt(current_app.config["DATABASE_PATH"], record)
-        export_to_csv(current_app.config["DATABASE_PATH"], current_app.config["CSV_PATH"])
-        flash("Receipt uploaded and processed.", "success")
+        digest = save_stream(file.stream, path)
+
+        receipt_id, _ = _ingest_image(path, digest, "uploaded")
         return redirect(url_for("main.receipt_detail", receipt_id=receipt_id))
     return render_template("upload.html")
 
 
-@bp.route("/export/csv")
-def download_csv():
-    export_to_csv(current_app.config["DATABASE_PATH"], current_app.config["CSV_PATH"])
-    return send_file(current_app.config["CSV_PATH"], as_attachment=True)
+def _remove_image(image_path: str) -> None:
+    if os.path.exists(image_path):
+        os.remove(image_path)
+
+
+def _discard_capture(image_path: str) -> None:
+    """Delete a duplicate capture without racing the daemon's background JPEG write."""
+
+    try:
+        discard_capture(image_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        # No daemon: libcamera-still wrote the file before capture_receipt returned.
+        _remove_image(image_path)
+    except (OSError, RuntimeError):
+        current_app.logger.warning("Could not discard duplicate capture %s", image_path, exc_info=True)
+
+
+def _ingest_image(
+    image_path: str, digest: str, verb: str, notify: bool = True, discard: Callable[[str], None] = _remove_image
+) -> Tuple[str, bool]:
+    """Create the receipt for a stored image; return its id and whether it already existed.
+
+    Images seen before are answered from the OCR cache (or linked to the
+    receipt already made from them) instead of being OCR'd again, and the
+    new copy is passed to ``discard``. Uploads are complete on disk and just
+    removed; captures go through ``_discard_capture``. The outcome is flashed
+    unless ``notify`` is false, as for a streamed response, which has no
+    later page to show it on.
+    """
+
+    db_path = current_app.config["DATABASE_PATH"]
+    cached = get_cached_ocr(db_path, digest, PIPELINE_VERSION)
+    if cached and cached["receipt_id"] and current_app.config["DEDUP_LINK_EXISTING"]:
+        # Without a result the receipt is only worth linking to while its OCR
+        # is still on the way; otherwise this upload gets a job of its own.
+        in_progress = cached["result"] or has_pending_job(db_path, cached["receipt_id"])
+        if in_progress and get_receipt(db_path, cached["receipt_id"]):
+            discard(image_path)
+            if notify:
+                flash("This receipt was already scanned; showing the existing one.", "info")
+            return cached["receipt_id"], True
+
+    receipt_id = str(uuid.uuid4())
+    rel_path = os.path.relpath(image_path, start=".")
+    record = pending_record(receipt_id, rel_path)
+    if cached and cached["result"]:
+        record.update(json.loads(cached["result"]))
+        insert_receipt(db_path, record)
+        # The receipt the entry pointed at is gone (or copies are wanted);
+        # later uploads of the image link to this one instead.
+        link_cached_ocr(db_path, digest, PIPELINE_VERSION, receipt_id)
+        message = f"Receipt {verb} and processed."
+    else:
+        insert_receipt(db_path, record)
+        reserve_cached_ocr(db_path, digest, PIPELINE_VERSION, receipt_id)
+        enqueue_job(db_path, receipt_id, rel_path)
+        message = f"Receipt {verb}. OCR is running in the background."
+    if notify:
+        flash(message, "success")
+    schedule_csv_export(db_path, current_app.config["CSV_PATH"])
+    return receipt_id, False
+
+
+@bp.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = get_job(current_app.config["DATABASE_PATH"], job_id)
+    if not job:
+        return jsonify({"error": "not found"}), 404
+    return jsonify(
+        {
+            "id": job["id"],
+            "receipt_id": job["receipt_id"],
+            "status": job["status"],
+            "attempts": job["attempts"],
+            "error": job["error"],
+            "updated_at": job["updated_at"],
+        }
+    )
+
+
+@bp.route("/metrics")
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+def _csv_chunks(chunks: Iterable[List[Any]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(RECEIPT_FIELDS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _ndjson_chunks(chunks: Iterable[List[Any]]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(json.dumps(dict(row)) + "\n" for row in rows).encode("utf-8")
+
+
+def _gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)  # 16 + 15: gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# format: (mimetype, encoder of iter_receipts chunks)
+EXPORT_FORMATS = {"csv": ("text/csv", _csv_chunks), "ndjson": ("application/x-ndjson", _ndjson_chunks)}
+
+
+@bp.route("/export/<fmt>")
+def download(fmt):
+    """Stream receipts as ``receipts.csv`` or ``receipts.ndjson``, straight from the database.
+
+    ``from``/``to`` (YYYY-MM-DD, inclusive), ``category`` and ``vendor``
+    narrow the download; ``gzip=1`` compresses it on the fly. Rows go out as
+    they are read, a chunk at a time, so nothing is written to disk and
+    memory does not grow with the number of receipts.
+    """
+
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    filters = {
+        "date_from": request.args.get("from"),
+        "date_to": request.args.get("to"),
+        "category": request.args.get("category"),
+        "vendor": request.args.get("vendor"),
+    }
+    for key in ("date_from", "date_to"):
+        if filters[key]:
+            try:
+                datetime.strptime(filters[key], "%Y-%m-%d")
+            except ValueError:
+                abort(400)
+    mimetype, encode = EXPORT_FORMATS[fmt]
+    body = encode(iter_receipts(current_app.config["DATABASE_PATH"], **filters))
+    filename = f"receipts.{fmt}"
+    if request.args.get("gzip") == "1":
+        body = _gzip_chunks(body)
+        mimetype = "application/gzip"
+        filename += ".gz"
+    return Response(body, mimetype=mimetype, headers={"Content-Disposition": f"attachment; filename={filename}"})
 
 
 @bp.route("/receipts/<receipt_id>/delete", methods=["POST"])
@@ -156,7 +400,7 @@ def remove_receipt(receipt_id):
         flash("Receipt not found", "danger")
         return redirect(url_for("main.receipt_list"))
     delete_receipt(current_app.config["DATABASE_PATH"], receipt_id)
-    export_to_csv(current_app.config["DATABASE_PATH"], current_app.config["CSV_PATH"])
+    schedule_csv_export(current_app.config["DATABASE_PATH"], current_app.config["CSV_PATH"])
     if receipt.get("image_path"):
         img_path = receipt["image_path"]
         if os.path.exists(img_path):
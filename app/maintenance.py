@@ -0,0 +1,111 @@
+"""Database maintenance: consistency checks, rebuilds and bulk import.
+
+Triggers keep the dashboard rollups in step with ``receipts``, the app
+keeps the full-text search index in step as it writes receipts, and
+``receipts.csv`` is appended to as receipts arrive. ``check`` recomputes
+the rollups and verifies the search index against the table; ``rebuild``
+recreates all three from scratch. Run it after restoring a backup, editing
+the database by hand (e.g. in the ``sqlite3`` shell) or running ``VACUUM``::
+
+    python3 db_maintenance.py check
+    python3 db_maintenance.py rebuild
+
+``import`` loads a CSV of receipts (such as a ``receipts.csv`` from another
+install) in streamed, validated batches, printing progress as it goes; rows
+it cannot import are listed and saved to ``<file>.rejected.csv``::
+
+    python3 db_maintenance.py import old-receipts.csv
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from .models import (
+    IMPORT_BATCH_SIZE,
+    check_rollups,
+    export_to_csv,
+    import_from_csv,
+    init_db,
+    rebuild_rollups,
+    rebuild_search_index,
+    search_index_ok,
+)
+
+
+def check(db_path: str) -> int:
+    """Print every inconsistency found and return how many there were."""
+
+    problems = 0
+    for kind, key, stored, expected in check_rollups(db_path):
+        print(f"rollup {kind} {key!r}: stored {stored}, expected {expected} (receipts, spent_cents, tax_cents)")
+        problems += 1
+    if not search_index_ok(db_path):
+        print("search index does not match receipts")
+        problems += 1
+    return problems
+
+
+def rebuild(db_path: str, csv_path: str) -> None:
+    rebuild_rollups(db_path)
+    rebuild_search_index(db_path)
+    export_to_csv(db_path, csv_path, rewrite=True)
+
+
+def import_csv(db_path: str, csv_path: str, source: str, batch_size: int) -> int:
+    """Import ``source`` with a progress line per batch; return the number of rows skipped.
+
+    Skipped rows are saved to ``<source>.rejected.csv`` for fixing and importing again.
+    """
+
+    start = time.perf_counter()
+
+    def progress(report: Dict[str, Any]) -> None:
+        elapsed = time.perf_counter() - start
+        done = report["bytes_read"] / report["bytes_total"] if report["bytes_total"] else 1.0
+        print(
+            f"\r{done:6.1%}  {report['imported']} imported, {report['skipped']} skipped, "
+            f"{report['rows'] / elapsed:,.0f} rows/s",
+            end="",
+            flush=True,
+        )
+
+    rejected_path = os.path.splitext(source)[0] + ".rejected.csv"
+    report = import_from_csv(db_path, source, batch_size, progress, rejected_path)
+    print()
+    for error in report["errors"]:
+        print(f"  skipped {error}")
+    if report["skipped"] > len(report["errors"]):
+        print(f"  ... and {report['skipped'] - len(report['errors'])} more")
+    if report["skipped"]:
+        print(f"  skipped rows saved to {rejected_path}")
+    export_to_csv(db_path, csv_path)
+    return report["skipped"]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Check or rebuild derived data, or import receipts from a CSV.")
+    parser.add_argument("command", choices=("check", "rebuild", "import"))
+    parser.add_argument("source", nargs="?", help="CSV file for import")
+    parser.add_argument("--db", default="receipts.db")
+    parser.add_argument("--csv", default="receipts.csv")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="rows per transaction for import")
+    args = parser.parse_args(argv)
+    if (args.command == "import") != (args.source is not None):
+        parser.error("a CSV file is needed for import, and only for import")
+
+    init_db(args.db)
+    if args.command == "import":
+        if import_csv(args.db, args.csv, args.source, args.batch_size):
+            sys.exit(1)
+        return
+    if args.command == "rebuild":
+        rebuild(args.db, args.csv)
+        print("Rebuilt rollups, search index and CSV export.")
+        return
+    problems = check(args.db)
+    if problems:
+        print(f"{problems} problem(s) found; run 'rebuild' to fix them.")
+        sys.exit(1)
+    print("Rollups and search index are consistent.")
@@ -0,0 +1,212 @@
+"""Per-stage latency histograms shared across processes.
+
+Pipeline stages are wrapped in ``timed(stage)``; each observation is a
+couple of ``perf_counter`` calls and a bucket increment in memory. Every
+process (gunicorn workers, OCR workers, batch ingestion) writes its totals to
+``METRICS_DIR/<pid>-<random id>.json`` at most once per ``FLUSH_INTERVAL``
+seconds, and ``render_metrics`` sums those files into Prometheus text format
+for the ``/metrics`` route. The random id keeps a new process that reuses a
+pid from overwriting the counts of an old one. When ``collect`` finds files
+of exited processes, it folds them into ``ARCHIVE_FILE`` and deletes them,
+like prometheus_client's ``mark_process_dead``. The totals therefore stay
+monotonic without the files piling up. Nothing is read or aggregated unless
+someone scrapes.
+"""
+import atexit
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+METRICS_ENABLED = os.environ.get("RECEIPT_METRICS", "1") != "0"
+METRICS_DIR = os.environ.get("RECEIPT_METRICS_DIR", os.path.join(tempfile.gettempdir(), "receipt-scanner-metrics"))
+FLUSH_INTERVAL = 10.0
+METRIC_NAME = "receipt_stage_duration_seconds"
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Totals of the processes that have exited, in METRICS_DIR.
+ARCHIVE_FILE = "exited.json"
+
+_lock = threading.Lock()
+_histograms: Dict[str, Dict[str, object]] = {}
+_state = {"pid": None, "flushed_at": 0.0, "name": None}
+_recordings: List[Dict[str, List[float]]] = []
+
+
+def observe(stage: str, seconds: float) -> None:
+    if _recordings:
+        with _lock:
+            for samples in _recordings:
+                samples.setdefault(stage, []).append(seconds)
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        if _state["pid"] != os.getpid():
+            # A forked child starts from zero; the parent's counts are its own.
+            _histograms.clear()
+            _state["pid"] = os.getpid()
+            _state["name"] = f"{os.getpid()}-{uuid.uuid4().hex[:12]}.json"
+            _state["flushed_at"] = time.monotonic()
+        hist = _histograms.get(stage)
+        if hist is None:
+            hist = _histograms[stage] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist["buckets"][i] += 1
+                break
+        hist["sum"] += seconds
+        hist["count"] += 1
+        due = time.monotonic() - _state["flushed_at"] >= FLUSH_INTERVAL
+    if due:
+        flush()
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def recording() -> Iterator[Dict[str, List[float]]]:
+    """Also keep every observation made in the block, as ``{stage: [seconds, ...]}``.
+
+    For benchmarks, which need per-call timings rather than histograms; it
+    works with ``METRICS_ENABLED`` off.
+    """
+
+    samples: Dict[str, List[float]] = {}
+    with _lock:
+        _recordings.append(samples)
+    try:
+        yield samples
+    finally:
+        with _lock:
+            _recordings.remove(samples)
+
+
+def flush() -> None:
+    """Write this process's histograms to its file in ``METRICS_DIR``."""
+
+    with _lock:
+        if not _histograms or _state["pid"] != os.getpid():
+            return
+        snapshot = json.dumps(_histograms)
+        name = _state["name"]
+        _state["flushed_at"] = time.monotonic()
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _write(os.path.join(METRICS_DIR, name), snapshot)
+    except OSError:
+        pass  # metrics must never break a scan
+
+
+def _write(path: str, data: str) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _read(path: str) -> Optional[Dict[str, Dict[str, object]]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _add(totals: Dict[str, Dict[str, object]], data: Dict[str, Dict[str, object]]) -> None:
+    for stage, hist in data.items():
+        total = totals.setdefault(stage, {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0})
+        total["buckets"] = [a + b for a, b in zip(total["buckets"], hist["buckets"])]
+        total["sum"] += hist["sum"]
+        total["count"] += hist["count"]
+
+
+def _exited(name: str) -> bool:
+    """Whether ``name`` is a process's file (or its temp file) and that process is gone."""
+
+    pid = name.split("-", 1)[0]
+    if not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass  # alive, but run by another user
+    return False
+
+
+def _archive_exited(names: List[str]) -> None:
+    """Fold the files of exited processes into ``ARCHIVE_FILE`` and delete them."""
+
+    exited = [name for name in names if _exited(name)]
+    if not exited:
+        return
+    # Concurrent scrapes must not both add the same file to the archive.
+    with open(os.path.join(METRICS_DIR, ".archive.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(METRICS_DIR, ARCHIVE_FILE)
+        archive = _read(archive_path) or {}
+        for name in exited:
+            data = _read(os.path.join(METRICS_DIR, name)) if name.endswith(".json") else None
+            if data:
+                _add(archive, data)
+        _write(archive_path, json.dumps(archive))
+        for name in exited:
+            try:
+                os.remove(os.path.join(METRICS_DIR, name))
+            except FileNotFoundError:
+                pass  # another scrape archived it first
+
+
+def collect() -> Dict[str, Dict[str, object]]:
+    """Sum the histograms of all processes that have flushed so far, exited ones included."""
+
+    totals: Dict[str, Dict[str, object]] = {}
+    try:
+        names = os.listdir(METRICS_DIR)
+    except FileNotFoundError:
+        return totals
+    try:
+        _archive_exited(names)
+    except OSError:
+        pass  # tried again on the next scrape
+    else:
+        names = os.listdir(METRICS_DIR)
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        data = _read(os.path.join(METRICS_DIR, name))
+        if data:
+            _add(totals, data)
+    return totals
+
+
+def render_metrics() -> str:
+    flush()
+    lines: List[str] = [
+        f"# HELP {METRIC_NAME} Time spent in each receipt pipeline stage.",
+        f"# TYPE {METRIC_NAME} histogram",
+    ]
+    for stage, hist in sorted(collect().items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS, hist["buckets"]):
+            cumulative += count
+            lines.append(f'{METRIC_NAME}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{METRIC_NAME}_bucket{{stage="{stage}",le="+Inf"}} {hist["count"]}')
+        lines.append(f'{METRIC_NAME}_sum{{stage="{stage}"}} {hist["sum"]:.6f}')
+        lines.append(f'{METRIC_NAME}_count{{stage="{stage}"}} {hist["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+atexit.register(flush)
@@ -1,8 +1,26 @@
+import atexit
+import base64
 import csv
+import fcntl
+import itertools
+import json
+import logging
 import os
+import re
 import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+import uuid
+import zlib
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
 
 RECEIPT_FIELDS = [
     "id",
@@ -20,6 +38,29 @@ RECEIPT_FIELDS = [
     "updated_at",
 ]
 
+# Fields kept out of ``receipts``, compressed in ``receipt_artifacts`` under
+# the field name as ``kind``: they are large and only the detail page and
+# the CSV export read them. RECEIPT_COLUMNS are the rest, the table's columns.
+ARTIFACT_FIELDS = ("raw_text",)
+RECEIPT_COLUMNS = [field for field in RECEIPT_FIELDS if field not in ARTIFACT_FIELDS]
+
+# What the receipt list and its JSON API show.
+LIST_FIELDS = ["id", "date", "vendor", "total_amount", "tax_amount", "currency", "payment_method", "category"]
+
+# Built once, so sqlite3's statement cache keeps them prepared. The named
+# form takes record dicts; the positional one tuples in RECEIPT_COLUMNS order.
+INSERT_RECEIPT_SQL = (
+    f"INSERT OR REPLACE INTO receipts ({', '.join(RECEIPT_COLUMNS)}) "
+    f"VALUES ({', '.join(':' + field for field in RECEIPT_COLUMNS)})"
+)
+INSERT_RECEIPT_ROW_SQL = (
+    f"INSERT OR REPLACE INTO receipts ({', '.join(RECEIPT_COLUMNS)}) VALUES ({', '.join('?' * len(RECEIPT_COLUMNS))})"
+)
+STORE_ARTIFACT_SQL = (
+    "INSERT INTO receipt_artifacts (receipt_id, kind, data) VALUES (?, ?, ?) "
+    "ON CONFLICT (receipt_id, kind) DO UPDATE SET data = excluded.data"
+)
+
 
 SCHEMA_SQL = """
 CREATE TABLE IF NOT EXISTS receipts (
@@ -37,129 +78,1482 @@ CREATE TABLE IF NOT EXISTS receipts (
     created_at TEXT,
     updated_at TEXT
 );
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    receipt_id TEXT NOT NULL,
+    kind TEXT NOT NULL DEFAULT 'ocr',
+    image_path TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    error TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+
+CREATE TABLE IF NOT EXISTS ocr_cache (
+    image_hash TEXT NOT NULL,
+    pipeline_version TEXT NOT NULL,
+    receipt_id TEXT,
+    result TEXT,
+    size INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    last_used_at TEXT,
+    PRIMARY KEY (image_hash, pipeline_version)
+);
+
+CREATE INDEX IF NOT EXISTS idx_ocr_cache_receipt ON ocr_cache (receipt_id);
+CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_used ON ocr_cache (last_used_at);
+
+-- receipts.csv is kept in rowid order so new receipts can be appended.
+-- Changes to rows already written to it bump ``generation``, which makes
+-- the next export rewrite the file instead.
+CREATE TABLE IF NOT EXISTS csv_export_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    generation INTEGER NOT NULL DEFAULT 0,
+    exported_generation INTEGER NOT NULL DEFAULT -1,
+    exported_rowid INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO csv_export_state (id) VALUES (1);
+
+CREATE TRIGGER IF NOT EXISTS receipts_csv_insert AFTER INSERT ON receipts
+WHEN NEW.rowid <= (SELECT exported_rowid FROM csv_export_state WHERE id = 1)
+BEGIN
+    UPDATE csv_export_state SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS receipts_csv_update AFTER UPDATE ON receipts
+WHEN OLD.rowid <= (SELECT exported_rowid FROM csv_export_state WHERE id = 1)
+BEGIN
+    UPDATE csv_export_state SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS receipts_csv_delete AFTER DELETE ON receipts
+WHEN OLD.rowid <= (SELECT exported_rowid FROM csv_export_state WHERE id = 1)
+BEGIN
+    UPDATE csv_export_state SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TABLE IF NOT EXISTS camera_requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    client TEXT,
+    status TEXT NOT NULL DEFAULT 'waiting',
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
 """
 
+# Receipt counts and sums of amounts (in cents, so trigger updates add and
+# subtract exactly) overall, per category and per month, computed from
+# scratch. The triggers keep ``receipt_rollups`` equal to this.
+ROLLUP_SQL = """
+SELECT 'all' AS kind, '' AS key, COUNT(*) AS receipts,
+    COALESCE(SUM(CAST(ROUND(COALESCE(total_amount, 0) * 100) AS INTEGER)), 0) AS spent_cents,
+    COALESCE(SUM(CAST(ROUND(COALESCE(tax_amount, 0) * 100) AS INTEGER)), 0) AS tax_cents
+FROM receipts
+UNION ALL
+SELECT 'category', COALESCE(category, ''), COUNT(*),
+    SUM(CAST(ROUND(COALESCE(total_amount, 0) * 100) AS INTEGER)),
+    SUM(CAST(ROUND(COALESCE(tax_amount, 0) * 100) AS INTEGER))
+FROM receipts GROUP BY 2
+UNION ALL
+SELECT 'month', substr(COALESCE(date, ''), 1, 7), COUNT(*),
+    SUM(CAST(ROUND(COALESCE(total_amount, 0) * 100) AS INTEGER)),
+    SUM(CAST(ROUND(COALESCE(tax_amount, 0) * 100) AS INTEGER))
+FROM receipts GROUP BY 2
+"""
+
+
+# (receipts, spent_cents, tax_cents) of one rollup row.
+Rollup = Tuple[int, int, int]
+
+
+def _rollup_change(row: str, sign: int) -> str:
+    """Trigger statement adding (``sign`` 1) or removing (-1) ``row`` from the rollups."""
+
+    spent = f"{sign} * CAST(ROUND(COALESCE({row}.total_amount, 0) * 100) AS INTEGER)"
+    tax = f"{sign} * CAST(ROUND(COALESCE({row}.tax_amount, 0) * 100) AS INTEGER)"
+    return f"""INSERT INTO receipt_rollups (kind, key, receipts, spent_cents, tax_cents) VALUES
+                ('all', '', {sign}, {spent}, {tax}),
+                ('category', COALESCE({row}.category, ''), {sign}, {spent}, {tax}),
+                ('month', substr(COALESCE({row}.date, ''), 1, 7), {sign}, {spent}, {tax})
+            ON CONFLICT (kind, key) DO UPDATE SET
+                receipts = receipts + excluded.receipts,
+                spent_cents = spent_cents + excluded.spent_cents,
+                tax_cents = tax_cents + excluded.tax_cents;"""
+
+
+_DROP_EMPTY_ROLLUPS = "DELETE FROM receipt_rollups WHERE kind != 'all' AND receipts = 0;"
+
+
+def _artifact_sql(kind: str) -> str:
+    """Scalar subquery for a receipt's decompressed ``kind`` artifact, NULL if it has none.
+
+    For the app's own queries only: ``unpack_text()`` is registered on its
+    connections, and the schema must not call it.
+    """
+
+    return f"(SELECT unpack_text(data) FROM receipt_artifacts WHERE receipt_id = receipts.id AND kind = '{kind}')"
+
+
+# The search index over vendor and OCR text. It is contentless: it stores
+# only the index, and the app adds and removes receipts explicitly (see
+# ``_index_receipts``), so the schema never needs to decompress the text.
+SEARCH_INDEX_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(vendor, raw_text, content='', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+
+_INDEX_SQL = "INSERT INTO receipts_fts (rowid, vendor, raw_text) VALUES (?, ?, ?)"
+_UNINDEX_SQL = "INSERT INTO receipts_fts (receipts_fts, rowid, vendor, raw_text) VALUES ('delete', ?, ?, ?)"
+
+# (rowid, vendor, raw_text) of a receipt, as the search index holds it.
+SearchDocument = Tuple[int, Optional[str], Optional[str]]
+
+# Vendor and stored OCR text of receipts, by rowid, for the search index.
+_SEARCH_DOCUMENTS_SQL = (
+    "SELECT receipts.rowid, receipts.vendor, receipt_artifacts.data FROM receipts "
+    "LEFT JOIN receipt_artifacts ON receipt_artifacts.receipt_id = receipts.id AND receipt_artifacts.kind = 'raw_text'"
+)
+
+# Trigger statement for a change to ``{row}``'s artifacts: make the CSV
+# export rewrite the receipt if it was already written out.
+_ARTIFACT_CSV_CHANGE = (
+    "UPDATE csv_export_state SET generation = generation + 1 "
+    "WHERE id = 1 AND exported_rowid >= (SELECT rowid FROM receipts WHERE id = {row}.receipt_id);"
+)
+
+
+def _move_raw_text(conn: sqlite3.Connection) -> None:
+    """Migration 6: copy the OCR text of every receipt into ``receipt_artifacts``, compressed."""
+
+    rows = conn.execute("SELECT id, raw_text FROM receipts WHERE raw_text != ''")
+    for chunk in iter(lambda: rows.fetchmany(EXPORT_CHUNK_SIZE), []):
+        conn.executemany(STORE_ARTIFACT_SQL, [(receipt_id, "raw_text", pack_text(text)) for receipt_id, text in chunk])
+
+
+def _all_search_documents(conn: sqlite3.Connection) -> Iterator[List[SearchDocument]]:
+    """Every receipt's ``SearchDocument``, in chunks."""
+
+    rows = conn.execute(_SEARCH_DOCUMENTS_SQL)
+    for chunk in iter(lambda: rows.fetchmany(EXPORT_CHUNK_SIZE), []):
+        yield [(rowid, vendor, unpack_text(data)) for rowid, vendor, data in chunk]
+
+
+def _index_all_receipts(conn: sqlite3.Connection) -> None:
+    """Add every receipt to the (empty) search index."""
+
+    for documents in _all_search_documents(conn):
+        conn.executemany(_INDEX_SQL, documents)
+
+
+# Schema changes on top of SCHEMA_SQL, applied in order by ``migrate``.
+# ``PRAGMA user_version`` records how many have run, so only ever append:
+# editing or reordering a released entry would skip it on existing databases.
+# Steps are SQL statements or, where the work needs Python (compression),
+# functions called with the connection.
+MIGRATIONS: Tuple[Tuple[Union[str, Callable[[sqlite3.Connection], None]], ...], ...] = (
+    # 1: indexes for the dashboard (newest first by date, optionally within
+    # one category), the recent receipts on the home page, lookups by vendor
+    # and the job shown on a receipt's detail page.
+    (
+        "CREATE INDEX IF NOT EXISTS idx_receipts_date ON receipts (date)",
+        "CREATE INDEX IF NOT EXISTS idx_receipts_created_at ON receipts (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_receipts_category_date ON receipts (category, date)",
+        "CREATE INDEX IF NOT EXISTS idx_receipts_vendor ON receipts (vendor)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_receipt ON jobs (receipt_id, kind, created_at)",
+    ),
+    # 2: full-text index over vendor and OCR text for the receipt search. It
+    # stores only the index and reads the text back from ``receipts``, so
+    # triggers keep it in step; 'rebuild' backfills existing receipts.
+    # Vendor matches count ten times as much as matches in the body text.
+    (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS receipts_fts USING fts5("
+        "vendor, raw_text, content='receipts', content_rowid='rowid', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        """CREATE TRIGGER IF NOT EXISTS receipts_fts_insert AFTER INSERT ON receipts BEGIN
+            INSERT INTO receipts_fts (rowid, vendor, raw_text) VALUES (NEW.rowid, NEW.vendor, NEW.raw_text);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS receipts_fts_delete AFTER DELETE ON receipts BEGIN
+            INSERT INTO receipts_fts (receipts_fts, rowid, vendor, raw_text)
+            VALUES ('delete', OLD.rowid, OLD.vendor, OLD.raw_text);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS receipts_fts_update AFTER UPDATE OF vendor, raw_text ON receipts BEGIN
+            INSERT INTO receipts_fts (receipts_fts, rowid, vendor, raw_text)
+            VALUES ('delete', OLD.rowid, OLD.vendor, OLD.raw_text);
+            INSERT INTO receipts_fts (rowid, vendor, raw_text) VALUES (NEW.rowid, NEW.vendor, NEW.raw_text);
+        END""",
+        "INSERT INTO receipts_fts (receipts_fts) VALUES ('rebuild')",
+        "INSERT INTO receipts_fts (receipts_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    ),
+    # 3: keyset pagination orders by (date, id), so the date indexes carry
+    # the id as a tie-breaker. Row-value comparisons never match NULL, so
+    # the odd receipt without a date sorts as the oldest instead.
+    (
+        "UPDATE receipts SET date = '' WHERE date IS NULL",
+        "DROP INDEX IF EXISTS idx_receipts_date",
+        "DROP INDEX IF EXISTS idx_receipts_category_date",
+        "CREATE INDEX IF NOT EXISTS idx_receipts_date_id ON receipts (date, id)",
+        "CREATE INDEX IF NOT EXISTS idx_receipts_category_date_id ON receipts (category, date, id)",
+    ),
+    # 4: dashboard rollups kept current by triggers, so the totals are a
+    # primary-key lookup instead of a scan; filled from existing receipts.
+    (
+        """CREATE TABLE IF NOT EXISTS receipt_rollups (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            receipts INTEGER NOT NULL DEFAULT 0,
+            spent_cents INTEGER NOT NULL DEFAULT 0,
+            tax_cents INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID""",
+        f"""CREATE TRIGGER IF NOT EXISTS receipts_rollup_insert AFTER INSERT ON receipts BEGIN
+            {_rollup_change("NEW", 1)}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS receipts_rollup_delete AFTER DELETE ON receipts BEGIN
+            {_rollup_change("OLD", -1)}
+            {_DROP_EMPTY_ROLLUPS}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS receipts_rollup_update
+        AFTER UPDATE OF date, category, total_amount, tax_amount ON receipts BEGIN
+            {_rollup_change("OLD", -1)}
+            {_rollup_change("NEW", 1)}
+            {_DROP_EMPTY_ROLLUPS}
+        END""",
+        "DELETE FROM receipt_rollups",
+        f"INSERT INTO receipt_rollups (kind, key, receipts, spent_cents, tax_cents) {ROLLUP_SQL}",
+    ),
+    # 5: bulk imports index a whole batch for search in one statement, which
+    # is several times faster than the row-by-row trigger. Within a batch's
+    # transaction ``after_rowid`` is set to the highest rowid before it, and
+    # the search triggers leave rows above it alone. It is back to NULL
+    # before the commit, so no other connection ever sees it set.
+    (
+        """CREATE TABLE IF NOT EXISTS bulk_load (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            after_rowid INTEGER
+        )""",
+        "INSERT OR IGNORE INTO bulk_load (id) VALUES (1)",
+        "DROP TRIGGER IF EXISTS receipts_fts_insert",
+        """CREATE TRIGGER receipts_fts_insert AFTER INSERT ON receipts
+        WHEN (SELECT after_rowid FROM bulk_load WHERE id = 1) IS NULL BEGIN
+            INSERT INTO receipts_fts (rowid, vendor, raw_text) VALUES (NEW.rowid, NEW.vendor, NEW.raw_text);
+        END""",
+        "DROP TRIGGER IF EXISTS receipts_fts_delete",
+        """CREATE TRIGGER receipts_fts_delete AFTER DELETE ON receipts
+        WHEN OLD.rowid <= COALESCE((SELECT after_rowid FROM bulk_load WHERE id = 1), OLD.rowid) BEGIN
+            INSERT INTO receipts_fts (receipts_fts, rowid, vendor, raw_text)
+            VALUES ('delete', OLD.rowid, OLD.vendor, OLD.raw_text);
+        END""",
+    ),
+    # 6: OCR text moves out of ``receipts`` into ``receipt_artifacts`` as
+    # zlib-compressed blobs, so reading receipt rows no longer drags it
+    # through the page cache. The search index can no longer read the text
+    # back from ``receipts``, so it becomes contentless and the app keeps it
+    # in step (see ``SEARCH_INDEX_SQL``); batch imports no longer need
+    # ``bulk_load`` for that. Compression happens in Python, so the schema
+    # calls no application functions and any SQLite client can write to
+    # these tables (``db_maintenance.py check`` spots a stale index). Deleting
+    # a receipt drops its artifacts, and changing them bumps the CSV export
+    # like a change to the receipt does. Dropping the column needs SQLite 3.35
+    # (see ``MIGRATION_SQLITE_VERSIONS``).
+    (
+        """CREATE TABLE IF NOT EXISTS receipt_artifacts (
+            receipt_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (receipt_id, kind)
+        )""",
+        _move_raw_text,
+        "DROP TRIGGER IF EXISTS receipts_fts_insert",
+        "DROP TRIGGER IF EXISTS receipts_fts_delete",
+        "DROP TRIGGER IF EXISTS receipts_fts_update",
+        "DROP TABLE IF EXISTS receipts_fts",
+        "DROP TABLE IF EXISTS bulk_load",
+        "ALTER TABLE receipts DROP COLUMN raw_text",
+        """CREATE TRIGGER IF NOT EXISTS receipts_artifacts_delete AFTER DELETE ON receipts BEGIN
+            DELETE FROM receipt_artifacts WHERE receipt_id = OLD.id;
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS receipt_artifacts_csv_insert AFTER INSERT ON receipt_artifacts BEGIN
+            {_ARTIFACT_CSV_CHANGE.format(row="NEW")}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS receipt_artifacts_csv_update AFTER UPDATE OF data ON receipt_artifacts BEGIN
+            {_ARTIFACT_CSV_CHANGE.format(row="NEW")}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS receipt_artifacts_csv_delete AFTER DELETE ON receipt_artifacts BEGIN
+            {_ARTIFACT_CSV_CHANGE.format(row="OLD")}
+        END""",
+        SEARCH_INDEX_SQL.format(table="receipts_fts"),
+        _index_all_receipts,
+        "INSERT INTO receipts_fts (receipts_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    ),
+    # 7: downloads stream receipts in (date, id) order; with the date and id
+    # in the vendor index too, a vendor's receipts come out in that order
+    # without a sort.
+    (
+        "DROP INDEX IF EXISTS idx_receipts_vendor",
+        "CREATE INDEX IF NOT EXISTS idx_receipts_vendor_date_id ON receipts (vendor, date, id)",
+    ),
+    # 8: receipts the live preview captured on its own, so the scan page can
+    # list them; the preview response is a stream of JPEGs and cannot.
+    (
+        """CREATE TABLE IF NOT EXISTS auto_captures (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client TEXT,
+            receipt_id TEXT NOT NULL,
+            existing INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_auto_captures_client ON auto_captures (client, id)",
+    ),
+)
+
+# ``search_snippet`` wraps matched words in these. They cannot occur in OCR
+# text, so the template can escape a snippet and then turn them into <mark>
+# tags.
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+SNIPPET_TOKENS = 12
+
+# How long a process waits at startup for another one that is migrating;
+# building an index over a large table takes longer than ``busy_timeout``.
+MIGRATION_TIMEOUT_MS = 120000
+
+# Oldest SQLite library that can apply a migration, by migration number.
+# 6 uses ALTER TABLE ... DROP COLUMN.
+MIGRATION_SQLITE_VERSIONS = {6: (3, 35, 0)}
+
+# Rows fetched from SQLite at a time by ``iter_receipts``.
+EXPORT_CHUNK_SIZE = 500
+
+# Rows validated and committed per transaction by ``import_from_csv``.
+IMPORT_BATCH_SIZE = 5000
+IMPORT_MAX_ERRORS = 100
+
+# How long the scan page can still fetch an auto-capture.
+AUTO_CAPTURE_RETENTION = 3600.0
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+MAX_JOB_ATTEMPTS = 3
+
+# zlib level for OCR text in ``receipt_artifacts``: 6 compresses receipt text
+# nearly as well as 9 in a fraction of the time.
+TEXT_COMPRESSION_LEVEL = 6
+
+# Writes within this many seconds of each other share one CSV export.
+CSV_EXPORT_DELAY = float(os.environ.get("RECEIPT_CSV_EXPORT_DELAY", "2.0"))
+
+# Drops the OCR cache reservations of receipts whose jobs, selected by the
+# ``jobs`` condition, are about to be marked failed, so the next upload of the
+# image is OCR'd again instead of linking to the failed placeholder.
+RELEASE_CACHED_OCR_SQL = (
+    "DELETE FROM ocr_cache WHERE result IS NULL AND receipt_id IN (SELECT receipt_id FROM jobs WHERE {jobs})"
+)
+
+# Upper bound on the OCR result cache (raw text plus parsed fields), so it
+# stays small on an SD card. Least recently used entries are evicted first.
+OCR_CACHE_MAX_BYTES = int(os.environ.get("RECEIPT_OCR_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+
+# Applied to every pooled connection. WAL lets readers continue while a
+# writer commits; synchronous=NORMAL is still crash-safe in WAL mode and
+# avoids an fsync per commit on the SD card. busy_timeout comes first so the
+# switch to WAL waits for a process that is creating the same new database.
+SQLITE_PRAGMAS = (
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -8000",
+    "PRAGMA mmap_size = 67108864",
+    "PRAGMA temp_store = MEMORY",
+    # So INSERT OR REPLACE fires the delete trigger for the row it replaces.
+    "PRAGMA recursive_triggers = ON",
+)
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+
+
+def pack_text(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), TEXT_COMPRESSION_LEVEL)
+
+
+def unpack_text(data: Optional[bytes]) -> Optional[str]:
+    return None if data is None else zlib.decompress(data).decode("utf-8")
+
 
 def get_connection(db_path: str) -> sqlite3.Connection:
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    """This thread's open connection to ``db_path``, created on first use.
+
+    Connections stay open so SQLite's page cache and the prepared-statement
+    cache survive between calls; callers must not close them. They are kept
+    per thread (sqlite3 connections are not shareable) and per process (a
+    connection must not be used across a fork).
+    """
+
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.pid = os.getpid()
+        _local.connections = {}
+    conn = _local.connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        conn.create_function("unpack_text", 1, unpack_text, deterministic=True)
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        _local.connections[db_path] = conn
     return conn
 
 
+def close_connections() -> None:
+    """Close this thread's pooled connections, e.g. before moving the database file."""
+
+    for conn in getattr(_local, "connections", {}).values():
+        conn.close()
+    _local.connections = {}
+
+
 def init_db(db_path: str) -> None:
     os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
     conn = get_connection(db_path)
-    with conn:
+    # SCHEMA_SQL writes (its INSERT OR IGNORE always does), so it queues for
+    # the write lock behind a process that is migrating, just like migrate().
+    with _migration_timeout(conn), conn:
         conn.executescript(SCHEMA_SQL)
-    conn.close()
+    migrate(conn)
+
+
+@contextmanager
+def _migration_timeout(conn: sqlite3.Connection) -> Iterator[None]:
+    """Raise ``conn``'s busy timeout to ``MIGRATION_TIMEOUT_MS`` for the block."""
+
+    busy_timeout = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+    conn.execute(f"PRAGMA busy_timeout = {MIGRATION_TIMEOUT_MS}")
+    try:
+        yield
+    finally:
+        conn.execute(f"PRAGMA busy_timeout = {busy_timeout}")
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply the ``MIGRATIONS`` this database has not seen and return its version.
+
+    Every gunicorn and OCR worker runs this at startup. The version is read
+    again after taking the write lock, so the first process applies the
+    migrations while the others wait and then find nothing left to do. Each
+    run is one transaction: a failing migration leaves the version unchanged.
+    A ``RuntimeError`` is raised, before anything is applied, if the SQLite
+    library is too old for one of them.
+    """
+
+    target = len(MIGRATIONS)
+    if schema_version(conn) >= target:
+        return schema_version(conn)
+    with _migration_timeout(conn), conn:
+        conn.execute("BEGIN IMMEDIATE")
+        version = schema_version(conn)
+        for number in range(version, target):
+            required = MIGRATION_SQLITE_VERSIONS.get(number + 1, (0,))
+            if sqlite3.sqlite_version_info < required:
+                raise RuntimeError(
+                    f"schema migration {number + 1} needs SQLite {'.'.join(map(str, required))} or later, "
+                    f"but Python is using SQLite {sqlite3.sqlite_version}; upgrade it and restart"
+                )
+        for number in range(version, target):
+            for step in MIGRATIONS[number]:
+                if isinstance(step, str):
+                    conn.execute(step)
+                else:
+                    step(conn)
+            logger.info("Applied schema migration %d", number + 1)
+        if version < target:
+            conn.execute(f"PRAGMA user_version = {target}")
+    return schema_version(conn)
 
 
 def ensure_csv_synced(db_path: str, csv_path: str) -> None:
-    if not os.path.exists(csv_path):
-        export_to_csv(db_path, csv_path)
+    export_to_csv(db_path, csv_path)
 
 
-def export_to_csv(db_path: str, csv_path: str) -> None:
-    conn = get_connection(db_path)
-    rows = conn.execute("SELECT * FROM receipts ORDER BY created_at DESC").fetchall()
-    conn.close()
-    with open(csv_path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=RECEIPT_FIELDS)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(dict(row))
+def _select_fields(fields: List[str]) -> str:
+    """SELECT list for ``fields`` of receipts, reading artifact fields from ``receipt_artifacts``."""
 
+    return ", ".join(
+        f"{_artifact_sql(field)} AS {field}" if field in ARTIFACT_FIELDS else f"receipts.{field}" for field in fields
+    )
 
-def import_from_csv(db_path: str, csv_path: str) -> None:
-    if not os.path.exists(csv_path):
-        return
-    conn = get_connection(db_path)
-    with open(csv_path, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
+
+def _store_artifacts(conn: sqlite3.Connection, artifacts: List[Tuple[str, str, Optional[str]]]) -> None:
+    """Save ``(receipt_id, kind, text)`` artifacts compressed; empty text removes one."""
+
+    stored = [(receipt_id, kind, pack_text(text)) for receipt_id, kind, text in artifacts if text]
+    removed = [(receipt_id, kind) for receipt_id, kind, text in artifacts if not text]
+    if stored:
+        conn.executemany(STORE_ARTIFACT_SQL, stored)
+    if removed:
+        conn.executemany("DELETE FROM receipt_artifacts WHERE receipt_id = ? AND kind = ?", removed)
+
+
+def _search_documents(conn: sqlite3.Connection, receipt_ids: List[str]) -> List[SearchDocument]:
+    """The ``SearchDocument`` of each of ``receipt_ids`` that exists."""
+
+    ids = list(dict.fromkeys(receipt_ids))
+    documents = []
+    for start in range(0, len(ids), EXPORT_CHUNK_SIZE):
+        chunk = ids[start : start + EXPORT_CHUNK_SIZE]
+        rows = conn.execute(f"{_SEARCH_DOCUMENTS_SQL} WHERE receipts.id IN ({', '.join('?' * len(chunk))})", chunk)
+        documents.extend((rowid, vendor, unpack_text(data)) for rowid, vendor, data in rows)
+    return documents
+
+
+def _unindex_receipts(conn: sqlite3.Connection, receipt_ids: List[str]) -> None:
+    """Take receipts out of the search index, before they change or are deleted.
+
+    A contentless index can only drop a row given the values it was indexed
+    with, so they are read from the receipts as they still are.
+    """
+
+    conn.executemany(_UNINDEX_SQL, _search_documents(conn, receipt_ids))
+
+
+def _index_receipts(conn: sqlite3.Connection, receipt_ids: List[str]) -> None:
+    """Add receipts to the search index as they are now, after they changed."""
+
+    conn.executemany(_INDEX_SQL, _search_documents(conn, receipt_ids))
+
+
+def export_to_csv(db_path: str, csv_path: str, rewrite: bool = False) -> None:
+    """Bring ``csv_path`` up to date with the database, doing as little as possible.
+
+    Receipts whose OCR has finished are written in rowid order. New ones are
+    appended; only when a row already in the file changed (see the
+    ``csv_export_state`` triggers) or the file is missing is it rewritten,
+    via a temp file and an atomic rename. Receipts behind one whose OCR job
+    (or layout mode's follow-up ``fulltext`` job) is still pending wait for
+    the next export, so a scan is appended once with its final fields and
+    text. Concurrent exporters serialise on a lock file.
+    ``rewrite`` forces a full rewrite.
+    """
+
+    with timed("csv_export"), open(f"{csv_path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        conn = get_connection(db_path)
+        # Claim the rows to export before reading them: any later change to
+        # them then bumps ``generation`` and triggers a rewrite next time.
         with conn:
-            for row in reader:
-                placeholders = ",".join([":" + key for key in RECEIPT_FIELDS])
-                conn.execute(
-                    f"INSERT OR REPLACE INTO receipts ({','.join(RECEIPT_FIELDS)}) VALUES ({placeholders})",
-                    row,
-                )
-    conn.close()
+            conn.execute("BEGIN IMMEDIATE")
+            state = conn.execute("SELECT * FROM csv_export_state WHERE id = 1").fetchone()
+            pending = conn.execute(
+                "SELECT MIN(r.rowid) FROM jobs AS j JOIN receipts AS r ON r.id = j.receipt_id "
+                "WHERE j.kind IN ('ocr', 'fulltext') AND j.status IN ('queued', 'running')"
+            ).fetchone()[0]
+            last = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM receipts").fetchone()[0]
+            if pending is not None:
+                last = min(last, pending - 1)
+            rewrite = rewrite or state["generation"] != state["exported_generation"] or not os.path.exists(csv_path)
+            first = 0 if rewrite else state["exported_rowid"]
+            if not rewrite and last <= first:
+                return
+            conn.execute(
+                "UPDATE csv_export_state SET exported_generation = ?, exported_rowid = ? WHERE id = 1",
+                (state["generation"], last),
+            )
+        try:
+            rows = conn.execute(
+                f"SELECT {_select_fields(RECEIPT_FIELDS)} FROM receipts "
+                "WHERE rowid > ? AND rowid <= ? ORDER BY rowid",
+                (first, last),
+            )
+            if rewrite:
+                tmp_path = f"{csv_path}.tmp"
+                with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+                    writer = csv.writer(f)
+                    writer.writerow(RECEIPT_FIELDS)
+                    writer.writerows(rows)
+                os.replace(tmp_path, csv_path)
+            else:
+                with open(csv_path, "a", newline="", encoding="utf-8") as f:
+                    csv.writer(f).writerows(rows)
+        except BaseException:
+            with conn:
+                conn.execute("UPDATE csv_export_state SET generation = generation + 1 WHERE id = 1")
+            raise
+
+
+def iter_receipts(
+    db_path: str,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    category: Optional[str] = None,
+    vendor: Optional[str] = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> Iterator[List[sqlite3.Row]]:
+    """Every field of the receipts matching the filters, oldest first, ``chunk_size`` at a time.
+
+    Dates are inclusive YYYY-MM-DD bounds; category and vendor must match
+    exactly. One statement is stepped through with ``fetchmany``, so memory
+    stays flat however many receipts match and they all come from one
+    snapshot. The (date, id) order is that of the date, category and vendor
+    indexes, so no filter needs a sort. Closing the generator early, as when
+    a download is cancelled, ends the statement.
+    """
+
+    clauses = []
+    params: List[Any] = []
+    for clause, value in (
+        ("receipts.date >= ?", date_from),
+        ("receipts.date <= ?", date_to),
+        ("receipts.category = ?", category),
+        ("receipts.vendor = ?", vendor),
+    ):
+        if value:
+            clauses.append(clause)
+            params.append(value)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    cursor = get_connection(db_path).execute(
+        f"SELECT {_select_fields(RECEIPT_FIELDS)} FROM receipts{where} ORDER BY receipts.date, receipts.id", params
+    )
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.close()
+
+
+class _CsvExportScheduler:
+    def __init__(self, db_path: str, csv_path: str, delay: float):
+        self.db_path = db_path
+        self.csv_path = csv_path
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.timer: Optional[threading.Timer] = None
+
+    def request(self) -> None:
+        with self.lock:
+            if self.timer is None:
+                self.timer = threading.Timer(self.delay, self.run)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def run(self) -> None:
+        with self.lock:
+            self.timer = None
+        try:
+            export_to_csv(self.db_path, self.csv_path)
+        except Exception:
+            logger.exception("CSV export of %s failed", self.csv_path)
+
+    def flush(self) -> None:
+        with self.lock:
+            timer, self.timer = self.timer, None
+        if timer is not None:
+            timer.cancel()
+            self.run()
+
+
+_schedulers: Dict[Tuple[int, str, str], _CsvExportScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def schedule_csv_export(db_path: str, csv_path: str, delay: float = CSV_EXPORT_DELAY) -> None:
+    """Export ``csv_path`` in the background within ``delay`` seconds.
+
+    Requests made while one is pending are coalesced, so a burst of edits
+    costs one export and the request that triggered it does not wait.
+    """
+
+    key = (os.getpid(), db_path, csv_path)
+    with _schedulers_lock:
+        scheduler = _schedulers.get(key)
+        if scheduler is None:
+            scheduler = _schedulers[key] = _CsvExportScheduler(db_path, csv_path, delay)
+    scheduler.request()
+
+
+def flush_csv_exports() -> None:
+    """Run this process's pending exports now (registered with ``atexit``)."""
+
+    for (pid, _, _), scheduler in list(_schedulers.items()):
+        if pid == os.getpid():
+            scheduler.flush()
+
+
+atexit.register(flush_csv_exports)
+
+
+def _import_values(row: List[str], columns: List[Optional[int]], now: str) -> Tuple[Tuple[Any, ...], List[Any]]:
+    """Validated values for one CSV row; ``ValueError`` says why not.
+
+    Returns the receipt's values in RECEIPT_COLUMNS order and its artifacts
+    as ``(receipt_id, kind, text)``.
+    """
+
+    values = {
+        field: row[index] if index is not None and index < len(row) else ""
+        for field, index in zip(RECEIPT_FIELDS, columns)
+    }
+    receipt_id = values["id"] = values["id"].strip()
+    if not receipt_id:
+        raise ValueError("missing id")
+    # Kept as written: the app stores dates the parser could not normalise and
+    # whatever was typed into the edit form, and an export must round-trip.
+    values["date"] = values["date"].strip()
+    for field in ("total_amount", "tax_amount"):
+        text = values[field].strip().lstrip("$€£").strip()
+        try:
+            values[field] = float(text) if text else 0.0
+        except ValueError:
+            raise ValueError(f"{field} {values[field]!r} is not a number") from None
+    values["created_at"] = values["created_at"].strip() or now
+    values["updated_at"] = values["updated_at"].strip() or values["created_at"]
+    artifacts = [(receipt_id, field, values[field]) for field in ARTIFACT_FIELDS]
+    return tuple(values[field] for field in RECEIPT_COLUMNS), artifacts
+
+
+def import_from_csv(
+    db_path: str,
+    csv_path: str,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    rejected_path: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Load receipts from a CSV with a header row (e.g. a ``receipts.csv`` export).
+
+    The file is streamed: ``batch_size`` rows at a time are validated and
+    written with one ``executemany`` and one commit, so memory stays flat for
+    files of any size and an interrupted import keeps what it committed.
+    Each batch is taken out of and added to the search index in one
+    ``executemany`` each. Rows replace receipts with the same id, so running it again is safe.
+    Columns are matched by name; unknown ones are ignored and missing ones
+    left empty, but ``id`` is required. Amounts are coerced to numbers; dates
+    are kept as they are. Rows that fail are skipped and reported with their
+    line numbers, up to ``IMPORT_MAX_ERRORS`` of them. All of them are also
+    written to ``rejected_path`` if given (the header plus an ``error``
+    column; the file is only created once a row is skipped), so they can be
+    fixed and imported again.
+
+    ``progress`` is called after every batch with the running report:
+    ``rows``, ``imported``, ``skipped``, ``errors``, ``bytes_read`` and
+    ``bytes_total``. The final report is returned.
+    """
+
+    now = timestamp_now()
+    report: Dict[str, Any] = {
+        "rows": 0,
+        "imported": 0,
+        "skipped": 0,
+        "errors": [],
+        "bytes_read": 0,
+        "bytes_total": os.path.getsize(csv_path),
+    }
+    conn = get_connection(db_path)
+    rejected = None
+    with open(csv_path, newline="", encoding="utf-8-sig") as f, ExitStack() as stack:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader, [])]
+        if "id" not in header:
+            raise ValueError(f"{csv_path} has no 'id' column")
+        columns = [header.index(field) if field in header else None for field in RECEIPT_FIELDS]
+        consumed = batch_size
+        while consumed == batch_size:
+            batch = []
+            artifacts = []
+            consumed = 0
+            for row in itertools.islice(reader, batch_size):
+                consumed += 1
+                report["rows"] += 1
+                try:
+                    values, row_artifacts = _import_values(row, columns, now)
+                    batch.append(values)
+                    artifacts.extend(row_artifacts)
+                except ValueError as exc:
+                    report["skipped"] += 1
+                    if len(report["errors"]) < IMPORT_MAX_ERRORS:
+                        report["errors"].append(f"line {reader.line_num}: {exc}")
+                    if rejected_path is not None:
+                        if rejected is None:
+                            rejected = csv.writer(
+                                stack.enter_context(open(rejected_path, "w", newline="", encoding="utf-8"))
+                            )
+                            rejected.writerow([*header, "error"])
+                        rejected.writerow([*row, *[""] * (len(header) - len(row)), str(exc)])
+            if batch:
+                ids = [values[0] for values in batch]
+                with timed("db_insert"), conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    _unindex_receipts(conn, ids)
+                    conn.executemany(INSERT_RECEIPT_ROW_SQL, batch)
+                    _store_artifacts(conn, artifacts)
+                    _index_receipts(conn, ids)
+                report["imported"] += len(batch)
+            report["bytes_read"] = f.buffer.tell()
+            if progress is not None and consumed:
+                progress(report)
+    return report
+
+
+def search_query(search: str) -> Optional[str]:
+    """FTS5 query for what was typed into the search box, or ``None`` if it has no words.
+
+    Every whitespace-separated term must match, each as a prefix so results
+    update while a word is still being typed. Terms are quoted, so FTS5
+    operators and punctuation in the input are matched literally: ``11.59``
+    finds the adjacent tokens ``11`` and ``59``.
+    """
+
+    terms = [term.replace('"', '""') for term in search.split() if any(c.isalnum() for c in term)]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+# A word as the search index's unicode61 tokenizer splits text: a run of
+# letters and digits.
+_WORD_RE = re.compile(r"[^\W_]+")
+
+
+def _fold(word: str) -> str:
+    """``word`` as the search index compares it: lower case, without diacritics."""
+
+    if word.isascii():
+        return word.lower()
+    return "".join(c for c in unicodedata.normalize("NFKD", word) if not unicodedata.combining(c)).lower()
+
+
+def search_snippet(text: Optional[str], search: str) -> Optional[str]:
+    """Up to ``SNIPPET_TOKENS`` words of ``text`` around its best run of matches for ``search``.
+
+    What FTS5's snippet() returns, which a contentless index cannot run:
+    matched words (by prefix, as the search matches them) are wrapped in
+    ``SNIPPET_START`` and ``SNIPPET_END``, and '…' marks where the text was
+    cut. If only the vendor matched, it is the start of the text.
+    """
+
+    words = list(_WORD_RE.finditer(text or ""))
+    if not words:
+        return None
+    terms = tuple(_fold(term) for term in _WORD_RE.findall(search))
+    hits = [i for i, word in enumerate(words) if _fold(word.group()).startswith(terms)]
+    start = 0
+    if hits:
+        # The window with the most matches, moved to centre them.
+        first = max(hits, key=lambda i: sum(i <= hit < i + SNIPPET_TOKENS for hit in hits))
+        last = max(hit for hit in hits if hit < first + SNIPPET_TOKENS)
+        start = max(0, min(first - (SNIPPET_TOKENS - (last - first + 1)) // 2, len(words) - SNIPPET_TOKENS))
+    end = min(len(words), start + SNIPPET_TOKENS)
+    parts = ["…"] if start else []
+    position = words[start].start()
+    for i in range(start, end):
+        word = words[i]
+        parts.append(text[position : word.start()])
+        parts.append(f"{SNIPPET_START}{word.group()}{SNIPPET_END}" if i in hits else word.group())
+        position = word.end()
+    if end < len(words):
+        parts.append("…")
+    return "".join(parts)
+
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Position encoded by ``encode_cursor``; ``ValueError`` if it is not one."""
+
+    position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    if isinstance(position, dict) and len(position) == 1:
+        (kind, value), = position.items()
+        if kind == "offset" and isinstance(value, int) and value >= 0:
+            return position
+        if kind in ("after", "before") and isinstance(value, list) and len(value) == 2:
+            if all(isinstance(part, str) for part in value):
+                return position
+        if kind == "before" and value is None:
+            return position
+    raise ValueError(f"invalid cursor: {cursor!r}")
 
 
 def list_receipts(
     db_path: str,
     search: Optional[str] = None,
     category: Optional[str] = None,
-    page: int = 1,
+    cursor: Optional[str] = None,
     per_page: int = 10,
-) -> Tuple[List[sqlite3.Row], int]:
+    with_total: bool = True,
+) -> Dict[str, Any]:
+    """One page of receipts, with opaque cursors for its neighbours.
+
+    Returns ``receipts`` (their LIST_FIELDS), ``next``/``prev``/``last`` cursors (``None`` where
+    there is no such page) and ``total``, the number of matches, if
+    ``with_total``. Pass a cursor back to get that page; ``None`` is the first.
+    Browsing totals are read from ``receipt_rollups``; searches have to count
+    their matches, and only offer ``last`` when they did.
+
+    Browsing lists receipts newest first and pages by keyset on (date, id):
+    ``{"after": [date, id]}`` or ``{"before": [date, id]}``, with
+    ``{"before": None}`` for the oldest receipts. Every page is one index range
+    read however deep it is. Searching returns matches best first, each with
+    a ``snippet`` of the OCR text around the matched terms (see
+    ``search_snippet``; None when browsing). Ranks have no stable order to
+    resume from, so search pages by ``{"offset": n}``; ranking every match is
+    the cost there, not the offset.
+    """
+
+    position = decode_cursor(cursor) if cursor else {}
     conn = get_connection(db_path)
-    query = "SELECT * FROM receipts"
+    source = "receipts"
+    columns = f"{_select_fields(LIST_FIELDS)}, NULL AS snippet"
     clauses = []
-    params = []
-    if search:
-        clauses.append("(vendor LIKE ? OR raw_text LIKE ?)")
-        params.extend([f"%{search}%", f"%{search}%"])
+    params: List[Any] = []
+    match = search_query(search) if search else None
+    if match:
+        source = "receipts_fts JOIN receipts ON receipts.rowid = receipts_fts.rowid"
+        columns = _select_fields([*LIST_FIELDS, "raw_text"])
+        clauses.append("receipts_fts MATCH ?")
+        params.append(match)
     if category:
-        clauses.append("category = ?")
+        clauses.append("receipts.category = ?")
         params.append(category)
-    if clauses:
-        query += " WHERE " + " AND ".join(clauses)
-    query += " ORDER BY date DESC"
-    total = conn.execute(
-        query.replace("SELECT *", "SELECT COUNT(*)"), params
-    ).fetchone()[0]
-    query += " LIMIT ? OFFSET ?"
-    params.extend([per_page, (page - 1) * per_page])
-    rows = conn.execute(query, params).fetchall()
-    conn.close()
-    return rows, total
-
-
-def get_receipt(db_path: str, receipt_id: str) -> Optional[sqlite3.Row]:
-    conn = get_connection(db_path)
-    row = conn.execute("SELECT * FROM receipts WHERE id = ?", (receipt_id,)).fetchone()
-    conn.close()
+
+    total = None
+    if with_total and not match:
+        # Browsing needs no count: the rollups hold the total for every category.
+        row = conn.execute(
+            "SELECT receipts FROM receipt_rollups WHERE kind = ? AND key = ?",
+            ("category", category) if category else ("all", ""),
+        ).fetchone()
+        total = row["receipts"] if row else 0
+    elif with_total:
+        where = " WHERE " + " AND ".join(clauses)
+        # The index alone can count matches; joining receipts is only needed to filter.
+        count_source = "receipts_fts" if not category else source
+        total = conn.execute(f"SELECT COUNT(*) FROM {count_source}{where}", params).fetchone()[0]
+
+    page: Dict[str, Any] = {"total": total, "next": None, "prev": None, "last": None}
+    if match:
+        offset = position.get("offset", 0)
+        where = " WHERE " + " AND ".join(clauses)
+        rows = conn.execute(
+            f"SELECT {columns} FROM {source}{where} ORDER BY receipts_fts.rank LIMIT ? OFFSET ?",
+            [*params, per_page + 1, offset],
+        ).fetchall()
+        if len(rows) > per_page:
+            page["next"] = encode_cursor({"offset": offset + per_page})
+            if total is not None:
+                page["last"] = encode_cursor({"offset": (total - 1) // per_page * per_page})
+        if offset:
+            page["prev"] = encode_cursor({"offset": max(0, offset - per_page)})
+        page["receipts"] = [
+            {**{field: row[field] for field in LIST_FIELDS}, "snippet": search_snippet(row["raw_text"], search)}
+            for row in rows[:per_page]
+        ]
+        return page
+
+    backwards = "before" in position
+    key = position.get("before" if backwards else "after")
+    if key is not None:
+        clauses.append(f"(receipts.date, receipts.id) {'>' if backwards else '<'} (?, ?)")
+        params.extend(key)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    direction = "ASC" if backwards else "DESC"
+    rows = conn.execute(
+        f"SELECT {columns} FROM {source}{where} "
+        f"ORDER BY receipts.date {direction}, receipts.id {direction} LIMIT ?",
+        [*params, per_page + 1],
+    ).fetchall()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    if rows:
+        newer = more if backwards else key is not None
+        older = key is not None if backwards else more
+        if newer:
+            page["prev"] = encode_cursor({"before": [rows[0]["date"], rows[0]["id"]]})
+        if older:
+            page["next"] = encode_cursor({"after": [rows[-1]["date"], rows[-1]["id"]]})
+            page["last"] = encode_cursor({"before": None})
+    page["receipts"] = rows
+    return page
+
+
+def receipt_image_paths(db_path: str) -> set:
+    conn = get_connection(db_path)
+    paths = {row[0] for row in conn.execute("SELECT image_path FROM receipts")}
+    return paths
+
+
+def get_receipt(db_path: str, receipt_id: str, with_artifacts: bool = False) -> Optional[sqlite3.Row]:
+    """The receipt's row; ``with_artifacts`` also decompresses its ARTIFACT_FIELDS, for the detail page."""
+
+    fields = RECEIPT_FIELDS if with_artifacts else RECEIPT_COLUMNS
+    conn = get_connection(db_path)
+    row = conn.execute(f"SELECT {_select_fields(fields)} FROM receipts WHERE id = ?", (receipt_id,)).fetchone()
     return row
 
 
 def insert_receipt(db_path: str, data: Dict[str, str]) -> None:
+    with timed("db_insert"):
+        conn = get_connection(db_path)
+        with conn:
+            _unindex_receipts(conn, [data["id"]])
+            conn.execute(INSERT_RECEIPT_SQL, data)
+            _store_artifacts(conn, [(data["id"], field, data.get(field)) for field in ARTIFACT_FIELDS])
+            _index_receipts(conn, [data["id"]])
+
+
+def insert_receipts(
+    db_path: str,
+    records: List[Dict[str, Any]],
+    cache_entries: Optional[List[Tuple[str, str, str, Dict[str, Any]]]] = None,
+) -> None:
+    """Insert many receipts (and their OCR cache rows) in one transaction.
+
+    ``cache_entries`` are ``(image_hash, pipeline_version, receipt_id, result)``.
+    """
+
+    now = timestamp_now()
     conn = get_connection(db_path)
-    with conn:
-        placeholders = ",".join([":" + key for key in RECEIPT_FIELDS])
-        conn.execute(
-            f"INSERT OR REPLACE INTO receipts ({','.join(RECEIPT_FIELDS)}) VALUES ({placeholders})",
-            data,
+    ids = [record["id"] for record in records]
+    with timed("db_insert"), conn:
+        _unindex_receipts(conn, ids)
+        conn.executemany(INSERT_RECEIPT_SQL, records)
+        _store_artifacts(
+            conn, [(record["id"], field, record.get(field)) for record in records for field in ARTIFACT_FIELDS]
         )
-    conn.close()
+        _index_receipts(conn, ids)
+        if cache_entries:
+            rows = []
+            for image_hash, version, receipt_id, result in cache_entries:
+                payload = json.dumps(result)
+                rows.append((image_hash, version, receipt_id, payload, len(payload.encode("utf-8")), now, now))
+            conn.executemany(
+                "INSERT OR REPLACE INTO ocr_cache "
+                "(image_hash, pipeline_version, receipt_id, result, size, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            _evict_cached_ocr(conn, OCR_CACHE_MAX_BYTES)
 
 
 def update_receipt(db_path: str, receipt_id: str, updates: Dict[str, str]) -> None:
     conn = get_connection(db_path)
+    artifacts = [(receipt_id, field, updates.pop(field)) for field in ARTIFACT_FIELDS if field in updates]
     set_clause = ", ".join([f"{k} = :{k}" for k in updates.keys()])
     updates["id"] = receipt_id
+    searched = artifacts or "vendor" in updates
     with conn:
-        conn.execute(f"UPDATE receipts SET {set_clause} WHERE id = :id", updates)
-    conn.close()
+        if searched:
+            _unindex_receipts(conn, [receipt_id])
+        if set_clause:
+            conn.execute(f"UPDATE receipts SET {set_clause} WHERE id = :id", updates)
+        if artifacts and conn.execute("SELECT 1 FROM receipts WHERE id = ?", (receipt_id,)).fetchone():
+            _store_artifacts(conn, artifacts)
+        if searched:
+            _index_receipts(conn, [receipt_id])
+
 
+def stats(db_path: str) -> Dict[str, Any]:
+    """Dashboard figures, read from the trigger-maintained rollups.
+
+    ``categories`` are ordered by amount spent and ``months`` are the last
+    twelve with receipts, newest first.
+    """
 
-def stats(db_path: str) -> Dict[str, float]:
     conn = get_connection(db_path)
-    total_receipts = conn.execute("SELECT COUNT(*) FROM receipts").fetchone()[0]
-    total_spent = conn.execute("SELECT SUM(total_amount) FROM receipts").fetchone()[0] or 0
+    totals = conn.execute("SELECT * FROM receipt_rollups WHERE kind = 'all' AND key = ''").fetchone()
+    categories = conn.execute(
+        "SELECT key AS category, receipts, spent_cents / 100.0 AS spent FROM receipt_rollups "
+        "WHERE kind = 'category' ORDER BY spent_cents DESC"
+    ).fetchall()
+    months = conn.execute(
+        "SELECT key AS month, receipts, spent_cents / 100.0 AS spent FROM receipt_rollups "
+        "WHERE kind = 'month' ORDER BY key DESC LIMIT 12"
+    ).fetchall()
     recent = conn.execute(
-        "SELECT * FROM receipts ORDER BY created_at DESC LIMIT 5"
+        "SELECT id, date, vendor, total_amount FROM receipts ORDER BY created_at DESC LIMIT 5"
     ).fetchall()
-    conn.close()
-    return {"count": total_receipts, "spent": total_spent, "recent": recent}
+    return {
+        "count": totals["receipts"] if totals else 0,
+        "spent": totals["spent_cents"] / 100 if totals else 0.0,
+        "recent": recent,
+        "categories": categories,
+        "months": months,
+    }
+
+
+def check_rollups(db_path: str) -> List[Tuple[str, str, Optional[Rollup], Optional[Rollup]]]:
+    """Compare ``receipt_rollups`` with a recount of ``receipts``.
+
+    Returns ``(kind, key, stored, expected)`` for every rollup that differs,
+    where the last two are ``(receipts, spent_cents, tax_cents)`` or ``None``
+    for a missing row. Both sides are read in one transaction, so concurrent
+    writes cannot show up as differences.
+    """
+
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute("BEGIN")
+        stored = {(row[0], row[1]): tuple(row[2:]) for row in conn.execute(
+            "SELECT kind, key, receipts, spent_cents, tax_cents FROM receipt_rollups"
+        )}
+        expected = {(row[0], row[1]): tuple(row[2:]) for row in conn.execute(ROLLUP_SQL)}
+    return [
+        (kind, key, stored.get((kind, key)), expected.get((kind, key)))
+        for kind, key in sorted(set(stored) | set(expected))
+        if stored.get((kind, key)) != expected.get((kind, key))
+    ]
+
+
+def rebuild_rollups(db_path: str) -> None:
+    """Recompute ``receipt_rollups`` from scratch."""
+
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM receipt_rollups")
+        conn.execute(f"INSERT INTO receipt_rollups (kind, key, receipts, spent_cents, tax_cents) {ROLLUP_SQL}")
+
+
+def search_index_ok(db_path: str) -> bool:
+    """Whether ``receipts_fts`` matches the receipts' vendor and OCR text.
+
+    A contentless index cannot be checked against its content, so a fresh
+    one is built in a scratch database and every token it holds (term,
+    receipt, column and position) compared with the live index.
+    """
+
+    conn = get_connection(db_path)
+    try:
+        with conn:
+            conn.execute("INSERT INTO receipts_fts (receipts_fts, rank) VALUES ('integrity-check', 1)")
+    except sqlite3.DatabaseError:
+        return False
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch = sqlite3.connect(os.path.join(tmp, "search.db"))
+        try:
+            scratch.execute(SEARCH_INDEX_SQL.format(table="receipts_fts"))
+            with scratch:
+                for documents in _all_search_documents(conn):
+                    scratch.executemany(_INDEX_SQL, documents)
+            scratch.execute("ATTACH DATABASE ? AS live", (db_path,))
+            scratch.execute("CREATE VIRTUAL TABLE temp.expected USING fts5vocab(main, receipts_fts, instance)")
+            scratch.execute("CREATE VIRTUAL TABLE temp.actual USING fts5vocab(live, receipts_fts, instance)")
+            differs = scratch.execute(
+                "SELECT EXISTS (SELECT * FROM expected EXCEPT SELECT * FROM actual) "
+                "OR EXISTS (SELECT * FROM actual EXCEPT SELECT * FROM expected)"
+            ).fetchone()[0]
+        finally:
+            scratch.close()
+    return not differs
+
+
+def rebuild_search_index(db_path: str) -> None:
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute("INSERT INTO receipts_fts (receipts_fts) VALUES ('delete-all')")
+        _index_all_receipts(conn)
 
 
 def delete_receipt(db_path: str, receipt_id: str) -> None:
     conn = get_connection(db_path)
     with conn:
+        _unindex_receipts(conn, [receipt_id])
         conn.execute("DELETE FROM receipts WHERE id = ?", (receipt_id,))
-    conn.close()
 
 
 def timestamp_now() -> str:
     return datetime.utcnow().isoformat()
+
+
+def enqueue_job(db_path: str, receipt_id: str, image_path: str, kind: str = "ocr") -> str:
+    job_id = str(uuid.uuid4())
+    now = timestamp_now()
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute(
+            "INSERT INTO jobs (id, receipt_id, kind, image_path, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+            (job_id, receipt_id, kind, image_path, now, now),
+        )
+    return job_id
+
+
+def claim_job(db_path: str, worker: str) -> Optional[sqlite3.Row]:
+    """Atomically move the next queued job to ``running`` for ``worker``.
+
+    Jobs are taken oldest first, except that background ``fulltext`` passes
+    wait until no receipt is waiting for its fields.
+
+    Several worker processes poll the same table, so the claim is a
+    compare-and-set on the status column: if another worker won the race the
+    UPDATE touches no rows and we try the next candidate.
+    """
+
+    conn = get_connection(db_path)
+    while True:
+        row = conn.execute(
+            "SELECT id FROM jobs WHERE status = 'queued' "
+            "ORDER BY kind = 'fulltext', created_at LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        with conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE id = ? AND status = 'queued'",
+                (worker, timestamp_now(), row["id"]),
+            )
+        if cur.rowcount == 1:
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+
+
+def finish_job(db_path: str, job_id: str, status: str, error: Optional[str] = None) -> None:
+    conn = get_connection(db_path)
+    with conn:
+        if status == "failed":
+            conn.execute(RELEASE_CACHED_OCR_SQL.format(jobs="id = ?"), (job_id,))
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+            (status, error, timestamp_now(), job_id),
+        )
+
+
+def requeue_jobs(db_path: str, worker: Optional[str] = None) -> int:
+    """Return ``running`` jobs to the queue after a worker (or the pool) died.
+
+    Jobs that already used up ``MAX_JOB_ATTEMPTS`` are marked failed instead so
+    an image that crashes the OCR engine cannot wedge the queue forever.
+    """
+
+    clause = "status = 'running'"
+    params: List[str] = []
+    if worker is not None:
+        clause += " AND worker = ?"
+        params.append(worker)
+    now = timestamp_now()
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute(
+            RELEASE_CACHED_OCR_SQL.format(jobs=f"{clause} AND attempts >= ?"), [*params, MAX_JOB_ATTEMPTS]
+        )
+        conn.execute(
+            f"UPDATE jobs SET status = 'failed', error = 'worker died', updated_at = ? "
+            f"WHERE {clause} AND attempts >= ?",
+            [now, *params, MAX_JOB_ATTEMPTS],
+        )
+        cur = conn.execute(
+            f"UPDATE jobs SET status = 'queued', worker = NULL, updated_at = ? WHERE {clause}",
+            [now, *params],
+        )
+    return cur.rowcount
+
+
+def has_pending_job(db_path: str, receipt_id: str) -> bool:
+    """Whether a job for ``receipt_id`` is queued or running."""
+
+    conn = get_connection(db_path)
+    row = conn.execute(
+        "SELECT 1 FROM jobs WHERE receipt_id = ? AND status IN ('queued', 'running') LIMIT 1", (receipt_id,)
+    ).fetchone()
+    return row is not None
+
+
+def get_job(db_path: str, job_id: str) -> Optional[sqlite3.Row]:
+    conn = get_connection(db_path)
+    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return row
+
+
+def get_job_for_receipt(db_path: str, receipt_id: str, kind: str = "ocr") -> Optional[sqlite3.Row]:
+    conn = get_connection(db_path)
+    row = conn.execute(
+        "SELECT * FROM jobs WHERE receipt_id = ? AND kind = ? ORDER BY created_at DESC LIMIT 1",
+        (receipt_id, kind),
+    ).fetchone()
+    return row
+
+
+def get_cached_ocr(db_path: str, image_hash: str, pipeline_version: str) -> Optional[sqlite3.Row]:
+    """Cache entry for an image, or ``None``.
+
+    An entry whose ``result`` is NULL belongs to an image whose OCR job is
+    still pending; its ``receipt_id`` points at the placeholder receipt.
+    """
+
+    conn = get_connection(db_path)
+    with conn:
+        row = conn.execute(
+            "SELECT * FROM ocr_cache WHERE image_hash = ? AND pipeline_version = ?",
+            (image_hash, pipeline_version),
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                "UPDATE ocr_cache SET last_used_at = ? WHERE image_hash = ? AND pipeline_version = ?",
+                (timestamp_now(), image_hash, pipeline_version),
+            )
+    return row
+
+
+def reserve_cached_ocr(db_path: str, image_hash: str, pipeline_version: str, receipt_id: str) -> None:
+    """Record that ``receipt_id`` is being OCR'd from this image."""
+
+    now = timestamp_now()
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO ocr_cache "
+            "(image_hash, pipeline_version, receipt_id, result, size, created_at, last_used_at) "
+            "VALUES (?, ?, ?, NULL, 0, ?, ?)",
+            (image_hash, pipeline_version, receipt_id, now, now),
+        )
+
+
+def link_cached_ocr(db_path: str, image_hash: str, pipeline_version: str, receipt_id: str) -> None:
+    """Point the cache entry for an image at ``receipt_id``, a new receipt made from its result."""
+
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute(
+            "UPDATE ocr_cache SET receipt_id = ? WHERE image_hash = ? AND pipeline_version = ?",
+            (receipt_id, image_hash, pipeline_version),
+        )
+
+
+def complete_cached_ocr(
+    db_path: str,
+    receipt_id: str,
+    pipeline_version: str,
+    result: Dict[str, Any],
+    max_bytes: int = OCR_CACHE_MAX_BYTES,
+) -> None:
+    """Store the OCR result for the image reserved by ``receipt_id`` and evict."""
+
+    payload = json.dumps(result)
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute(
+            "UPDATE ocr_cache SET result = ?, size = ?, last_used_at = ? "
+            "WHERE receipt_id = ? AND pipeline_version = ?",
+            (payload, len(payload.encode("utf-8")), timestamp_now(), receipt_id, pipeline_version),
+        )
+        _evict_cached_ocr(conn, max_bytes)
+
+
+def _evict_cached_ocr(conn: sqlite3.Connection, max_bytes: int) -> None:
+    used = conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+    if used <= max_bytes:
+        return
+    victims = []
+    for row in conn.execute(
+        "SELECT image_hash, pipeline_version, size FROM ocr_cache "
+        "WHERE result IS NOT NULL ORDER BY last_used_at"
+    ):
+        if used <= max_bytes:
+            break
+        victims.append((row["image_hash"], row["pipeline_version"]))
+        used -= row["size"]
+    conn.executemany(
+        "DELETE FROM ocr_cache WHERE image_hash = ? AND pipeline_version = ?", victims
+    )
+
+
+def enqueue_camera_request(db_path: str, client: Optional[str], expires_at: float) -> int:
+    """Take a ticket in the FIFO queue for the camera and return its id.
+
+    ``expires_at`` (epoch seconds) bounds how long a ticket can hold up the
+    queue if its process dies without removing it.
+    """
+
+    now = time.time()
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute("DELETE FROM camera_requests WHERE expires_at < ?", (now,))
+        cur = conn.execute(
+            "INSERT INTO camera_requests (client, created_at, expires_at) VALUES (?, ?, ?)",
+            (client, now, expires_at),
+        )
+    return cur.lastrowid
+
+
+def camera_queue_position(db_path: str, request_id: int) -> int:
+    """Number of live requests (waiting or capturing) ahead of ``request_id``."""
+
+    conn = get_connection(db_path)
+    row = conn.execute(
+        "SELECT COUNT(*) FROM camera_requests WHERE id < ? AND expires_at >= ?",
+        (request_id, time.time()),
+    ).fetchone()
+    return row[0]
+
+
+def camera_queue_status(db_path: str, client: Optional[str] = None) -> Dict[str, Optional[int]]:
+    """Queue length, and the position of ``client``'s request if it has one."""
+
+    now = time.time()
+    conn = get_connection(db_path)
+    length = conn.execute("SELECT COUNT(*) FROM camera_requests WHERE expires_at >= ?", (now,)).fetchone()[0]
+    position = None
+    if client:
+        row = conn.execute(
+            "SELECT id FROM camera_requests WHERE client = ? AND expires_at >= ? ORDER BY id LIMIT 1",
+            (client, now),
+        ).fetchone()
+        if row is not None:
+            position = conn.execute(
+                "SELECT COUNT(*) FROM camera_requests WHERE id < ? AND expires_at >= ?", (row["id"], now)
+            ).fetchone()[0]
+    return {"length": length, "position": position}
+
+
+def activate_camera_request(db_path: str, request_id: int, expires_at: float) -> None:
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute(
+            "UPDATE camera_requests SET status = 'capturing', expires_at = ? WHERE id = ?",
+            (expires_at, request_id),
+        )
+
+
+def delete_camera_request(db_path: str, request_id: int) -> None:
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute("DELETE FROM camera_requests WHERE id = ?", (request_id,))
+
+
+def record_auto_capture(db_path: str, client: Optional[str], receipt_id: str, existing: bool) -> int:
+    """Note that ``client``'s live preview captured ``receipt_id`` and return the note's id.
+
+    ``existing`` is true when the image was linked to a receipt scanned before.
+    Notes older than ``AUTO_CAPTURE_RETENTION`` seconds are dropped.
+    """
+
+    now = time.time()
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute("DELETE FROM auto_captures WHERE created_at < ?", (now - AUTO_CAPTURE_RETENTION,))
+        cur = conn.execute(
+            "INSERT INTO auto_captures (client, receipt_id, existing, created_at) VALUES (?, ?, ?, ?)",
+            (client, receipt_id, int(existing), now),
+        )
+    return cur.lastrowid
+
+
+def auto_captures(db_path: str, client: str, after: int = 0) -> List[sqlite3.Row]:
+    """``client``'s auto-captures with ids above ``after``, oldest first."""
+
+    conn = get_connection(db_path)
+    return conn.execute(
+        "SELECT id, receipt_id, existing, created_at FROM auto_captures WHERE client = ? AND id > ? ORDER BY id",
+        (client, after),
+    ).fetchall()
@@ -1,111 +1,520 @@
+import calendar
+import os
+import queue
 import re
+import threading
 import uuid
-from datetime import datetime
-from typing import Dict, Optional
+from datetime import date as date_type
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
 
 import cv2
 import numpy as np
 import pytesseract
 from PIL import Image
 
-CURRENCY_REGEX = re.compile(r"([$€£]|USD|EUR|GBP)")
-DATE_REGEX = re.compile(
-    r"((?:\d{4}[/-]\d{2}[/-]\d{2})|(?:\d{2}[/-]\d{2}[/-]\d{4})|(?:\d{1,2}\s+[A-Za-z]{3,9}\s+\d{4}))"
-)
-TOTAL_REGEX = re.compile(r"(total|amount due|grand total)[:\s]*([\d.,]+)", re.IGNORECASE)
-TAX_REGEX = re.compile(r"(tax|vat)[:\s]*([\d.,]+)", re.IGNORECASE)
+try:
+    import tesserocr
+except ImportError:  # pragma: no cover - falls back to the pytesseract subprocess
+    tesserocr = None
+
+from .metrics import timed
+
+# Bump whenever preprocessing, OCR settings or parsing change in a way that
+# alters results, so cached OCR output from older pipelines is not reused.
+PIPELINE_VERSION = "4"
+
+OCR_ENGINE = os.environ.get("RECEIPT_OCR_ENGINE", "auto")
+OCR_LANG = "eng"
+DEFAULT_PSM = 3
+
+# "full" OCRs the whole page. "layout" OCRs only the header (vendor, date)
+# and totals regions, in parallel with tight settings, and leaves the
+# full-page text to a background pass.
+OCR_MODE = os.environ.get("RECEIPT_OCR_MODE", "full")
+HEADER_FRACTION = 0.2
+TOTALS_FRACTION = 0.35
+REGION_PSM = 6
+
+# Paper detection: the receipt must cover between 5% and 95% of the frame to
+# be treated as a distinct region; the crop keeps a 3% margin around it.
+ROI_MIN_FRACTION = 0.05
+ROI_MAX_FRACTION = 0.95
+ROI_PADDING = 0.03
+
+# Deskew: skews below DESKEW_MIN_ANGLE degrees are not worth a warp (Tesseract
+# copes with them); the angle search covers +/-DESKEW_MAX_ANGLE degrees.
+DESKEW_MIN_ANGLE = float(os.environ.get("RECEIPT_DESKEW_MIN_ANGLE", "0.5"))
+DESKEW_MAX_ANGLE = 15
+DESKEW_PROXY_WIDTH = 600
+
+
+class OcrEngine:
+    """Recognise text in an in-memory 8-bit grayscale image.
+
+    ``psm`` is a Tesseract page segmentation mode and ``whitelist`` limits
+    the characters it may output; both default to Tesseract's own defaults.
+    """
+
+    name = "base"
+
+    def image_to_string(self, image: np.ndarray, psm: int = DEFAULT_PSM, whitelist: str = "") -> str:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class TesserocrEngine(OcrEngine):
+    """Warm libtesseract handles kept for the lifetime of the process.
+
+    The traineddata is loaded once per handle and images are handed over as
+    raw buffers, so there is no temp file, fork or stdout parsing per
+    receipt. A handle is not safe to share between threads, so concurrent
+    callers (e.g. the layout mode's region passes) each check one out of an
+    idle pool, which grows to the peak concurrency.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, lang: str = OCR_LANG):
+        self.lang = lang
+        self.handles = [tesserocr.PyTessBaseAPI(lang=lang)]
+        self.idle: "queue.SimpleQueue" = queue.SimpleQueue()
+        self.idle.put(self.handles[0])
+        self.lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            api = tesserocr.PyTessBaseAPI(lang=self.lang)
+            with self.lock:
+                self.handles.append(api)
+            return api
+
+    def image_to_string(self, image: np.ndarray, psm: int = DEFAULT_PSM, whitelist: str = "") -> str:
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        bpp = 1 if image.ndim == 2 else image.shape[2]
+        api = self._acquire()
+        try:
+            api.SetPageSegMode(psm)
+            api.SetVariable("tessedit_char_whitelist", whitelist)
+            api.SetImageBytes(image.tobytes(), width, height, bpp, width * bpp)
+            return api.GetUTF8Text()
+        finally:
+            self.idle.put(api)
+
+    def close(self) -> None:
+        for api in self.handles:
+            api.End()
+
+
+class PytesseractEngine(OcrEngine):
+    """Fallback that shells out to the ``tesseract`` binary for every call."""
+
+    name = "pytesseract"
+
+    def __init__(self, lang: str = OCR_LANG):
+        self.lang = lang
+
+    def image_to_string(self, image: np.ndarray, psm: int = DEFAULT_PSM, whitelist: str = "") -> str:
+        config = f"--psm {psm}"
+        if whitelist:
+            config += f" -c tessedit_char_whitelist={whitelist}"
+        return pytesseract.image_to_string(Image.fromarray(image), lang=self.lang, config=config)
+
+
+_engine: Optional[OcrEngine] = None
+_engine_pid: Optional[int] = None
+
+
+def create_engine(name: str = OCR_ENGINE) -> OcrEngine:
+    if name == "tesserocr" or (name == "auto" and tesserocr is not None):
+        return TesserocrEngine()
+    return PytesseractEngine()
+
+
+def get_engine() -> OcrEngine:
+    """Return this process's OCR engine, creating it on first use.
+
+    Engines are per process: worker pools fork, and a libtesseract handle
+    inherited across a fork must not be reused by the child.
+    """
+
+    global _engine, _engine_pid
+    if _engine is None or _engine_pid != os.getpid():
+        _engine = create_engine()
+        _engine_pid = os.getpid()
+    return _engine
+
+
+def find_paper_roi(proxy: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """Bounding box ``(x, y, w, h)`` of the receipt paper in a small gray image.
+
+    Receipts are bright paper on a darker table, so the largest bright blob
+    is the paper. Returns ``None`` when there is no distinct paper (flatbed
+    scans, close-ups) so callers keep the whole frame.
+    """
+
+    blur = cv2.GaussianBlur(proxy, (5, 5), 0)
+    _, mask = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    frame_area = proxy.shape[0] * proxy.shape[1]
+    if not ROI_MIN_FRACTION * frame_area <= w * h <= ROI_MAX_FRACTION * frame_area:
+        return None
+    pad_x = int(w * ROI_PADDING)
+    pad_y = int(h * ROI_PADDING)
+    x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+    x1 = min(proxy.shape[1], x + w + pad_x)
+    y1 = min(proxy.shape[0], y + h + pad_y)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def load_receipt_gray(image_path: str) -> Optional[np.ndarray]:
+    """Decode ``image_path`` as grayscale, cropped to the receipt paper.
+
+    The paper is located on a 1/8-scale proxy that libjpeg decodes directly
+    (DCT scaling, no full-size intermediate); only then is the image decoded
+    at full resolution, as a single gray channel, and cropped, so the later
+    blur/threshold/deskew stages touch only the receipt's pixels.
+    """
+
+    proxy = cv2.imread(image_path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if proxy is None:
+        return None
+    return crop_to_paper(cv2.imread(image_path, cv2.IMREAD_GRAYSCALE), proxy)
+
+
+def crop_to_paper(gray: np.ndarray, proxy: Optional[np.ndarray] = None) -> np.ndarray:
+    """Crop ``gray`` to the paper located on ``proxy`` (a 1/8-scale copy by default)."""
+
+    if proxy is None:
+        proxy = cv2.resize(gray, None, fx=0.125, fy=0.125, interpolation=cv2.INTER_AREA)
+    roi = find_paper_roi(proxy)
+    if roi is None:
+        return gray
+    scale_y = gray.shape[0] / proxy.shape[0]
+    scale_x = gray.shape[1] / proxy.shape[1]
+    x, y, w, h = roi
+    x0, y0 = int(x * scale_x), int(y * scale_y)
+    x1, y1 = int((x + w) * scale_x), int((y + h) * scale_y)
+    # Copy so the full frame can be freed instead of being kept alive by a view.
+    return gray[y0:y1, x0:x1].copy()
+
 
+def estimate_skew_angle(image: np.ndarray) -> float:
+    """Rotation in degrees (``cv2.getRotationMatrix2D`` convention) that levels the text.
 
-def preprocess_image(image_path: str) -> Image.Image:
-    image = cv2.imread(image_path)
-    if image is None:
-        return Image.open(image_path)
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    Works on an edge map of a copy downsampled to ``DESKEW_PROXY_WIDTH``:
+    every edge pixel is projected onto the vertical axis for each candidate
+    angle at once, and the angle whose row histogram is most sharply peaked
+    (text lines aligned with rows) wins. A coarse 1 degree sweep over
+    +/-``DESKEW_MAX_ANGLE`` is refined in 0.1 degree steps.
+    """
+
+    height, width = image.shape[:2]
+    scale = min(1.0, DESKEW_PROXY_WIDTH / width)
+    small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else image
+    edges = cv2.Canny(small, 50, 150)
+    ys, xs = np.nonzero(edges)
+    if ys.size < 2:
+        return 0.0
+    xs = xs.astype(np.float32) - small.shape[1] / 2
+    ys = ys.astype(np.float32) - small.shape[0] / 2
+    rows = int(np.hypot(*small.shape[:2])) + 2
+
+    def best(candidates: np.ndarray) -> float:
+        theta = np.deg2rad(candidates)[:, None]
+        projected = (ys * np.cos(theta) - xs * np.sin(theta) + rows / 2).astype(np.int32)
+        offsets = (np.arange(len(candidates)) * rows)[:, None]
+        hist = np.bincount((projected + offsets).ravel(), minlength=rows * len(candidates))
+        scores = (hist.reshape(len(candidates), rows).astype(np.float64) ** 2).sum(axis=1)
+        return float(candidates[int(np.argmax(scores))])
+
+    coarse = best(np.arange(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + 1, 1.0, dtype=np.float32))
+    fine = best(np.arange(coarse - 1, coarse + 1.05, 0.1, dtype=np.float32))
+    return fine
+
+
+def deskew(image: np.ndarray, min_angle: float = DESKEW_MIN_ANGLE) -> np.ndarray:
+    """Rotate ``image`` upright, skipping the warp entirely for small skews."""
+
+    angle = estimate_skew_angle(image)
+    if abs(angle) < min_angle:
+        return image
+    (h, w) = image.shape[:2]
+    M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def binarize(gray: np.ndarray) -> np.ndarray:
     blur = cv2.GaussianBlur(gray, (3, 3), 0)
     _, thresh = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    # Attempt a simple deskew using moments
-    coords = np.column_stack(np.where(thresh > 0))
-    angle = cv2.minAreaRect(coords)[-1] if coords.size else 0
-    if angle < -45:
-        angle = -(90 + angle)
-    else:
-        angle = -angle
-    (h, w) = thresh.shape[:2]
-    center = (w // 2, h // 2)
-    M = cv2.getRotationMatrix2D(center, angle, 1.0)
-    rotated = cv2.warpAffine(thresh, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
-    return Image.fromarray(rotated)
+    return thresh
 
 
-def extract_amounts(text: str) -> Dict[str, Optional[float]]:
-    total = None
-    tax = None
-    for match in TOTAL_REGEX.finditer(text):
-        try:
-            total = float(match.group(2).replace(",", ""))
-        except ValueError:
-            continue
-    for match in TAX_REGEX.finditer(text):
+def preprocess_image(image: Union[str, np.ndarray]) -> np.ndarray:
+    """Binarised, upright receipt from an image path or an in-memory frame.
+
+    Frames (gray or BGR arrays, e.g. from the camera daemon) skip the JPEG
+    decode entirely.
+    """
+
+    with timed("decode"):
+        if isinstance(image, np.ndarray):
+            gray = crop_to_paper(image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+        else:
+            gray = load_receipt_gray(image)
+            if gray is None:
+                return np.asarray(Image.open(image).convert("L"))
+    with timed("threshold"):
+        binary = binarize(gray)
+    with timed("deskew"):
+        return deskew(binary)
+
+
+MONTHS = {
+    name.lower(): index
+    for index in range(1, 13)
+    for name in (calendar.month_name[index], calendar.month_abbr[index])
+}
+CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP"}
+TOTAL_KEYWORDS = ("total", "amount due", "grand total")
+TAX_KEYWORDS = ("tax", "vat")
+
+DATE_REGEX = re.compile(
+    r"(?P<ymd>(?P<ymd_y>\d{4})(?P<ymd_s1>[/-])(?P<ymd_m>\d{2})(?P<ymd_s2>[/-])(?P<ymd_d>\d{2}))"
+    r"|(?P<dmy>(?P<dmy_d>\d{2})(?P<dmy_s1>[/-])(?P<dmy_m>\d{2})(?P<dmy_s2>[/-])(?P<dmy_y>\d{4}))"
+    r"|(?P<dmony>(?P<dmony_d>\d{1,2})\s+(?P<dmony_m>[A-Za-z]{3,9})\s+(?P<dmony_y>\d{4}))"
+)
+# Matched against the lower-cased line; a keyword without a value at the end
+# of a line takes its value from the start of the next non-empty line.
+KEYWORD_REGEX = re.compile(rf"(?P<key>{'|'.join(TOTAL_KEYWORDS + TAX_KEYWORDS)})[:\s]*(?P<value>[\d.,]+)?")
+CONTINUATION_REGEX = re.compile(r"[:\s]*([\d.,]+)")
+CURRENCY_REGEX = re.compile(f"[{''.join(CURRENCY_SYMBOLS)}]|{'|'.join(CURRENCY_SYMBOLS.values())}")
+AMOUNT_REGEX = re.compile(r"[0-9]+\.[0-9]{2}")
+DIGIT_REGEX = re.compile(r"\d")
+
+# What the layout mode's totals pass may output: amounts, numeric dates,
+# currency symbols and the letters of every keyword and currency code above, in either case.
+TOTALS_WHITELIST = "0123456789.,:-/" + "".join(CURRENCY_SYMBOLS) + "".join(
+    sorted({
+        letter
+        for word in (*TOTAL_KEYWORDS, *TAX_KEYWORDS, *CURRENCY_SYMBOLS.values())
+        for letter in word.upper() + word.lower()
+        if letter.isalpha()
+    })
+)
+
+
+class ReceiptParser:
+    """Extract date, vendor, amounts and currency from OCR text in one pass.
+
+    Walks the lines once, picking up every field candidate as it goes: the
+    last parseable total/tax wins, the first date and currency are used and
+    the vendor is the first digit-free line near the top (else the first
+    line, unless ``fallback_vendor`` is false). The largest ``x.yy`` amount
+    is only searched for when no total keyword was found.
+    Dates are built from the matched groups instead of trying strptime
+    formats one after another.
+    """
+
+    vendor_lines = 5
+
+    def parse(self, text: str, fallback_vendor: bool = True) -> Dict[str, object]:
+        total = tax = date = currency = vendor = first_line = None
+        pending = None
+        seen = 0
+        for line in text.splitlines():
+            if not line or line.isspace():
+                continue
+            if seen < self.vendor_lines:
+                stripped = line.strip()
+                if first_line is None:
+                    first_line = stripped
+                if vendor is None and len(stripped) > 2 and not DIGIT_REGEX.search(line):
+                    vendor = stripped
+                seen += 1
+            if pending is not None:
+                match = CONTINUATION_REGEX.match(line)
+                if match:
+                    if pending in TAX_KEYWORDS:
+                        tax = _to_float(match.group(1), tax)
+                    else:
+                        total = _to_float(match.group(1), total)
+                pending = None
+            if currency is None:
+                match = CURRENCY_REGEX.search(line)
+                if match:
+                    currency = CURRENCY_SYMBOLS.get(match.group(0), match.group(0))
+            if date is None:
+                match = DATE_REGEX.search(line)
+                if match:
+                    date = self._date(match)
+            lowered = line.lower()
+            for match in KEYWORD_REGEX.finditer(lowered):
+                key, value = match.group("key", "value")
+                if value is None:
+                    if match.end() == len(lowered):
+                        pending = key
+                elif key in TAX_KEYWORDS:
+                    tax = _to_float(value, tax)
+                else:
+                    total = _to_float(value, total)
+        if total is None:
+            amounts = AMOUNT_REGEX.findall(text)
+            if amounts:
+                total = max(float(x) for x in amounts)
+        return {
+            "date": date,
+            "vendor": vendor or (first_line if fallback_vendor else None),
+            "total_amount": total,
+            "tax_amount": tax,
+            "currency": currency,
+        }
+
+    @staticmethod
+    def _date(match: "re.Match") -> str:
+        kind = match.lastgroup
+        raw = match.group(kind)
         try:
-            tax = float(match.group(2).replace(",", ""))
+            if kind == "dmony":
+                month = MONTHS.get(match.group("dmony_m").lower())
+                if month is None:
+                    return raw
+                value = date_type(int(match.group("dmony_y")), month, int(match.group("dmony_d")))
+            else:
+                if match.group(f"{kind}_s1") != match.group(f"{kind}_s2"):
+                    return raw
+                value = date_type(
+                    int(match.group(f"{kind}_y")), int(match.group(f"{kind}_m")), int(match.group(f"{kind}_d"))
+                )
         except ValueError:
-            continue
-    if total is None:
-        # fallback: pick largest number
-        numbers = [float(x.replace(",", "")) for x in re.findall(r"[0-9]+\.[0-9]{2}", text)]
-        if numbers:
-            total = max(numbers)
-    return {"total_amount": total, "tax_amount": tax}
+            return raw
+        return value.isoformat()
+
+
+def _to_float(raw: str, previous: Optional[float]) -> Optional[float]:
+    try:
+        return float(raw.replace(",", ""))
+    except ValueError:
+        return previous
+
+
+_parser = ReceiptParser()
+
+
+def extract_amounts(text: str) -> Dict[str, Optional[float]]:
+    fields = _parser.parse(text)
+    return {"total_amount": fields["total_amount"], "tax_amount": fields["tax_amount"]}
 
 
 def extract_date(text: str) -> Optional[str]:
-    match = DATE_REGEX.search(text)
-    if match:
-        raw = match.group(0)
-        for fmt in ["%Y-%m-%d", "%Y/%m/%d", "%d-%m-%Y", "%d/%m/%Y", "%d %B %Y", "%d %b %Y"]:
-            try:
-                return datetime.strptime(raw, fmt).date().isoformat()
-            except ValueError:
-                continue
-        return raw
-    return None
+    return _parser.parse(text)["date"]
 
 
 def extract_vendor(lines) -> Optional[str]:
-    if not lines:
+    return _parser.parse("\n".join(lines))["vendor"]
+
+
+def find_text_blocks(binary: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    """Bounding boxes ``(x, y, w, h)`` of text lines, top to bottom.
+
+    Dark text on the binarised page is smeared horizontally so the glyphs of
+    a line merge into one blob; tiny blobs (specks, dust) are dropped.
+    """
+
+    ink = cv2.bitwise_not(binary)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(9, binary.shape[1] // 40), 3))
+    merged = cv2.dilate(ink, kernel)
+    contours, _ = cv2.findContours(merged, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    blocks = [cv2.boundingRect(c) for c in contours]
+    min_height = max(4, binary.shape[0] // 400)
+    return sorted((b for b in blocks if b[3] >= min_height and b[2] > b[3]), key=lambda b: b[1])
+
+
+def layout_regions(binary: np.ndarray) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Crop the header and totals regions out of a binarised receipt.
+
+    The header is the text in the top ``HEADER_FRACTION`` of the text's
+    vertical extent, the totals region the bottom ``TOTALS_FRACTION``.
+    Returns ``None`` when no text lines were found.
+    """
+
+    blocks = find_text_blocks(binary)
+    if not blocks:
+        return None
+    top = blocks[0][1]
+    bottom = max(y + h for _, y, _, h in blocks)
+    extent = bottom - top
+
+    def crop(selected: List[Tuple[int, int, int, int]]) -> np.ndarray:
+        pad = max(4, extent // 100)
+        x0 = max(0, min(x for x, _, _, _ in selected) - pad)
+        y0 = max(0, min(y for _, y, _, _ in selected) - pad)
+        x1 = min(binary.shape[1], max(x + w for x, _, w, _ in selected) + pad)
+        y1 = min(binary.shape[0], max(y + h for _, y, _, h in selected) + pad)
+        return binary[y0:y1, x0:x1]
+
+    header = [b for b in blocks if b[1] < top + extent * HEADER_FRACTION] or blocks[:1]
+    totals = [b for b in blocks if b[1] + b[3] > bottom - extent * TOTALS_FRACTION] or blocks[-1:]
+    return crop(header), crop(totals)
+
+
+def ocr_layout(binary: np.ndarray, engine: Optional[OcrEngine] = None) -> Optional[Tuple[str, str]]:
+    """OCR the header and totals regions concurrently; ``None`` if none found."""
+
+    regions = layout_regions(binary)
+    if regions is None:
         return None
-    # Heuristic: first non-empty line that isn't a date or numeric
-    for line in lines[:5]:
-        if len(line.strip()) > 2 and not re.search(r"\d", line):
-            return line.strip()
-    return lines[0].strip()
+    engine = engine or get_engine()
+    header, totals = regions
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        header_text = pool.submit(engine.image_to_string, header, REGION_PSM)
+        totals_text = pool.submit(engine.image_to_string, totals, REGION_PSM, TOTALS_WHITELIST)
+        return header_text.result(), totals_text.result()
+
+
+def ocr_full_text(image_path: str) -> str:
+    return get_engine().image_to_string(preprocess_image(image_path))
 
 
-def process_image(image_path: str) -> Dict[str, Optional[str]]:
-    processed = preprocess_image(image_path)
-    raw_text = pytesseract.image_to_string(processed)
-    lines = [line for line in raw_text.splitlines() if line.strip()]
+def process_image(image: Union[str, np.ndarray], mode: Optional[str] = None) -> Dict[str, Optional[str]]:
+    """OCR and parse a receipt image, given as a path or an in-memory frame.
 
-    amounts = extract_amounts(raw_text)
-    date = extract_date(raw_text)
-    vendor = extract_vendor(lines)
+    In ``layout`` mode only the header and totals regions are recognised;
+    ``raw_text`` then holds just those regions and ``raw_text_partial`` is
+    set so the caller can schedule ``ocr_full_text`` in the background.
+    """
 
-    currency_match = CURRENCY_REGEX.search(raw_text)
-    currency = None
-    if currency_match:
-        symbol = currency_match.group(1)
-        currency = {"$": "USD", "€": "EUR", "£": "GBP"}.get(symbol, symbol)
+    mode = mode or OCR_MODE
+    processed = preprocess_image(image)
+    with timed("ocr"):
+        regions = ocr_layout(processed) if mode == "layout" else None
+        if regions is not None:
+            raw_text = "\n".join(regions)
+        else:
+            raw_text = get_engine().image_to_string(processed)
+    with timed("parse"):
+        fields = _parser.parse(raw_text)
 
     return {
         "id": str(uuid.uuid4()),
-        "date": date,
-        "vendor": vendor,
-        "total_amount": amounts.get("total_amount"),
-        "tax_amount": amounts.get("tax_amount"),
-        "currency": currency,
+        "date": fields["date"],
+        "vendor": fields["vendor"],
+        "total_amount": fields["total_amount"],
+        "tax_amount": fields["tax_amount"],
+        "currency": fields["currency"],
         "payment_method": None,
         "category": None,
         "notes": None,
-        "image_path": image_path,
+        "image_path": image if isinstance(image, str) else None,
         "raw_text": raw_text,
+        "raw_text_partial": regions is not None,
     }
@@ -0,0 +1,241 @@
+"""Pipelined scanning sessions for stacks of receipts.
+
+A ``ScanSession`` runs capture, OCR and persistence as separate stages
+connected by bounded queues: the next receipt is captured while earlier
+ones are OCR'd, and finished receipts are committed in batches with one
+transaction and one ``receipts.csv`` rewrite each. The bounded queues keep
+a fast camera from piling up frames in memory when OCR falls behind. When
+the session ends it reports throughput and how busy each stage was.
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .batch import find_images
+from .camera import capture_frame
+from .capture_service import fetch_frame, preview_stream
+from .jobs import parsed_updates, pending_record
+from .models import export_to_csv, get_cached_ocr, get_receipt, init_db, insert_receipts
+from .ocr import PIPELINE_VERSION, process_image
+from .storage import hash_file
+
+QUEUE_SIZE = 4
+BATCH_SIZE = 10
+BATCH_SECONDS = 5.0
+
+# (image path, sha256, gray frame or None to read the file, seconds spent capturing)
+Capture = Tuple[str, str, Optional[np.ndarray], float]
+
+
+def manual_captures(image_dir: str, prompt: Callable[[str], str] = input) -> Iterator[Capture]:
+    """Capture each time Enter is pressed; stop on ``q`` or end of input."""
+
+    while True:
+        try:
+            if prompt("Enter to capture, q to finish: ").strip().lower() == "q":
+                return
+        except EOFError:
+            return
+        path = os.path.join(image_dir, f"{uuid.uuid4()}.jpg")
+        start = time.perf_counter()
+        digest, frame = capture_frame(path)
+        yield path, digest, frame, time.perf_counter() - start
+
+
+def auto_captures(image_dir: str) -> Iterator[Capture]:
+    """Captures fired by the camera daemon whenever a receipt is held still."""
+
+    for event, _ in preview_stream(os.path.abspath(image_dir)):
+        if event.get("captured"):
+            path = os.path.join(image_dir, os.path.basename(event["captured"]))
+            start = time.perf_counter()
+            frame = fetch_frame(path)
+            yield path, event["sha256"], frame, time.perf_counter() - start
+
+
+def directory_captures(root: str) -> Iterator[Capture]:
+    """Replay images already on disk, e.g. to measure the pipeline without a camera."""
+
+    for path in find_images(root):
+        start = time.perf_counter()
+        digest = hash_file(path)
+        frame = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        yield path, digest, frame, time.perf_counter() - start
+
+
+class ScanSession:
+    def __init__(
+        self,
+        db_path: str = "receipts.db",
+        csv_path: str = "receipts.csv",
+        ocr_workers: Optional[int] = None,
+        batch_size: int = BATCH_SIZE,
+        batch_seconds: float = BATCH_SECONDS,
+        queue_size: int = QUEUE_SIZE,
+    ):
+        self.db_path = db_path
+        self.csv_path = csv_path
+        self.ocr_workers = ocr_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self.to_ocr: "queue.Queue[Optional[Capture]]" = queue.Queue(maxsize=queue_size)
+        self.to_persist: "queue.Queue[Optional[Tuple]]" = queue.Queue(maxsize=queue_size * 2)
+        self.busy = {"capture": 0.0, "ocr": 0.0, "persist": 0.0}
+        self.counts = {"captured": 0, "ingested": 0, "duplicates": 0, "failed": 0}
+        self.lock = threading.Lock()
+
+    def _add(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            self.busy[stage] += seconds
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self.lock:
+            self.counts[key] += n
+
+    def _ocr_worker(self) -> None:
+        while True:
+            item = self.to_ocr.get()
+            if item is None:
+                self.to_persist.put(None)
+                return
+            path, digest, frame, _ = item
+            start = time.perf_counter()
+            try:
+                cached = get_cached_ocr(self.db_path, digest, PIPELINE_VERSION)
+                if cached and cached["receipt_id"] and get_receipt(self.db_path, cached["receipt_id"]):
+                    self._count("duplicates")
+                    continue
+                if cached and cached["result"]:
+                    result = json.loads(cached["result"])
+                else:
+                    updates = parsed_updates(process_image(frame if frame is not None else path, mode="full"))
+                    updates.pop("updated_at")
+                    result = updates
+            except Exception as exc:  # one bad capture must not end the session
+                print(f"  failed: {path}: {exc}")
+                self._count("failed")
+                continue
+            finally:
+                self._add("ocr", time.perf_counter() - start)
+            self.to_persist.put((path, digest, result))
+
+    def _persist_worker(self) -> None:
+        records: List[Dict[str, object]] = []
+        cache_entries = []
+        seen_hashes = set()
+        running = self.ocr_workers
+        oldest = None
+
+        def flush() -> None:
+            if not records:
+                return
+            start = time.perf_counter()
+            insert_receipts(self.db_path, records, cache_entries)
+            export_to_csv(self.db_path, self.csv_path)
+            self._add("persist", time.perf_counter() - start)
+            self._count("ingested", len(records))
+            records.clear()
+            cache_entries.clear()
+
+        while running:
+            timeout = None if oldest is None else max(0.0, oldest + self.batch_seconds - time.monotonic())
+            try:
+                item = self.to_persist.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                running -= 1
+            elif item:
+                path, digest, result = item
+                if digest in seen_hashes:
+                    self._count("duplicates")
+                else:
+                    seen_hashes.add(digest)
+                    receipt_id = str(uuid.uuid4())
+                    record = pending_record(receipt_id, os.path.relpath(path, start="."))
+                    record.update(result)
+                    records.append(record)
+                    cache_entries.append((digest, PIPELINE_VERSION, receipt_id, result))
+                    oldest = oldest or time.monotonic()
+            if len(records) >= self.batch_size or (oldest and time.monotonic() - oldest >= self.batch_seconds):
+                flush()
+                oldest = None
+        flush()
+
+    def run(self, captures: Iterable[Capture], limit: Optional[int] = None) -> Dict[str, float]:
+        """Feed ``captures`` through the pipeline until exhausted, ``limit`` or Ctrl-C."""
+
+        init_db(self.db_path)
+        workers = [threading.Thread(target=self._ocr_worker, daemon=True) for _ in range(self.ocr_workers)]
+        workers.append(threading.Thread(target=self._persist_worker, daemon=True))
+        for worker in workers:
+            worker.start()
+
+        start = time.perf_counter()
+        try:
+            for capture in captures:
+                self._add("capture", capture[3])
+                self._count("captured")
+                # Blocks when OCR is behind, which is the back-pressure we want.
+                self.to_ocr.put(capture)
+                if limit is not None and self.counts["captured"] >= limit:
+                    break
+        except KeyboardInterrupt:
+            print("Stopping; finishing receipts already captured.")
+        finally:
+            for _ in range(self.ocr_workers):
+                self.to_ocr.put(None)
+            for worker in workers:
+                worker.join()
+        return self.report(time.perf_counter() - start)
+
+    def report(self, elapsed: float) -> Dict[str, float]:
+        processed = self.counts["ingested"] + self.counts["duplicates"]
+        summary: Dict[str, float] = dict(self.counts)
+        summary["seconds"] = round(elapsed, 2)
+        summary["receipts_per_minute"] = round(60 * processed / elapsed, 1) if elapsed else 0.0
+        capacity = {"capture": 1, "ocr": self.ocr_workers, "persist": 1}
+        for stage, busy in self.busy.items():
+            summary[f"{stage}_utilization"] = round(busy / (elapsed * capacity[stage]), 3) if elapsed else 0.0
+        return summary
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Scan a stack of receipts with capture, OCR and saving overlapped.")
+    parser.add_argument("--source", choices=("manual", "auto", "directory"), default="auto")
+    parser.add_argument("--directory", help="images to replay with --source directory")
+    parser.add_argument("--image-dir", default="app/captured_receipts")
+    parser.add_argument("--db", default="receipts.db")
+    parser.add_argument("--csv", default="receipts.csv")
+    parser.add_argument("--ocr-workers", type=int, default=None, help="default: CPU cores minus one")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many captures")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.image_dir, exist_ok=True)
+    if args.source == "directory":
+        if not args.directory:
+            parser.error("--source directory needs --directory")
+        captures = directory_captures(args.directory)
+    elif args.source == "manual":
+        captures = manual_captures(args.image_dir)
+    else:
+        print("Hold each receipt still under the camera; Ctrl-C to finish.")
+        captures = auto_captures(args.image_dir)
+
+    session = ScanSession(args.db, args.csv, args.ocr_workers, args.batch_size)
+    summary = session.run(captures, args.limit)
+    print(
+        f"Done: {summary['ingested']} ingested, {summary['duplicates']} duplicate(s), {summary['failed']} failed "
+        f"in {summary['seconds']}s ({summary['receipts_per_minute']} receipts/min)"
+    )
+    for stage in ("capture", "ocr", "persist"):
+        print(f"  {stage:<8} utilization {summary[f'{stage}_utilization']:.0%}")
@@ -0,0 +1,28 @@
+"""Image storage helpers.
+
+Images are hashed while they are written so duplicate uploads and captures
+can be recognised without reading the file a second time.
+"""
+import hashlib
+from typing import BinaryIO
+
+CHUNK_SIZE = 64 * 1024
+
+
+def save_stream(stream: BinaryIO, path: str) -> str:
+    """Copy ``stream`` to ``path`` and return the SHA-256 hex digest of its bytes."""
+
+    digest = hashlib.sha256()
+    with open(path, "wb") as out:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,5 @@
+from app.batch import main
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Shared helpers for the benchmark scripts.
+
+Run benchmarks from the repository root, e.g.
+``python -m benchmarks.bench_ocr_engine``.
+"""
+import resource
+import statistics
+import time
+from typing import Callable, Dict, List, Sequence
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+SAMPLE_LINES = [
+    "CORNER GROCERY",
+    "12 Main Street",
+    "2024-03-18 14:02",
+    "Milk 2L            3.49",
+    "Bread              2.99",
+    "Apples 1kg         4.25",
+    "Subtotal          10.73",
+    "Tax                0.86",
+    "TOTAL            $11.59",
+    "VISA ****1234",
+]
+
+
+def render_receipt(lines: Sequence[str] = SAMPLE_LINES, width: int = 640, font_size: int = 28) -> np.ndarray:
+    """Render ``lines`` as black text on white paper and return a gray array."""
+
+    font = ImageFont.load_default(size=font_size)
+    line_height = int(font_size * 1.5)
+    height = line_height * (len(lines) + 2)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((30, line_height * (i + 1)), line, fill=0, font=font)
+    return np.asarray(image)
+
+
+def synthetic_photo(width: int = 4032, height: int = 3024, paper_fraction: float = 0.3) -> np.ndarray:
+    """A phone-style BGR photo: a receipt lying on a dark, noisy table.
+
+    Defaults to 12MP with the paper covering ``paper_fraction`` of the frame.
+    """
+
+    rng = np.random.default_rng(0)
+    table = rng.normal(70, 18, size=(height, width)).astype(np.float32)
+    table = cv2.GaussianBlur(table, (0, 0), 3)
+    frame = np.clip(table, 0, 255).astype(np.uint8)
+
+    receipt = render_receipt(SAMPLE_LINES * 3)
+    paper_h = int((height * width * paper_fraction * receipt.shape[0] / receipt.shape[1]) ** 0.5)
+    paper_h = min(paper_h, height - 2)
+    paper_w = min(int(paper_h * receipt.shape[1] / receipt.shape[0]), width - 2)
+    paper = cv2.resize(receipt, (paper_w, paper_h), interpolation=cv2.INTER_LINEAR)
+    y = (height - paper_h) // 2
+    x = (width - paper_w) // 2
+    frame[y : y + paper_h, x : x + paper_w] = paper
+    return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MiB (Linux units)."""
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def time_calls(fn: Callable[[], object], repeat: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(samples: Sequence[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+    }
+
+
+def print_row(label: str, stats: Dict[str, float]) -> None:
+    print(
+        f"{label:<28} n={stats['n']:<4} mean={stats['mean_ms']:8.2f}ms "
+        f"p50={stats['p50_ms']:8.2f}ms p95={stats['p95_ms']:8.2f}ms"
+    )
@@ -0,0 +1,221 @@
+"""Frozen copies of superseded pipeline stages, kept as benchmark baselines."""
+import csv
+import re
+import sqlite3
+from datetime import datetime
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+from app.models import decode_cursor, encode_cursor, pack_text, unpack_text
+
+
+def legacy_get_connection(db_path: str) -> sqlite3.Connection:
+    """``get_connection`` before pooling: a fresh connection per call, default pragmas.
+
+    The original callers closed it explicitly; here it is closed when the
+    last reference goes away, at the same point. The OCR text functions are
+    registered because today's triggers call them.
+    """
+
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.create_function("pack_text", 1, pack_text, deterministic=True)
+    conn.create_function("unpack_text", 1, unpack_text, deterministic=True)
+    return conn
+
+
+def legacy_export_to_csv(db_path: str, csv_path: str, fields, table: str = "receipts") -> None:
+    """``export_to_csv`` before it became incremental: rewrite everything.
+
+    Pass a ``table`` with the OCR text inline for it to be written out as it was then.
+    """
+
+    conn = legacy_get_connection(db_path)
+    rows = conn.execute(f"SELECT * FROM {table} ORDER BY created_at DESC").fetchall()
+    conn.close()
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict(row))
+
+
+def legacy_import_from_csv(db_path: str, csv_path: str, fields) -> None:
+    """``import_from_csv`` before streaming: per-row SQL building and ``execute``, one transaction."""
+
+    conn = legacy_get_connection(db_path)
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        with conn:
+            for row in reader:
+                placeholders = ",".join([":" + key for key in fields])
+                conn.execute(
+                    f"INSERT OR REPLACE INTO receipts ({','.join(fields)}) VALUES ({placeholders})",
+                    row,
+                )
+    conn.close()
+
+
+def legacy_search(conn: sqlite3.Connection, search: str, per_page: int = 10, table: str = "receipts"):
+    """``list_receipts`` search before full-text indexing: substring LIKE, newest first.
+
+    ``table`` must have the OCR text in a ``raw_text`` column, as ``receipts`` did then.
+    """
+
+    where = " WHERE (vendor LIKE ? OR raw_text LIKE ?)"
+    params = [f"%{search}%", f"%{search}%"]
+    total = conn.execute(f"SELECT COUNT(*) FROM {table}{where}", params).fetchone()[0]
+    rows = conn.execute(f"SELECT * FROM {table}{where} ORDER BY date DESC LIMIT ?", [*params, per_page]).fetchall()
+    return rows, total
+
+
+def legacy_receipts_page(conn: sqlite3.Connection, cursor: Optional[str] = None, per_page: int = 10):
+    """``list_receipts`` browsing, without the total, before the OCR text moved out of ``receipts``.
+
+    Every column of each receipt is read, ``raw_text`` included.
+    """
+
+    position = decode_cursor(cursor) if cursor else {}
+    backwards = "before" in position
+    key = position.get("before" if backwards else "after")
+    where = f" WHERE (receipts.date, receipts.id) {'>' if backwards else '<'} (?, ?)" if key is not None else ""
+    direction = "ASC" if backwards else "DESC"
+    rows = conn.execute(
+        f"SELECT receipts.*, NULL AS snippet FROM receipts{where} "
+        f"ORDER BY receipts.date {direction}, receipts.id {direction} LIMIT ?",
+        [*(key or ()), per_page + 1],
+    ).fetchall()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    page = {"receipts": rows, "total": None, "next": None, "prev": None, "last": None}
+    if rows:
+        if (more if backwards else key is not None):
+            page["prev"] = encode_cursor({"before": [rows[0]["date"], rows[0]["id"]]})
+        if (key is not None if backwards else more):
+            page["next"] = encode_cursor({"after": [rows[-1]["date"], rows[-1]["id"]]})
+            page["last"] = encode_cursor({"before": None})
+    return page
+
+
+def legacy_stats(db_path: str) -> Dict[str, object]:
+    """``stats`` before the rollups: full COUNT and SUM plus a sort, on a fresh connection."""
+
+    conn = legacy_get_connection(db_path)
+    total_receipts = conn.execute("SELECT COUNT(*) FROM receipts").fetchone()[0]
+    total_spent = conn.execute("SELECT SUM(total_amount) FROM receipts").fetchone()[0] or 0
+    recent = conn.execute("SELECT * FROM receipts ORDER BY created_at DESC LIMIT 5").fetchall()
+    conn.close()
+    return {"count": total_receipts, "spent": total_spent, "recent": recent}
+
+
+def legacy_list_page(conn: sqlite3.Connection, page: int, per_page: int = 10):
+    """``list_receipts`` before keyset pagination: COUNT(*) and LIMIT/OFFSET."""
+
+    total = conn.execute("SELECT COUNT(*) FROM receipts").fetchone()[0]
+    rows = conn.execute(
+        "SELECT * FROM receipts ORDER BY date DESC LIMIT ? OFFSET ?", (per_page, (page - 1) * per_page)
+    ).fetchall()
+    return rows, total
+
+
+def legacy_preprocess(image_path: str) -> np.ndarray:
+    """``preprocess_image`` as it was before ROI cropping and the new deskew."""
+
+    image = cv2.imread(image_path)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    blur = cv2.GaussianBlur(gray, (3, 3), 0)
+    _, thresh = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return legacy_deskew(thresh)
+
+
+def legacy_deskew_angle(thresh: np.ndarray) -> float:
+    coords = np.column_stack(np.where(thresh > 0))
+    angle = cv2.minAreaRect(coords)[-1] if coords.size else 0
+    if angle < -45:
+        angle = -(90 + angle)
+    else:
+        angle = -angle
+    return angle
+
+
+def legacy_deskew(thresh: np.ndarray) -> np.ndarray:
+    angle = legacy_deskew_angle(thresh)
+    (h, w) = thresh.shape[:2]
+    center = (w // 2, h // 2)
+    M = cv2.getRotationMatrix2D(center, angle, 1.0)
+    return cv2.warpAffine(thresh, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+
+
+CURRENCY_REGEX = re.compile(r"([$€£]|USD|EUR|GBP)")
+DATE_REGEX = re.compile(
+    r"((?:\d{4}[/-]\d{2}[/-]\d{2})|(?:\d{2}[/-]\d{2}[/-]\d{4})|(?:\d{1,2}\s+[A-Za-z]{3,9}\s+\d{4}))"
+)
+TOTAL_REGEX = re.compile(r"(total|amount due|grand total)[:\s]*([\d.,]+)", re.IGNORECASE)
+TAX_REGEX = re.compile(r"(tax|vat)[:\s]*([\d.,]+)", re.IGNORECASE)
+
+
+def extract_amounts(text: str) -> Dict[str, Optional[float]]:
+    total = None
+    tax = None
+    for match in TOTAL_REGEX.finditer(text):
+        try:
+            total = float(match.group(2).replace(",", ""))
+        except ValueError:
+            continue
+    for match in TAX_REGEX.finditer(text):
+        try:
+            tax = float(match.group(2).replace(",", ""))
+        except ValueError:
+            continue
+    if total is None:
+        # fallback: pick largest number
+        numbers = [float(x.replace(",", "")) for x in re.findall(r"[0-9]+\.[0-9]{2}", text)]
+        if numbers:
+            total = max(numbers)
+    return {"total_amount": total, "tax_amount": tax}
+
+
+def extract_date(text: str) -> Optional[str]:
+    match = DATE_REGEX.search(text)
+    if match:
+        raw = match.group(0)
+        for fmt in ["%Y-%m-%d", "%Y/%m/%d", "%d-%m-%Y", "%d/%m/%Y", "%d %B %Y", "%d %b %Y"]:
+            try:
+                return datetime.strptime(raw, fmt).date().isoformat()
+            except ValueError:
+                continue
+        return raw
+    return None
+
+
+def extract_vendor(lines) -> Optional[str]:
+    if not lines:
+        return None
+    # Heuristic: first non-empty line that isn't a date or numeric
+    for line in lines[:5]:
+        if len(line.strip()) > 2 and not re.search(r"\d", line):
+            return line.strip()
+    return lines[0].strip()
+
+
+def legacy_parse(raw_text: str) -> Dict[str, object]:
+    """The field extraction ``process_image`` did before ``ReceiptParser``."""
+
+    lines = [line for line in raw_text.splitlines() if line.strip()]
+    amounts = extract_amounts(raw_text)
+    currency_match = CURRENCY_REGEX.search(raw_text)
+    currency = None
+    if currency_match:
+        symbol = currency_match.group(1)
+        currency = {"$": "USD", "€": "EUR", "£": "GBP"}.get(symbol, symbol)
+    return {
+        "date": extract_date(raw_text),
+        "vendor": extract_vendor(lines),
+        "total_amount": amounts.get("total_amount"),
+        "tax_amount": amounts.get("tax_amount"),
+        "currency": currency,
+    }
@@ -0,0 +1,83 @@
+"""Burst capture: focus scoring cost vs the retries it avoids.
+
+Simulates hand-held captures of a receipt where some frames are smeared by
+camera shake (random-length motion blur), scores every frame with
+``focus_score`` and keeps the sharpest of each burst. A capture whose kept
+frame is blurred past ``--usable-blur`` pixels counts as an OCR retry. The
+expected time per scan weighs the extra frames and scoring of a burst
+against the full capture + OCR cycle a retry costs.
+"""
+import argparse
+import random
+
+import cv2
+import numpy as np
+
+from app.capture_service import focus_score, sharpest_frame
+from benchmarks._common import print_row, summarize, synthetic_photo, time_calls
+
+
+def motion_blur(image: np.ndarray, length: float, angle: float) -> np.ndarray:
+    size = max(1, int(round(length)))
+    if size < 2:
+        return image
+    kernel = np.zeros((size, size), dtype=np.float32)
+    kernel[size // 2, :] = 1.0
+    M = cv2.getRotationMatrix2D((size / 2 - 0.5, size / 2 - 0.5), angle, 1.0)
+    kernel = cv2.warpAffine(kernel, M, (size, size))
+    return cv2.filter2D(image, -1, kernel / kernel.sum())
+
+
+def shake_length(rng: random.Random, shake_rate: float) -> float:
+    return rng.uniform(6, 20) if rng.random() < shake_rate else rng.uniform(0, 3)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trials", type=int, default=200)
+    parser.add_argument("--bursts", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--shake-rate", type=float, default=0.3, help="probability a frame is smeared")
+    parser.add_argument("--usable-blur", type=float, default=5.0, help="blur length (px) OCR still copes with")
+    parser.add_argument("--frame-interval-ms", type=float, default=100.0, help="time between still frames")
+    parser.add_argument("--retry-cost-ms", type=float, default=6000.0, help="capture + OCR + user re-aim")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    frame = synthetic_photo(1536, 864)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    big = cv2.cvtColor(synthetic_photo(), cv2.COLOR_BGR2GRAY)
+    print_row("focus_score 1536x864", summarize(time_calls(lambda: focus_score(gray), 50)))
+    print_row("focus_score 4032x3024", summarize(time_calls(lambda: focus_score(big), 20)))
+    print_row("sharpest_frame 3x BGR", summarize(time_calls(lambda: sharpest_frame([frame] * 3), 20)))
+    score_ms = summarize(time_calls(lambda: sharpest_frame([frame]), 20))["mean_ms"]
+
+    # Pre-render a pool of frames at known blur lengths to draw bursts from.
+    rng = random.Random(args.seed)
+    noise = np.random.default_rng(args.seed)
+    pool = []
+    for _ in range(60):
+        length = shake_length(rng, args.shake_rate)
+        blurred = motion_blur(gray, length, rng.uniform(0, 180))
+        noisy = np.clip(blurred + noise.normal(0, 3, blurred.shape), 0, 255).astype(np.uint8)
+        pool.append((length, noisy))
+
+    print(f"\nshake rate {args.shake_rate:.0%}, usable blur <= {args.usable_blur}px, {args.trials} trials")
+    for n in args.bursts:
+        retries = picked_sharpest = 0
+        for _ in range(args.trials):
+            burst = [pool[rng.randrange(len(pool))] for _ in range(n)]
+            scores = [focus_score(image) for _, image in burst]
+            chosen = burst[int(np.argmax(scores))][0]
+            retries += chosen > args.usable_blur
+            picked_sharpest += chosen == min(length for length, _ in burst)
+        retry_rate = retries / args.trials
+        overhead = (n - 1) * args.frame_interval_ms + n * score_ms
+        expected = overhead + retry_rate * args.retry_cost_ms
+        print(
+            f"burst={n}: retry rate {retry_rate:6.1%}, picked sharpest {picked_sharpest / args.trials:6.1%}, "
+            f"burst overhead {overhead:6.1f}ms, expected cost per scan {expected:7.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Cost of keeping receipts.csv current after one new receipt, by archive size.
+
+``legacy`` rewrites the whole file as every write used to; ``incremental``
+is the current ``export_to_csv``, which appends the new row. Receipts carry
+about 1 KB of OCR text, like real ones.
+"""
+import argparse
+import os
+import tempfile
+
+from app import models
+from app.jobs import pending_record
+from benchmarks._common import print_row, summarize, time_calls
+from benchmarks._legacy import legacy_export_to_csv
+
+RAW_TEXT = "CORNER GROCERY\n" + "Milk 2L            3.49\n" * 40
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            db_path = os.path.join(tmp, f"{size}.db")
+            csv_path = os.path.join(tmp, f"{size}.csv")
+            models.init_db(db_path)
+            models.insert_receipts(
+                db_path, [dict(pending_record(f"r{i}", f"{i}.jpg"), raw_text=RAW_TEXT) for i in range(size)]
+            )
+            models.export_to_csv(db_path, csv_path)
+            counter = iter(range(10**9))
+
+            def insert_then(export) -> None:
+                record = dict(pending_record(f"new-{next(counter)}", "x.jpg"), raw_text=RAW_TEXT)
+                models.insert_receipt(db_path, record)
+                export()
+
+            legacy = time_calls(
+                lambda: insert_then(lambda: legacy_export_to_csv(db_path, csv_path + ".legacy", models.RECEIPT_FIELDS)),
+                args.repeat,
+            )
+            incremental = time_calls(lambda: insert_then(lambda: models.export_to_csv(db_path, csv_path)), args.repeat)
+            print_row(f"{size} rows, legacy", summarize(legacy))
+            print_row(f"{size} rows, incremental", summarize(incremental))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Dashboard latency: scanning ``receipts`` vs the trigger-maintained rollups.
+
+``legacy`` is ``stats`` as it was: a fresh connection, a full COUNT(*) and
+SUM(total_amount), and the five most recent receipts. ``rollups`` is the
+current ``stats``, which also returns per-category and per-month figures.
+The write side of the trade is the cost of the rollup triggers on a
+single-receipt insert, measured against the same database with the rollup
+triggers dropped.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from app import models
+from app.jobs import pending_record
+from benchmarks._common import print_row, summarize, time_calls
+from benchmarks._legacy import legacy_stats
+
+CHUNK = 50000
+CATEGORIES = ["Groceries", "Dining", "Transport", "Utilities", "Health", "Other"]
+
+
+def seed(db_path: str, rows: int) -> None:
+    rng = random.Random(0)
+    for start in range(0, rows, CHUNK):
+        records = []
+        for i in range(start, min(rows, start + CHUNK)):
+            record = pending_record(f"r-{i:07d}", f"app/captured_receipts/{i}.jpg")
+            record.update(
+                date=f"20{rng.randint(18, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                category=rng.choice(CATEGORIES),
+                total_amount=round(rng.uniform(1, 300), 2),
+                tax_amount=round(rng.uniform(0, 20), 2),
+            )
+            records.append(record)
+        models.insert_receipts(db_path, records)
+
+
+def insert_samples(db_path: str, repeat: int):
+    def insert() -> None:
+        record = pending_record(f"new-{time.perf_counter_ns()}", "x.jpg")
+        record.update(category="Dining", total_amount=12.5)
+        models.insert_receipt(db_path, record)
+
+    return time_calls(insert, repeat)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "receipts.db")
+            models.init_db(db_path)
+            seed(db_path, size)
+            print(f"\n{size} receipts")
+            print_row("stats, legacy", summarize(time_calls(lambda: legacy_stats(db_path), args.repeat)))
+            print_row("stats, rollups", summarize(time_calls(lambda: models.stats(db_path), args.repeat)))
+            print_row("insert, with rollups", summarize(insert_samples(db_path, args.repeat * 5)))
+            conn = models.get_connection(db_path)
+            with conn:
+                for trigger in ("insert", "update", "delete"):
+                    conn.execute(f"DROP TRIGGER receipts_rollup_{trigger}")
+            print_row("insert, without rollups", summarize(insert_samples(db_path, args.repeat * 5)))
+            models.close_connections()
+
+
+if __name__ == "__main__":
+    main()
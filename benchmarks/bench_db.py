@@ -0,0 +1,97 @@
+"""Database call latency: per-call connections vs pooled WAL connections.
+
+Several processes (standing in for gunicorn workers) run a mix of
+``list_receipts``, ``get_receipt`` and ``insert_receipt`` against one
+database at the same time. ``legacy`` opens a fresh connection per call
+with the default rollback journal, as ``models`` did before pooling;
+``pooled`` uses the current per-thread connections with WAL and the tuned
+pragmas.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from app import models
+from app.jobs import pending_record
+from benchmarks._common import print_row, summarize
+from benchmarks._legacy import legacy_get_connection
+
+OPS = (("list", 0.5), ("get", 0.4), ("insert", 0.1))
+
+
+def seed(db_path: str, mode: str, rows: int) -> List[str]:
+    models.init_db(db_path)
+    rng = random.Random(0)
+    records = []
+    for i in range(rows):
+        record = pending_record(f"seed-{i}", f"app/captured_receipts/{i}.jpg")
+        record.update(vendor=f"Vendor {i % 50}", date=f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}")
+        records.append(record)
+    models.insert_receipts(db_path, records)
+    if mode == "legacy":
+        models.close_connections()
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode = DELETE")
+        conn.close()
+    return [record["id"] for record in records]
+
+
+def worker(args: Tuple[str, str, List[str], float, int]) -> Dict[str, List[float]]:
+    db_path, mode, ids, duration, seed_value = args
+    if mode == "legacy":
+        models.get_connection = legacy_get_connection
+    rng = random.Random(seed_value)
+    names = [name for name, _ in OPS]
+    weights = [weight for _, weight in OPS]
+    samples: Dict[str, List[float]] = {name: [] for name in names}
+    errors = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        op = rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            if op == "list":
+                models.list_receipts(db_path)
+            elif op == "get":
+                models.get_receipt(db_path, rng.choice(ids))
+            else:
+                models.insert_receipt(db_path, pending_record(f"{os.getpid()}-{start}", "x.jpg"))
+        except sqlite3.OperationalError:
+            errors += 1
+            continue
+        samples[op].append(time.perf_counter() - start)
+    samples["errors"] = [errors]
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("legacy", "pooled"):
+            db_path = os.path.join(tmp, f"{mode}.db")
+            ids = seed(db_path, mode, args.rows)
+            jobs = [(db_path, mode, ids, args.seconds, i) for i in range(args.workers)]
+            with multiprocessing.Pool(args.workers) as pool:
+                results = pool.map(worker, jobs)
+            total_ops = 0
+            print(f"{mode}: {args.workers} worker process(es), {args.rows} receipts")
+            for name, _ in OPS:
+                merged = [sample for result in results for sample in result[name]]
+                total_ops += len(merged)
+                print_row(f"  {name}", summarize(merged))
+            errors = sum(result["errors"][0] for result in results)
+            print(f"  {total_ops / args.seconds:.0f} ops/s, {errors} 'database is locked' error(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Receipt download cost: export to disk then send vs streaming from the database.
+
+Fills a database with synthetic receipts (OCR-style text from
+``benchmarks.synthetic``) and downloads them through the Flask app, timing
+the first byte and the whole body, then downloading again under
+``tracemalloc`` for the peak Python memory (tracing slows it down too much
+to time the same run). ``legacy`` is the old ``/export/csv``: rewrite the CSV from
+a ``fetchall`` (run on a copy of the table with the OCR text inline, as it
+was then) and send the file. The others stream ``/export/<fmt>`` chunk by
+chunk, as CSV, gzipped CSV, NDJSON and filtered to one category.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterable, List
+
+from app import create_app, models
+from app.jobs import pending_record
+from benchmarks._legacy import legacy_export_to_csv
+from benchmarks.synthetic import receipt_fields, receipt_lines
+
+CHUNK = 20000
+CATEGORIES = ["Groceries", "Dining", "Transport", "Utilities", "Other"]
+
+
+def seed(db_path: str, rows: int) -> None:
+    rng = random.Random(0)
+    for start in range(0, rows, CHUNK):
+        records: List[dict] = []
+        for i in range(start, min(rows, start + CHUNK)):
+            fields = receipt_fields(rng, max_items=12)
+            record = pending_record(f"r-{i:07d}", f"app/captured_receipts/{i}.jpg")
+            record.update(
+                vendor=fields["vendor"],
+                date=fields["date"],
+                total_amount=fields["total_amount"],
+                category=rng.choice(CATEGORIES),
+                raw_text="\n".join(receipt_lines(fields)),
+            )
+            records.append(record)
+        models.insert_receipts(db_path, records)
+
+
+def measure(body: Callable[[], Iterable[bytes]]) -> Dict[str, float]:
+    """Seconds to the first chunk and to the end, bytes, and peak traced memory."""
+
+    start = time.perf_counter()
+    first = None
+    size = 0
+    for chunk in body():
+        if first is None:
+            first = time.perf_counter() - start
+        size += len(chunk)
+    total = time.perf_counter() - start
+    tracemalloc.start()
+    for _ in body():
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"first": first or total, "total": total, "bytes": size, "peak": peak}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "receipts.db")
+            csv_path = os.path.join(tmp, "receipts.csv")
+            models.init_db(db_path)
+            seed(db_path, size)
+            conn = models.get_connection(db_path)
+            with conn:
+                conn.execute(
+                    "CREATE TABLE legacy_receipts AS SELECT receipts.*, unpack_text(data) AS raw_text FROM receipts "
+                    "LEFT JOIN receipt_artifacts ON receipt_id = receipts.id AND kind = 'raw_text'"
+                )
+            client = create_app({"DATABASE_PATH": db_path, "CSV_PATH": csv_path}).test_client()
+
+            def legacy() -> Iterable[bytes]:
+                legacy_export_to_csv(db_path, csv_path, models.RECEIPT_FIELDS, table="legacy_receipts")
+                with open(csv_path, "rb") as f:
+                    yield from iter(lambda: f.read(64 * 1024), b"")
+
+            def streamed(url: str) -> Callable[[], Iterable[bytes]]:
+                def body() -> Iterable[bytes]:
+                    response = client.get(url, buffered=False)
+                    try:
+                        yield from response.iter_encoded()
+                    finally:
+                        response.close()
+
+                return body
+
+            print(f"\n{size} receipts")
+            for label, body in (
+                ("legacy, rewrite + send", legacy),
+                ("stream csv", streamed("/export/csv")),
+                ("stream csv, gzip", streamed("/export/csv?gzip=1")),
+                ("stream ndjson", streamed("/export/ndjson")),
+                ("stream csv, one category", streamed("/export/csv?category=Dining")),
+            ):
+                result = measure(body)
+                print(
+                    f"{label:<26} first byte {result['first'] * 1000:8.1f}ms  total {result['total']:6.2f}s  "
+                    f"{result['bytes'] / 2**20:7.1f} MiB  peak memory {result['peak'] / 2**20:7.1f} MiB"
+                )
+            models.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Bulk CSV import throughput and memory: per-row execute vs streamed batches.
+
+Writes a ``receipts.csv``-style file of synthetic receipts (OCR text from
+``benchmarks.synthetic``), then imports it into a fresh database with the
+full set of triggers (search index, rollups, CSV export state) in place.
+``legacy`` is the original ``import_from_csv``: one ``execute`` per row with
+the SQL rebuilt each time, inside a single transaction; it now writes only
+the ``receipts`` columns, leaving out the compressed OCR text that the
+current import also stores. ``batched`` is the
+current streaming import at several batch sizes. Each run happens in its own
+process so its peak RSS can be reported.
+"""
+import argparse
+import csv
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+from typing import Dict
+
+from app import models
+from benchmarks._legacy import legacy_import_from_csv
+from benchmarks.synthetic import receipt_fields, receipt_lines
+
+
+def write_csv(path: str, rows: int) -> None:
+    rng = random.Random(0)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(models.RECEIPT_FIELDS)
+        for i in range(rows):
+            fields = receipt_fields(rng, max_items=12)
+            writer.writerow([
+                f"r-{i:07d}", fields["date"], fields["vendor"], fields["total_amount"], fields["tax_amount"],
+                fields["currency"], "VISA", rng.choice(["Groceries", "Dining", "Transport"]), "",
+                f"app/captured_receipts/{i}.jpg", "\n".join(receipt_lines(fields)),
+                "2024-01-01T00:00:00", "2024-01-01T00:00:00",
+            ])
+
+
+def run(args) -> Dict[str, float]:
+    mode, csv_path, db_path, batch_size = args
+    models.init_db(db_path)
+    start = time.perf_counter()
+    if mode == "legacy":
+        legacy_import_from_csv(db_path, csv_path, models.RECEIPT_COLUMNS)
+    else:
+        models.import_from_csv(db_path, csv_path, batch_size)
+    elapsed = time.perf_counter() - start
+    rows = models.get_connection(db_path).execute("SELECT COUNT(*) FROM receipts").fetchone()[0]
+    return {"seconds": elapsed, "rows": rows, "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[500, 5000, 50000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "import.csv")
+        write_csv(csv_path, args.rows)
+        print(f"{args.rows} rows, {os.path.getsize(csv_path) / 2**20:.0f} MiB CSV")
+        runs = [("legacy", 0)] + [("batched", size) for size in args.batch_sizes]
+        ctx = multiprocessing.get_context("spawn")
+        for mode, batch_size in runs:
+            db_path = os.path.join(tmp, f"{mode}-{batch_size}.db")
+            with ctx.Pool(1) as pool:
+                result = pool.apply(run, ((mode, csv_path, db_path, batch_size),))
+            label = mode if mode == "legacy" else f"batched, {batch_size} per commit"
+            print(
+                f"{label:<28} {result['rows'] / result['seconds']:8,.0f} rows/s  "
+                f"{result['seconds']:6.1f}s  peak RSS {result['rss_mb']:6.1f} MiB"
+            )
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""End-to-end OCR latency per receipt: full-page pass vs layout mode.
+
+Layout mode finds text lines, then OCRs only the header and totals regions
+concurrently (PSM 6, character whitelist for the totals). Receipts of
+several lengths are rendered so the saving can be seen growing with the
+number of item lines. Requires a working Tesseract install.
+"""
+import argparse
+import os
+import tempfile
+
+import cv2
+
+from app import ocr
+from benchmarks._common import print_row, render_receipt, summarize, time_calls
+from benchmarks.bench_parser import ITEMS
+
+
+def receipt_lines(items: int):
+    lines = ["CORNER GROCERY", "12 Main Street", "2024-03-18 14:02"]
+    lines += [f"{ITEMS[i % len(ITEMS)]:<20} {1 + i % 9}.{i % 100:02d}" for i in range(items)]
+    lines += ["Subtotal          42.10", "Tax                3.37", "TOTAL             45.47", "VISA ****1234"]
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--items", type=int, nargs="+", default=[5, 20, 60])
+    args = parser.parse_args()
+
+    print(f"engine: {ocr.get_engine().name}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for items in args.items:
+            path = os.path.join(tmp, f"receipt_{items}.png")
+            cv2.imwrite(path, render_receipt(receipt_lines(items)))
+            means = {}
+            for mode in ("full", "layout"):
+                stats = summarize(time_calls(lambda: ocr.process_image(path, mode=mode), args.repeat))
+                means[mode] = stats["mean_ms"]
+                print_row(f"{items} items / {mode}", stats)
+                fields = ocr.process_image(path, mode=mode)
+                print(f"{'':<28} vendor={fields['vendor']!r} date={fields['date']} "
+                      f"total={fields['total_amount']} tax={fields['tax_amount']}")
+            print(f"{'':<28} layout saves {means['full'] - means['layout']:.0f}ms "
+                  f"({1 - means['layout'] / means['full']:.0%}) per receipt")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Per-call overhead of the OCR engines.
+
+A near-empty image isolates the fixed cost of a call (temp PNG, fork of the
+``tesseract`` binary and traineddata load for pytesseract; just a
+SetImage/Recognize for the warm tesserocr handle). A rendered receipt shows
+what that overhead means for a realistic call.
+"""
+import argparse
+
+import numpy as np
+
+from app import ocr
+from benchmarks._common import print_row, render_receipt, summarize, time_calls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    tiny = np.full((32, 64), 255, dtype=np.uint8)
+    receipt = render_receipt()
+
+    engines = [ocr.PytesseractEngine()]
+    if ocr.tesserocr is not None:
+        engines.append(ocr.TesserocrEngine())
+    else:
+        print("tesserocr not installed; only the pytesseract fallback is measured")
+
+    results = {}
+    for engine in engines:
+        for label, image in (("blank", tiny), ("receipt", receipt)):
+            stats = summarize(time_calls(lambda: engine.image_to_string(image), args.repeat))
+            results[(engine.name, label)] = stats
+            print_row(f"{engine.name}/{label}", stats)
+        engine.close()
+
+    if len(engines) == 2:
+        for label in ("blank", "receipt"):
+            saved = results[("pytesseract", label)]["mean_ms"] - results[("tesserocr", label)]["mean_ms"]
+            print(f"overhead saved per call ({label}): {saved:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
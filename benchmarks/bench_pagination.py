@@ -0,0 +1,71 @@
+"""Receipt list latency by page depth: LIMIT/OFFSET vs keyset cursors.
+
+``legacy`` counts every receipt and skips ``OFFSET`` rows to reach a page,
+as ``list_receipts`` did before cursors; ``keyset`` resumes from the (date,
+id) of the previous page's last receipt, with and without the total (read
+from ``receipt_rollups`` since browsing stopped counting).
+"""
+import argparse
+import os
+import random
+import tempfile
+
+from app import models
+from app.jobs import pending_record
+from benchmarks._common import print_row, summarize, time_calls
+from benchmarks._legacy import legacy_list_page
+
+CHUNK = 50000
+
+
+def seed(db_path: str, rows: int) -> None:
+    rng = random.Random(0)
+    for start in range(0, rows, CHUNK):
+        records = []
+        for i in range(start, min(rows, start + CHUNK)):
+            record = pending_record(f"r-{i:07d}", f"app/captured_receipts/{i}.jpg")
+            record.update(date=f"20{rng.randint(18, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}")
+            records.append(record)
+        models.insert_receipts(db_path, records)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 100, 1000, 10000, 50000])
+    parser.add_argument("--per-page", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "receipts.db")
+        models.init_db(db_path)
+        seed(db_path, args.rows)
+        conn = models.get_connection(db_path)
+        print(f"{args.rows} receipts, {args.per_page} per page")
+        for page in args.pages:
+            offset = (page - 1) * args.per_page
+            if offset >= args.rows:
+                continue
+            cursor = None
+            if offset:
+                date, receipt_id = conn.execute(
+                    "SELECT date, id FROM receipts ORDER BY date DESC, id DESC LIMIT 1 OFFSET ?", (offset - 1,)
+                ).fetchone()
+                cursor = models.encode_cursor({"after": [date, receipt_id]})
+            legacy = time_calls(lambda: legacy_list_page(conn, page, args.per_page), args.repeat)
+            keyset = time_calls(
+                lambda: models.list_receipts(db_path, cursor=cursor, per_page=args.per_page, with_total=False),
+                args.repeat,
+            )
+            counted = time_calls(
+                lambda: models.list_receipts(db_path, cursor=cursor, per_page=args.per_page), args.repeat
+            )
+            print_row(f"page {page}, legacy", summarize(legacy))
+            print_row(f"page {page}, keyset", summarize(keyset))
+            print_row(f"page {page}, keyset + total", summarize(counted))
+        models.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Field extraction throughput: ReceiptParser vs the original per-field passes.
+
+The corpus is the OCR text stored in a receipts database (``--db``);
+when that has fewer than ``--size`` texts it is topped up with synthetic
+OCR-like texts so the run is meaningful on an empty install.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import time
+from typing import List
+
+from app.models import unpack_text
+from app.ocr import ReceiptParser
+from benchmarks._legacy import legacy_parse
+
+VENDORS = ["CORNER GROCERY", "Shell Station", "Cafe Lumen", "HARDWARE DEPOT", "Pharmacy Plus"]
+ITEMS = ["Milk 2L", "Bread", "Coffee", "Fuel", "Nails 100pk", "Aspirin", "Bananas", "Paper towels"]
+DATES = ["2024-03-18", "18/03/2024", "5 March 2024", "2023/11/02", "01-12-2023", "12 Mar 2024"]
+
+
+def synthetic_text(rng: random.Random) -> str:
+    lines = [rng.choice(VENDORS), f"{rng.randint(1, 999)} Main Street", f"Tel 555-{rng.randint(1000, 9999)}"]
+    lines.append(f"{rng.choice(DATES)} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}")
+    subtotal = 0.0
+    for _ in range(rng.randint(3, 40)):
+        price = rng.randint(50, 5000) / 100
+        subtotal += price
+        lines.append(f"{rng.choice(ITEMS):<20} {rng.choice(['$', '', 'EUR '])}{price:.2f}")
+    tax = round(subtotal * 0.08, 2)
+    lines += [f"Subtotal {subtotal:.2f}", f"Tax: {tax:.2f}", f"TOTAL {subtotal + tax:.2f}", "VISA ****1234", "Thank you!"]
+    return "\n".join(lines)
+
+
+def load_corpus(db_path: str, size: int) -> List[str]:
+    texts: List[str] = []
+    if os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        texts = [
+            unpack_text(row[0]) for row in conn.execute("SELECT data FROM receipt_artifacts WHERE kind = 'raw_text'")
+        ]
+        conn.close()
+    rng = random.Random(0)
+    while len(texts) < size:
+        texts.append(synthetic_text(rng))
+    return texts[:size] if len(texts) > size else texts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default="receipts.db")
+    parser.add_argument("--size", type=int, default=20000)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.db, args.size)
+    megabytes = sum(len(t) for t in corpus) / 1e6
+    print(f"corpus: {len(corpus)} texts, {megabytes:.1f} MB")
+
+    receipt_parser = ReceiptParser()
+    results = {}
+    for label, parse in (("per-field passes (original)", legacy_parse), ("ReceiptParser", receipt_parser.parse)):
+        start = time.perf_counter()
+        results[label] = [parse(text) for text in corpus]
+        elapsed = time.perf_counter() - start
+        print(f"{label:<28} {elapsed:6.2f}s  {len(corpus) / elapsed:9.0f} texts/s  {megabytes / elapsed:6.1f} MB/s")
+
+    original, new = results.values()
+    agree = sum(a == b for a, b in zip(original, new))
+    print(f"identical fields on {agree}/{len(corpus)} texts")
+
+
+if __name__ == "__main__":
+    main()
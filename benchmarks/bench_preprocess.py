@@ -0,0 +1,57 @@
+"""Preprocessing time and peak memory on 12MP phone-style uploads.
+
+Compares the original full-frame ``preprocess_image`` (BGR decode, gray
+conversion and threshold/deskew over the whole frame) with the current one
+(reduced-gray proxy decode, paper ROI crop, then the later stages on the
+crop only). Each variant runs in a fresh process so peak RSS is not
+polluted by the other.
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+
+import cv2
+
+from benchmarks._common import peak_rss_mb, print_row, summarize, synthetic_photo, time_calls
+
+
+def _run_variant(name: str, path: str, repeat: int, queue) -> None:
+    from app import ocr
+    from benchmarks._legacy import legacy_preprocess
+
+    fn = legacy_preprocess if name == "full-frame" else ocr.preprocess_image
+    baseline = peak_rss_mb()
+    samples = time_calls(lambda: fn(path), repeat)
+    queue.put((name, summarize(samples), peak_rss_mb() - baseline, fn(path).shape))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--paper-fraction", type=float, default=0.3)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "photo.jpg")
+        cv2.imwrite(path, synthetic_photo(args.width, args.height, args.paper_fraction), [cv2.IMWRITE_JPEG_QUALITY, 90])
+        results = {}
+        for name in ("full-frame", "roi-crop"):
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_run_variant, args=(name, path, args.repeat, queue))
+            proc.start()
+            name, stats, rss, shape = queue.get()
+            proc.join()
+            results[name] = stats
+            print_row(name, stats)
+            print(f"{'':<28} peak RSS +{rss:.1f}MiB, output {shape[1]}x{shape[0]}")
+
+    speedup = results["full-frame"]["mean_ms"] / results["roi-crop"]["mean_ms"]
+    print(f"speedup: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
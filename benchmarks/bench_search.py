@@ -0,0 +1,95 @@
+"""Receipt search latency: substring LIKE vs the FTS5 index.
+
+Fills a database with synthetic receipts (OCR-style text from
+``benchmarks.synthetic`` plus a unique receipt number each), then times one
+results page with its total count for a few kinds of query: a vendor, a
+common item, a word prefix, a two-word query and a single receipt's number.
+``legacy`` is the old ``vendor LIKE '%x%' OR raw_text LIKE '%x%'`` query,
+run on a copy of the table with the OCR text inline as it used to be;
+``fts`` is ``list_receipts``. Also reports the insert rate with the
+search index kept up to date, the time to index every receipt from scratch
+(as the migration and ``db_maintenance.py rebuild`` do), and the size of the
+index.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import List
+
+from app import models
+from app.jobs import pending_record
+from benchmarks._common import print_row, summarize, time_calls
+from benchmarks._legacy import legacy_search
+from benchmarks.synthetic import receipt_fields, receipt_lines
+
+CHUNK = 20000
+
+
+def seed(db_path: str, rows: int) -> float:
+    """Insert ``rows`` receipts and return the rate in receipts/s."""
+
+    rng = random.Random(0)
+    elapsed = 0.0
+    for start in range(0, rows, CHUNK):
+        records: List[dict] = []
+        for i in range(start, min(rows, start + CHUNK)):
+            fields = receipt_fields(rng, max_items=12)
+            lines = receipt_lines(fields) + [f"Receipt #{i:07d}", f"VISA ****{rng.randint(0, 9999):04d}"]
+            record = pending_record(f"r-{i}", f"app/captured_receipts/{i}.jpg")
+            record.update(vendor=fields["vendor"], date=fields["date"], raw_text="\n".join(lines))
+            records.append(record)
+        begin = time.perf_counter()
+        models.insert_receipts(db_path, records)
+        elapsed += time.perf_counter() - begin
+    return rows / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "receipts.db")
+            models.init_db(db_path)
+            rate = seed(db_path, size)
+            conn = models.get_connection(db_path)
+            start = time.perf_counter()
+            models.rebuild_search_index(db_path)
+            rebuild = time.perf_counter() - start
+            index_bytes = conn.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name LIKE 'receipts_fts%'"
+            ).fetchone()[0]
+            db_bytes = conn.execute("SELECT SUM(pgsize) FROM dbstat").fetchone()[0]
+            with conn:
+                conn.execute(
+                    "CREATE TABLE legacy_receipts AS SELECT receipts.*, unpack_text(data) AS raw_text FROM receipts "
+                    "LEFT JOIN receipt_artifacts ON receipt_id = receipts.id AND kind = 'raw_text'"
+                )
+            print(
+                f"\n{size} receipts: insert {rate:,.0f}/s indexed, rebuild {rebuild:.1f}s, "
+                f"index {index_bytes / 2**20:.1f} MiB of {db_bytes / 2**20:.1f} MiB"
+            )
+
+            queries = [
+                ("vendor", "lumen"),
+                ("item", "aspirin"),
+                ("prefix", "pharm"),
+                ("two words", "green market"),
+                ("receipt number", f"{size // 2:07d}"),
+            ]
+            for label, term in queries:
+                total = models.list_receipts(db_path, search=term)["total"]
+                legacy = time_calls(lambda: legacy_search(conn, term, table="legacy_receipts"), args.repeat)
+                fts = time_calls(lambda: models.list_receipts(db_path, search=term), args.repeat)
+                print_row(f"{label} ({total}), legacy", summarize(legacy))
+                print_row(f"{label} ({total}), fts", summarize(fts))
+            models.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Database size and receipt list latency: OCR text inline vs compressed side storage.
+
+Builds a database at schema version 5, where ``raw_text`` is a column of
+``receipts``, and fills it with synthetic receipts (OCR-style text from
+``benchmarks.synthetic``). ``legacy`` times list pages with that version's
+``SELECT receipts.*`` query. The database is then upgraded by migration 6,
+which moves the text into ``receipt_artifacts`` zlib-compressed, and
+vacuumed; ``current`` is ``list_receipts`` on the result. Pages are read
+without the total count, which costs the same either way. Sizes are pages
+in use, from ``dbstat``.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import Dict, List
+
+from app import models
+from benchmarks._common import print_row, summarize, time_calls
+from benchmarks._legacy import legacy_receipts_page
+from benchmarks.synthetic import receipt_fields, receipt_lines
+
+CHUNK = 20000
+INLINE_VERSION = 5
+
+
+def create_inline(db_path: str) -> None:
+    """The schema as it was at ``INLINE_VERSION``, OCR text in ``receipts``."""
+
+    conn = models.get_connection(db_path)
+    with conn:
+        conn.executescript(models.SCHEMA_SQL)
+        for migration in models.MIGRATIONS[:INLINE_VERSION]:
+            for statement in migration:
+                conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {INLINE_VERSION}")
+
+
+def seed(db_path: str, rows: int) -> None:
+    rng = random.Random(0)
+    insert = (
+        f"INSERT INTO receipts ({', '.join(models.RECEIPT_FIELDS)}) "
+        f"VALUES ({', '.join('?' * len(models.RECEIPT_FIELDS))})"
+    )
+    conn = models.get_connection(db_path)
+    for start in range(0, rows, CHUNK):
+        batch: List[tuple] = []
+        for i in range(start, min(rows, start + CHUNK)):
+            fields = receipt_fields(rng, max_items=12)
+            batch.append((
+                f"r-{i:07d}", fields["date"], fields["vendor"], fields["total_amount"], fields["tax_amount"],
+                fields["currency"], "VISA", rng.choice(["Groceries", "Dining", "Transport"]), "",
+                f"app/captured_receipts/{i}.jpg", "\n".join(receipt_lines(fields)),
+                "2024-01-01T00:00:00", "2024-01-01T00:00:00",
+            ))
+        with conn:
+            conn.executemany(insert, batch)
+
+
+def sizes(db_path: str) -> Dict[str, int]:
+    """Bytes per table, its indexes included, plus the whole database."""
+
+    conn = models.get_connection(db_path)
+    found = {"database": conn.execute("SELECT SUM(pgsize) FROM dbstat").fetchone()[0]}
+    for table, size in conn.execute(
+        "SELECT sqlite_master.tbl_name, SUM(dbstat.pgsize) FROM dbstat "
+        "JOIN sqlite_master ON sqlite_master.name = dbstat.name GROUP BY 1"
+    ):
+        found[table] = size
+    return found
+
+
+def cursor_at(db_path: str, offset: int) -> str:
+    conn = models.get_connection(db_path)
+    date, receipt_id = conn.execute(
+        "SELECT date, id FROM receipts ORDER BY date DESC, id DESC LIMIT 1 OFFSET ?", (offset,)
+    ).fetchone()
+    return models.encode_cursor({"after": [date, receipt_id]})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--per-page", type=int, nargs="+", default=[10, 200])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    mib = 2**20
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "receipts.db")
+            create_inline(db_path)
+            seed(db_path, size)
+            conn = models.get_connection(db_path)
+            before = sizes(db_path)
+            pages = (("first", None), ("middle", cursor_at(db_path, size // 2)))
+
+            legacy = {}
+            for per_page in args.per_page:
+                for label, cursor in pages:
+                    legacy[per_page, label] = time_calls(
+                        lambda: legacy_receipts_page(conn, cursor, per_page), args.repeat
+                    )
+
+            start = time.perf_counter()
+            models.migrate(conn)
+            migrated = time.perf_counter() - start
+            start = time.perf_counter()
+            conn.execute("VACUUM")
+            vacuumed = time.perf_counter() - start
+            # VACUUM may renumber rowids, which the search index refers to.
+            models.rebuild_search_index(db_path)
+            after = sizes(db_path)
+
+            print(f"\n{size} receipts: migration {migrated:.1f}s, VACUUM {vacuumed:.1f}s")
+            print(
+                f"  receipts table {before['receipts'] / mib:.1f} -> {after['receipts'] / mib:.1f} MiB, "
+                f"receipt_artifacts {after['receipt_artifacts'] / mib:.1f} MiB, "
+                f"database {before['database'] / mib:.1f} -> {after['database'] / mib:.1f} MiB"
+            )
+            for per_page in args.per_page:
+                for label, cursor in pages:
+                    current = time_calls(
+                        lambda: models.list_receipts(db_path, cursor=cursor, per_page=per_page, with_total=False),
+                        args.repeat,
+                    )
+                    print_row(f"{per_page}/page, {label} page, legacy", summarize(legacy[per_page, label]))
+                    print_row(f"{per_page}/page, {label} page, current", summarize(current))
+            models.close_connections()
+
+
+if __name__ == "__main__":
+    main()
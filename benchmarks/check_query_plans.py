@@ -0,0 +1,180 @@
+"""Query-plan regression check for the receipt queries.
+
+Seeds a throwaway database, calls the real model functions with SQLite's
+trace hook on, and runs ``EXPLAIN QUERY PLAN`` on every statement they issue.
+A statement with a WHERE or ORDER BY that scans a table without an index or
+sorts in a temporary B-tree fails the check, as does a case that does not use
+the index it is meant to. ``tests/test_query_plans.py`` runs the same
+check under pytest; this script prints every case and exits non-zero on
+failure:
+
+    python -m benchmarks.check_query_plans
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import uuid
+from typing import Callable, List, Tuple
+
+from app import models
+from app.jobs import pending_record
+
+CATEGORIES = ["Groceries", "Dining", "Transport", "Utilities", "Other"]
+
+# One row per category or month: scanning or sorting these is cheap.
+SMALL_TABLES = ("receipt_rollups",)
+
+# (label, call, index the plan must use)
+CASES: List[Tuple[str, Callable[[str], object], str]] = [
+    ("dashboard, newest first", lambda db: models.list_receipts(db), "idx_receipts_date_id"),
+    (
+        "dashboard, older page",
+        lambda db: models.list_receipts(db, cursor=models.encode_cursor({"after": ["2024-06-01", "x"]})),
+        "idx_receipts_date_id",
+    ),
+    (
+        "dashboard, newer page",
+        lambda db: models.list_receipts(db, cursor=models.encode_cursor({"before": ["2024-06-01", "x"]})),
+        "idx_receipts_date_id",
+    ),
+    (
+        "dashboard, oldest page",
+        lambda db: models.list_receipts(db, cursor=models.encode_cursor({"before": None})),
+        "idx_receipts_date_id",
+    ),
+    (
+        "dashboard, one category",
+        lambda db: models.list_receipts(db, category="Dining"),
+        "idx_receipts_category_date_id",
+    ),
+    (
+        "dashboard, older page in category",
+        lambda db: models.list_receipts(
+            db, category="Dining", cursor=models.encode_cursor({"after": ["2024-06-01", "x"]})
+        ),
+        "idx_receipts_category_date_id",
+    ),
+    ("dashboard, category total", lambda db: models.list_receipts(db, category="Dining"), "receipt_rollups"),
+    ("dashboard, search", lambda db: models.list_receipts(db, search="vend"), "receipts_fts"),
+    (
+        "dashboard, search in category",
+        lambda db: models.list_receipts(db, search="vend", category="Dining"),
+        "receipts_fts",
+    ),
+    ("home, recent receipts", lambda db: models.stats(db), "idx_receipts_created_at"),
+    ("home, totals", lambda db: models.stats(db), "receipt_rollups"),
+    ("receipt detail, its job", lambda db: models.get_job_for_receipt(db, "missing"), "idx_jobs_receipt"),
+    ("scan page, auto-captures", lambda db: models.auto_captures(db, "client", 10), "idx_auto_captures_client"),
+    ("download, everything", lambda db: list(models.iter_receipts(db)), "idx_receipts_date_id"),
+    (
+        "download, date range",
+        lambda db: list(models.iter_receipts(db, date_from="2024-03-01", date_to="2024-05-31")),
+        "idx_receipts_date_id",
+    ),
+    (
+        "download, one category",
+        lambda db: list(models.iter_receipts(db, date_from="2024-03-01", category="Dining")),
+        "idx_receipts_category_date_id",
+    ),
+    (
+        "download, one vendor",
+        lambda db: list(models.iter_receipts(db, vendor="Vendor 7")),
+        "idx_receipts_vendor_date_id",
+    ),
+    (
+        "receipt detail, OCR text",
+        lambda db: models.get_receipt(db, "missing", with_artifacts=True),
+        "sqlite_autoindex_receipt_artifacts_1",
+    ),
+]
+
+
+def seed(db_path: str, rows: int) -> None:
+    rng = random.Random(0)
+    records = []
+    for i in range(rows):
+        record = pending_record(str(uuid.uuid4()), f"img-{i}.jpg")
+        record.update(
+            date=f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            vendor=f"Vendor {rng.randint(1, 200)}",
+            category=rng.choice(CATEGORIES),
+            total_amount=round(rng.uniform(1, 200), 2),
+        )
+        records.append(record)
+    models.insert_receipts(db_path, records)
+
+
+def plan(conn, sql: str) -> List[str]:
+    return [row["detail"] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def problems(sql: str, details: List[str]) -> List[str]:
+    upper = sql.upper()
+    if " WHERE " not in upper and " ORDER BY " not in upper:
+        return []  # whole-table aggregates have to read every row
+    if any(f"FROM {table}" in sql for table in SMALL_TABLES):
+        return []
+    found = []
+    for detail in details:
+        if detail.startswith("SCAN ") and " INDEX " not in detail:
+            found.append(f"full table scan: {detail}")
+        if "TEMP B-TREE" in detail:
+            found.append(f"sort without an index: {detail}")
+    return found
+
+
+def check_case(db_path: str, call: Callable[[str], object], index: str, verbose: bool = False) -> List[str]:
+    """Run one of ``CASES`` against ``db_path`` and return what is wrong with its plans."""
+
+    conn = models.get_connection(db_path)
+    statements: List[str] = []
+    conn.set_trace_callback(statements.append)
+    try:
+        call(db_path)
+    finally:
+        conn.set_trace_callback(None)
+    issues = []
+    used = False
+    for sql in statements:
+        if not sql.lstrip().upper().startswith("SELECT"):
+            continue
+        details = plan(conn, sql)
+        used = used or any(index in detail for detail in details)
+        issues.extend(problems(sql, details))
+        if verbose:
+            print(f"  {sql}\n    " + "\n    ".join(details))
+    if not used:
+        issues.append(f"does not use {index}")
+    return issues
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "receipts.db")
+        models.init_db(db_path)
+        conn = models.get_connection(db_path)
+        if models.schema_version(conn) != len(models.MIGRATIONS):
+            print(f"FAIL schema version {models.schema_version(conn)}, expected {len(models.MIGRATIONS)}")
+            failures += 1
+        seed(db_path, args.rows)
+
+        for label, call, index in CASES:
+            issues = check_case(db_path, call, index, args.verbose)
+            print(f"{'FAIL' if issues else 'ok  '} {label}")
+            for issue in issues:
+                print(f"     {issue}")
+            failures += bool(issues)
+        models.close_connections()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
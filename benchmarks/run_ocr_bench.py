@@ -0,0 +1,134 @@
+"""OCR pipeline benchmark over a synthetic corpus with ground truth.
+
+Runs each receipt through ``ocr.process_image``, exactly as the OCR workers
+do, and reports per-stage latency percentiles, throughput, peak RSS and
+field accuracy for date, vendor, total and tax. Stage timings are the ones
+the pipeline reports to ``/metrics`` (decode + ROI crop, threshold, deskew,
+OCR, parse), so the two can be compared directly.
+Results are written as JSON; pass a previous run as ``--baseline`` to fail
+(exit status 1) on latency or accuracy regressions::
+
+    python -m benchmarks.run_ocr_bench --count 30 --output before.json
+    # ... change app/ocr.py ...
+    python -m benchmarks.run_ocr_bench --count 30 --baseline before.json --output after.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from app import metrics, ocr
+from benchmarks._common import peak_rss_mb, summarize
+from benchmarks.synthetic import generate_corpus
+
+STAGES = ("decode", "threshold", "deskew", "ocr", "parse")
+FIELDS = ("date", "vendor", "total_amount", "tax_amount")
+
+
+def field_matches(field: str, expected, actual) -> bool:
+    if field in ("total_amount", "tax_amount"):
+        return actual is not None and abs(float(actual) - float(expected)) < 0.005
+    return actual == expected
+
+
+def run(corpus_dir: str, mode: str) -> Dict[str, object]:
+    with open(os.path.join(corpus_dir, "truth.json"), encoding="utf-8") as f:
+        truth = json.load(f)
+    engine = ocr.get_engine()
+    timings: Dict[str, List[float]] = {stage: [] for stage in STAGES + ("total",)}
+    correct = {field: 0 for field in FIELDS}
+
+    started = time.perf_counter()
+    for entry in truth:
+        path = os.path.join(corpus_dir, entry["file"])
+        with metrics.recording() as samples:
+            start = time.perf_counter()
+            fields = ocr.process_image(path, mode)
+            timings["total"].append(time.perf_counter() - start)
+        for stage in STAGES:
+            timings[stage].append(sum(samples.get(stage, ())))
+        for field in FIELDS:
+            correct[field] += field_matches(field, entry[field], fields[field])
+    elapsed = time.perf_counter() - started
+
+    return {
+        "meta": {
+            "corpus": os.path.abspath(corpus_dir),
+            "receipts": len(truth),
+            "mode": mode,
+            "engine": engine.name,
+            "pipeline_version": ocr.PIPELINE_VERSION,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "latency_ms": {stage: summarize(samples) for stage, samples in timings.items()},
+        "throughput_rps": len(truth) / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "accuracy": {field: correct[field] / len(truth) for field in FIELDS},
+    }
+
+
+def compare(current: Dict, baseline: Dict, latency_tolerance: float, accuracy_tolerance: float) -> List[str]:
+    regressions = []
+    for stage, stats in current["latency_ms"].items():
+        before = baseline["latency_ms"].get(stage)
+        if before and stats["p50_ms"] > before["p50_ms"] * (1 + latency_tolerance) and stats["p50_ms"] - before["p50_ms"] > 1:
+            regressions.append(f"{stage} p50 {before['p50_ms']:.1f}ms -> {stats['p50_ms']:.1f}ms")
+    for field, value in current["accuracy"].items():
+        before = baseline["accuracy"].get(field)
+        if before is not None and value < before - accuracy_tolerance:
+            regressions.append(f"{field} accuracy {before:.1%} -> {value:.1%}")
+    return regressions
+
+
+def report(results: Dict) -> None:
+    meta = results["meta"]
+    print(f"{meta['receipts']} receipts, mode={meta['mode']}, engine={meta['engine']}")
+    for stage, stats in results["latency_ms"].items():
+        print(f"  {stage:<9} p50={stats['p50_ms']:8.1f}ms p95={stats['p95_ms']:8.1f}ms p99={stats['p99_ms']:8.1f}ms")
+    print(f"  throughput {results['throughput_rps']:.2f} receipts/s, peak RSS {results['peak_rss_mb']:.0f}MiB")
+    print("  accuracy " + ", ".join(f"{k}={v:.1%}" for k, v in results["accuracy"].items()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="directory from benchmarks.synthetic (generated to a temp dir if omitted)")
+    parser.add_argument("--count", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=("full", "layout"), default=ocr.OCR_MODE)
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to check for regressions")
+    parser.add_argument("--latency-tolerance", type=float, default=0.15, help="allowed relative p50 increase")
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.02, help="allowed absolute accuracy drop")
+    args = parser.parse_args()
+    # Keep the benchmark's observations out of a running install's /metrics.
+    metrics.METRICS_ENABLED = False
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = args.corpus
+        if corpus is None:
+            corpus = tmp
+            generate_corpus(corpus, args.count, args.seed)
+        results = run(corpus, args.mode)
+
+    report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.latency_tolerance, args.accuracy_tolerance)
+        for line in regressions:
+            print(f"REGRESSION: {line}")
+        if regressions:
+            sys.exit(1)
+        print("no regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Synthetic receipt corpus with known ground truth.
+
+Each receipt is rendered with PIL from randomly drawn fields (vendor, date
+in one of the formats the parser understands, items, tax, total) and then
+degraded like a real capture: rotation, blur, an uneven shadow and,
+optionally, a dark table around the paper. The corpus is written as PNGs
+plus ``truth.json``::
+
+    python -m benchmarks.synthetic --out corpus/ --count 100 --seed 0
+"""
+import argparse
+import json
+import os
+import random
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+VENDORS = [
+    "CORNER GROCERY",
+    "Shell Station",
+    "Cafe Lumen",
+    "HARDWARE DEPOT",
+    "Pharmacy Plus",
+    "Green Leaf Market",
+    "Book Nook",
+]
+ITEMS = ["Milk 2L", "Bread", "Coffee", "Fuel", "Nails 100pk", "Aspirin", "Bananas", "Paper towels", "Eggs 12", "Tea"]
+DATE_FORMATS = ["%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y", "%d %b %Y", "%d %B %Y"]
+CURRENCIES = [("$", "USD"), ("€", "EUR"), ("£", "GBP")]
+
+
+def receipt_fields(rng: random.Random, min_items: int = 3, max_items: int = 30) -> Dict[str, object]:
+    items = [(rng.choice(ITEMS), rng.randint(50, 4000) / 100) for _ in range(rng.randint(min_items, max_items))]
+    subtotal = round(sum(price for _, price in items), 2)
+    tax = round(subtotal * rng.choice([0.05, 0.07, 0.08, 0.2]), 2)
+    symbol, currency = rng.choice(CURRENCIES)
+    day = date(2022, 1, 1) + timedelta(days=rng.randint(0, 900))
+    return {
+        "vendor": rng.choice(VENDORS),
+        "date": day.isoformat(),
+        "date_text": day.strftime(rng.choice(DATE_FORMATS)),
+        "items": items,
+        "subtotal": subtotal,
+        "tax_amount": tax,
+        "total_amount": round(subtotal + tax, 2),
+        "symbol": symbol,
+        "currency": currency,
+    }
+
+
+def receipt_lines(fields: Dict[str, object]) -> List[str]:
+    symbol = fields["symbol"]
+    lines = [fields["vendor"], "123 Market Street", f"{fields['date_text']} 14:02", ""]
+    lines += [f"{name:<18}{symbol}{price:>8.2f}" for name, price in fields["items"]]
+    lines += [
+        "",
+        f"{'Subtotal':<18}{symbol}{fields['subtotal']:>8.2f}",
+        f"{'Tax':<18}{symbol}{fields['tax_amount']:>8.2f}",
+        f"{'TOTAL':<18}{fields['total_amount']:>9.2f}",
+        "",
+        "Thank you!",
+    ]
+    return lines
+
+
+def render(lines: List[str], font_size: int = 26, width: int = 560) -> np.ndarray:
+    font = ImageFont.load_default(size=font_size)
+    line_height = int(font_size * 1.4)
+    image = Image.new("L", (width, line_height * (len(lines) + 2)), 250)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((24, line_height * (i + 1)), line, fill=20, font=font)
+    return np.asarray(image)
+
+
+def degrade(
+    paper: np.ndarray,
+    rng: random.Random,
+    max_rotation: float = 6.0,
+    max_blur: float = 1.2,
+    shadow: float = 0.35,
+    table: bool = True,
+) -> Tuple[np.ndarray, float]:
+    """Rotate, blur, shade and optionally put ``paper`` on a table. Returns (image, angle)."""
+
+    angle = rng.uniform(-max_rotation, max_rotation)
+    h, w = paper.shape
+    margin = int(max(h, w) * 0.15) if table else 8
+    canvas_h, canvas_w = h + 2 * margin, w + 2 * margin
+    background = 60 if table else 250
+    canvas = np.full((canvas_h, canvas_w), background, dtype=np.uint8)
+    canvas[margin : margin + h, margin : margin + w] = paper
+    M = cv2.getRotationMatrix2D((canvas_w / 2, canvas_h / 2), angle, 1.0)
+    image = cv2.warpAffine(canvas, M, (canvas_w, canvas_h), flags=cv2.INTER_LINEAR, borderValue=background)
+
+    sigma = rng.uniform(0, max_blur)
+    if sigma > 0.3:
+        image = cv2.GaussianBlur(image, (0, 0), sigma)
+    if shadow:
+        # A linear falloff from one random side darkens part of the page.
+        direction = rng.uniform(0, 2 * np.pi)
+        ys, xs = np.mgrid[0:canvas_h, 0:canvas_w].astype(np.float32)
+        ramp = (np.cos(direction) * xs / canvas_w + np.sin(direction) * ys / canvas_h + 1) / 2
+        image = (image * (1 - shadow * ramp)).astype(np.uint8)
+    noise = np.random.default_rng(rng.randint(0, 2**31)).normal(0, 4, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8), angle
+
+
+def generate_corpus(out_dir: str, count: int, seed: int = 0, **degrade_options) -> List[Dict[str, object]]:
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    truth = []
+    for i in range(count):
+        fields = receipt_fields(rng)
+        image, angle = degrade(render(receipt_lines(fields)), rng, **degrade_options)
+        filename = f"receipt_{i:04d}.png"
+        cv2.imwrite(os.path.join(out_dir, filename), image)
+        truth.append(
+            {
+                "file": filename,
+                "vendor": fields["vendor"],
+                "date": fields["date"],
+                "total_amount": fields["total_amount"],
+                "tax_amount": fields["tax_amount"],
+                "currency": fields["currency"],
+                "items": len(fields["items"]),
+                "rotation": round(angle, 2),
+            }
+        )
+    with open(os.path.join(out_dir, "truth.json"), "w", encoding="utf-8") as f:
+        json.dump(truth, f, indent=2)
+    return truth
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-rotation", type=float, default=6.0)
+    parser.add_argument("--max-blur", type=float, default=1.2)
+    parser.add_argument("--shadow", type=float, default=0.35)
+    parser.add_argument("--no-table", action="store_true", help="flatbed-style scans without background")
+    args = parser.parse_args()
+    generate_corpus(
+        args.out,
+        args.count,
+        args.seed,
+        max_rotation=args.max_rotation,
+        max_blur=args.max_blur,
+        shadow=args.shadow,
+        table=not args.no_table,
+    )
+    print(f"wrote {args.count} receipts to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
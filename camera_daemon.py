@@ -0,0 +1,5 @@
+from app.capture_service import main
+
+
+if __name__ == "__main__":
+    main()
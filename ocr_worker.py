@@ -0,0 +1,5 @@
+from app.jobs import run_pool
+
+
+if __name__ == "__main__":
+    run_pool()
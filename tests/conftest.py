@@ -0,0 +1,37 @@
+import os
+
+# Before ``app`` is imported: keep the test processes' histograms out of the
+# metrics directory a running install scrapes.
+os.environ.setdefault("RECEIPT_METRICS", "0")
+
+import pytest  # noqa: E402
+
+from app import models  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "receipts.db")
+    yield path
+    models.close_connections()
+
+
+@pytest.fixture
+def app(tmp_path, db_path):
+    from app import create_app
+
+    app = create_app(
+        {
+            "DATABASE_PATH": db_path,
+            "CSV_PATH": str(tmp_path / "receipts.csv"),
+            "IMAGE_DIR": str(tmp_path / "images"),
+            "TESTING": True,
+        }
+    )
+    yield app
+    models.flush_csv_exports()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,47 @@
+import csv
+import os
+
+from app import jobs, models
+
+
+def _scan(db_path, receipt_id):
+    models.insert_receipt(db_path, jobs.pending_record(receipt_id, f"{receipt_id}.jpg"))
+    models.enqueue_job(db_path, receipt_id, f"{receipt_id}.jpg")
+
+
+def _work(db_path, csv_path):
+    """Run the next job as ``jobs.worker_loop`` would."""
+
+    job = models.claim_job(db_path, "test")
+    jobs.run_job(db_path, csv_path, job)
+    models.finish_job(db_path, job["id"], "done")
+
+
+def test_layout_mode_scan_is_appended_once_with_its_full_text(tmp_path, db_path, monkeypatch):
+    monkeypatch.setattr(jobs, "fetch_frame", lambda path: None)
+    header = {"vendor": "Shop", "raw_text": "Shop\nTOTAL 1.00", "raw_text_partial": True}
+    monkeypatch.setattr(jobs, "process_image", lambda image: header)
+    monkeypatch.setattr(jobs, "ocr_full_text", lambda path: "Shop\nMilk 1.00\nTOTAL 1.00")
+    monkeypatch.setattr(jobs, "schedule_csv_export", lambda db_path, csv_path: None)
+    csv_path = str(tmp_path / "receipts.csv")
+    models.init_db(db_path)
+    _scan(db_path, "r1")
+    _work(db_path, csv_path)
+    _work(db_path, csv_path)
+    models.export_to_csv(db_path, csv_path)
+    inode = os.stat(csv_path).st_ino
+
+    _scan(db_path, "r2")
+    models.export_to_csv(db_path, csv_path)
+    _work(db_path, csv_path)
+    models.export_to_csv(db_path, csv_path)
+    _work(db_path, csv_path)
+    models.export_to_csv(db_path, csv_path)
+
+    assert os.stat(csv_path).st_ino == inode, "receipts.csv was rewritten"
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [(row["id"], row["raw_text"]) for row in rows] == [
+        ("r1", "Shop\nMilk 1.00\nTOTAL 1.00"),
+        ("r2", "Shop\nMilk 1.00\nTOTAL 1.00"),
+    ]
@@ -0,0 +1,56 @@
+import csv
+
+from app import models
+
+HEADER = ["id", "date", "vendor", "total_amount", "raw_text"]
+
+
+def _write(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows([HEADER, *rows])
+
+
+def test_dates_the_app_stores_are_imported_as_they_are(tmp_path, db_path):
+    models.init_db(db_path)
+    source = tmp_path / "old.csv"
+    # An ISO date, the parser's raw fallbacks and a free-text edit.
+    dates = ["2024-03-12", "12/03-2024", "31 Smarch 2024", "around Easter"]
+    _write(source, [[f"r{i}", date, "Shop", "1.00", "TOTAL 1.00"] for i, date in enumerate(dates)])
+
+    report = models.import_from_csv(db_path, str(source))
+
+    assert (report["imported"], report["skipped"]) == (4, 0)
+    assert [models.get_receipt(db_path, f"r{i}")["date"] for i in range(4)] == dates
+
+
+def test_skipped_rows_are_reported_and_saved(tmp_path, db_path):
+    models.init_db(db_path)
+    source = tmp_path / "old.csv"
+    rejected = tmp_path / "old.rejected.csv"
+    _write(source, [
+        ["r1", "2024-03-12", "Shop", "1.00", ""],
+        ["", "2024-03-12", "Shop"],
+        ["r3", "", "Shop", "a lot", ""],
+    ])
+
+    report = models.import_from_csv(db_path, str(source), rejected_path=str(rejected))
+
+    assert (report["imported"], report["skipped"]) == (1, 2)
+    assert report["errors"] == ["line 3: missing id", "line 4: total_amount 'a lot' is not a number"]
+    with open(rejected, newline="", encoding="utf-8") as f:
+        assert list(csv.reader(f)) == [
+            [*HEADER, "error"],
+            ["", "2024-03-12", "Shop", "", "", "missing id"],
+            ["r3", "", "Shop", "a lot", "", "total_amount 'a lot' is not a number"],
+        ]
+
+
+def test_no_rejected_file_without_skipped_rows(tmp_path, db_path):
+    models.init_db(db_path)
+    source = tmp_path / "old.csv"
+    rejected = tmp_path / "old.rejected.csv"
+    _write(source, [["r1", "2024-03-12", "Shop", "1.00", ""]])
+
+    models.import_from_csv(db_path, str(source), rejected_path=str(rejected))
+
+    assert not rejected.exists()
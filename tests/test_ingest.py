@@ -0,0 +1,64 @@
+import io
+
+from app import models
+from app.ocr import PIPELINE_VERSION
+
+IMAGE = b"\xff\xd8 not really a jpeg, the OCR worker never runs"
+
+
+def _upload(client):
+    response = client.post("/upload", data={"image": (io.BytesIO(IMAGE), "receipt.jpg")})
+    assert response.status_code == 302
+    return response.headers["Location"].rstrip("/").rsplit("/", 1)[-1]
+
+
+def test_reupload_while_ocr_is_queued_links_to_the_receipt(client):
+    assert _upload(client) == _upload(client)
+
+
+def test_reupload_after_deleting_the_receipt_links_to_the_new_one(app, client, db_path):
+    first = _upload(client)
+    job = models.claim_job(db_path, "test")
+    models.update_receipt(db_path, first, {"vendor": "Corner Shop"})
+    models.complete_cached_ocr(db_path, first, PIPELINE_VERSION, {"vendor": "Corner Shop"})
+    models.finish_job(db_path, job["id"], "done")
+    models.delete_receipt(db_path, first)
+
+    second = _upload(client)
+    assert second != first
+    assert models.get_receipt(db_path, second)["vendor"] == "Corner Shop"
+    assert _upload(client) == second
+    assert models.get_job_for_receipt(db_path, second) is None
+
+
+def test_reupload_after_a_failed_job_is_ocrd_again(app, client, db_path):
+    first = _upload(client)
+    job = models.claim_job(db_path, "test")
+    models.finish_job(db_path, job["id"], "failed", "boom")
+
+    second = _upload(client)
+    assert second != first
+    assert models.get_job_for_receipt(db_path, second)["status"] == "queued"
+
+
+def test_reupload_after_the_worker_died_too_often_is_ocrd_again(app, client, db_path):
+    first = _upload(client)
+    for _ in range(models.MAX_JOB_ATTEMPTS):
+        models.claim_job(db_path, "test")
+        models.requeue_jobs(db_path, "test")
+    assert models.get_job_for_receipt(db_path, first)["status"] == "failed"
+
+    second = _upload(client)
+    assert second != first
+    assert models.get_job_for_receipt(db_path, second)["status"] == "queued"
+
+
+def test_reupload_of_a_stale_failed_reservation_is_ocrd_again(app, client, db_path):
+    # Databases from before failed jobs released their reservation.
+    first = _upload(client)
+    job = models.claim_job(db_path, "test")
+    conn = models.get_connection(db_path)
+    with conn:
+        conn.execute("UPDATE jobs SET status = 'failed' WHERE id = ?", (job["id"],))
+
+    assert _upload(client) != first
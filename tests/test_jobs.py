@@ -0,0 +1,55 @@
+import json
+
+from app import jobs, models
+from app.ocr import PIPELINE_VERSION, ReceiptParser
+
+HEADER_AND_TOTALS = "TOTAL 12.50"
+FULL_PAGE = "Corner Shop\n2024-03-12 10:41\nMilk 12.50\nTOTAL 12.50"
+
+
+def _layout_mode(monkeypatch):
+    monkeypatch.setattr(jobs, "fetch_frame", lambda path: None)
+    parsed = {**ReceiptParser().parse(HEADER_AND_TOTALS), "raw_text": HEADER_AND_TOTALS, "raw_text_partial": True}
+    monkeypatch.setattr(jobs, "process_image", lambda image: parsed)
+    monkeypatch.setattr(jobs, "ocr_full_text", lambda path: FULL_PAGE)
+    monkeypatch.setattr(jobs, "schedule_csv_export", lambda db_path, csv_path: None)
+
+
+def _scan(db_path, receipt_id):
+    models.insert_receipt(db_path, jobs.pending_record(receipt_id, f"{receipt_id}.jpg"))
+    models.reserve_cached_ocr(db_path, receipt_id, PIPELINE_VERSION, receipt_id)
+    models.enqueue_job(db_path, receipt_id, f"{receipt_id}.jpg")
+
+
+def _work(db_path):
+    job = models.claim_job(db_path, "test")
+    jobs.run_job(db_path, "unused.csv", job)
+    models.finish_job(db_path, job["id"], "done")
+
+
+def test_fulltext_pass_fills_fields_the_regions_missed(db_path, monkeypatch):
+    _layout_mode(monkeypatch)
+    models.init_db(db_path)
+    _scan(db_path, "r1")
+
+    _work(db_path)
+    _work(db_path)
+
+    receipt = models.get_receipt(db_path, "r1", with_artifacts=True)
+    assert (receipt["date"], receipt["vendor"], receipt["total_amount"]) == ("2024-03-12", "Corner Shop", 12.5)
+    assert receipt["raw_text"] == FULL_PAGE
+    cached = json.loads(models.get_cached_ocr(db_path, "r1", PIPELINE_VERSION)["result"])
+    assert (cached["date"], cached["vendor"], cached["raw_text"]) == ("2024-03-12", "Corner Shop", FULL_PAGE)
+
+
+def test_fulltext_pass_keeps_fields_edited_in_between(db_path, monkeypatch):
+    _layout_mode(monkeypatch)
+    models.init_db(db_path)
+    _scan(db_path, "r1")
+
+    _work(db_path)
+    models.update_receipt(db_path, "r1", {"vendor": "Typed In"})
+    _work(db_path)
+
+    receipt = models.get_receipt(db_path, "r1")
+    assert (receipt["date"], receipt["vendor"]) == ("2024-03-12", "Typed In")
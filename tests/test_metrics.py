@@ -0,0 +1,56 @@
+import json
+import os
+import subprocess
+import sys
+
+from app import metrics
+
+
+def test_recording_keeps_every_observation_with_metrics_off(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+
+    with metrics.recording() as samples:
+        metrics.observe("ocr", 0.25)
+        metrics.observe("ocr", 0.5)
+        with metrics.timed("parse"):
+            pass
+    metrics.observe("ocr", 1.0)
+
+    assert samples["ocr"] == [0.25, 0.5]
+    assert list(samples) == ["ocr", "parse"]
+
+
+def _histogram(count):
+    return {"buckets": [count] + [0] * (len(metrics.BUCKETS) - 1), "sum": 0.001 * count, "count": count}
+
+
+def test_files_of_exited_processes_are_archived(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    files = {f"{exited.pid}-aaaa.json": 2, f"{exited.pid}-bbbb.json": 3, f"{os.getpid()}-cccc.json": 5}
+    for name, count in files.items():
+        (tmp_path / name).write_text(json.dumps({"ocr": _histogram(count)}))
+    (tmp_path / f"{exited.pid}-dddd.json.tmp").write_text("{")
+
+    assert metrics.collect()["ocr"]["count"] == 10
+    assert sorted(os.listdir(tmp_path)) == sorted([".archive.lock", metrics.ARCHIVE_FILE, f"{os.getpid()}-cccc.json"])
+
+    (tmp_path / f"{exited.pid}-eeee.json").write_text(json.dumps({"ocr": _histogram(1)}))
+    assert metrics.collect()["ocr"]["count"] == 11
+    assert metrics.collect()["ocr"]["count"] == 11
+
+
+def test_a_process_writes_a_file_of_its_own(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    monkeypatch.setattr(metrics, "_state", {"pid": None, "flushed_at": 0.0, "name": None})
+    monkeypatch.setattr(metrics, "_histograms", {})
+    (tmp_path / f"{os.getpid()}.json").write_text(json.dumps({"ocr": _histogram(4)}))
+
+    metrics.observe("ocr", 0.002)
+    metrics.flush()
+
+    (name,) = [name for name in os.listdir(tmp_path) if name != f"{os.getpid()}.json"]
+    assert name.startswith(f"{os.getpid()}-") and name.endswith(".json")
+    assert metrics.collect()["ocr"]["count"] == 5
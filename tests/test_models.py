@@ -0,0 +1,128 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+import zlib
+
+import pytest
+
+from app import models
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+INIT_DB = "import sys; from app import models; models.init_db(sys.argv[1])"
+
+# Initialises the database, then holds the write lock longer than the 5 s
+# busy_timeout, as a process applying a slow migration would.
+HOLD_WRITE_LOCK = """
+import sys, time
+from app import models
+models.init_db(sys.argv[1])
+conn = models.get_connection(sys.argv[1])
+conn.execute("BEGIN IMMEDIATE")
+print("locked", flush=True)
+time.sleep(6)
+conn.commit()
+"""
+
+
+def _create_at_version(db_path, version):
+    conn = models.get_connection(db_path)
+    with conn:
+        conn.executescript(models.SCHEMA_SQL)
+        for migration in models.MIGRATIONS[:version]:
+            for statement in migration:
+                conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {version}")
+        conn.execute(
+            "INSERT INTO receipts (id, vendor, raw_text) VALUES ('r1', 'Corner Shop', 'CORNER SHOP\nMILK 1.20')"
+        )
+    return conn
+
+
+def _python(code, *args, **kwargs):
+    env = dict(os.environ, RECEIPT_METRICS="0")
+    return subprocess.Popen([sys.executable, "-c", code, *args], cwd=ROOT, env=env, **kwargs)
+
+
+def test_processes_start_together_on_a_fresh_database(db_path):
+    processes = [_python(INIT_DB, db_path) for _ in range(4)]
+    assert [process.wait(timeout=60) for process in processes] == [0] * 4
+    assert models.schema_version(models.get_connection(db_path)) == len(models.MIGRATIONS)
+
+
+def test_startup_waits_for_a_process_holding_the_write_lock(db_path):
+    holder = _python(HOLD_WRITE_LOCK, db_path, stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == "locked"
+        start = time.monotonic()
+        assert _python(INIT_DB, db_path).wait(timeout=60) == 0
+        assert time.monotonic() - start > 5
+    finally:
+        holder.wait(timeout=60)
+        holder.stdout.close()
+    assert holder.returncode == 0
+
+
+def test_migration_6_moves_ocr_text_to_receipt_artifacts(db_path):
+    conn = _create_at_version(db_path, 5)
+
+    models.migrate(conn)
+
+    assert "raw_text" not in [row["name"] for row in conn.execute("PRAGMA table_info(receipts)")]
+    assert models.get_receipt(db_path, "r1", with_artifacts=True)["raw_text"] == "CORNER SHOP\nMILK 1.20"
+    assert [row["id"] for row in models.list_receipts(db_path, search="milk")["receipts"]] == ["r1"]
+    assert models.search_index_ok(db_path)
+
+
+def test_migration_6_refuses_sqlite_without_drop_column(db_path, monkeypatch):
+    conn = _create_at_version(db_path, 5)
+    monkeypatch.setattr(models.sqlite3, "sqlite_version_info", (3, 34, 1))
+
+    with pytest.raises(RuntimeError, match="migration 6 needs SQLite 3.35.0 or later"):
+        models.migrate(conn)
+
+    assert models.schema_version(conn) == 5
+    assert "raw_text" in [row["name"] for row in conn.execute("PRAGMA table_info(receipts)")]
+
+
+def test_schema_calls_no_application_functions(db_path):
+    models.init_db(db_path)
+    conn = models.get_connection(db_path)
+    record = dict.fromkeys(models.RECEIPT_FIELDS, "")
+    models.insert_receipt(db_path, dict(record, id="r1", vendor="Corner Shop", raw_text="MILK 1.20"))
+
+    # A client without pack_text()/unpack_text(), like the sqlite3 shell.
+    plain = sqlite3.connect(db_path)
+    try:
+        with plain:
+            plain.execute("INSERT INTO receipts (id, vendor) VALUES ('r2', 'Bakery')")
+            plain.execute("INSERT INTO receipt_artifacts VALUES ('r2', 'raw_text', ?)", (zlib.compress(b"BREAD"),))
+            plain.execute("UPDATE receipts SET vendor = 'Corner Store' WHERE id = 'r1'")
+            plain.execute("DELETE FROM receipts WHERE id = 'r1'")
+    finally:
+        plain.close()
+
+    assert all("pack_text" not in (row[0] or "") for row in conn.execute("SELECT sql FROM sqlite_master"))
+    assert conn.execute("SELECT COUNT(*) FROM receipt_artifacts WHERE receipt_id = 'r1'").fetchone()[0] == 0
+    assert not models.search_index_ok(db_path)
+    models.rebuild_search_index(db_path)
+    assert models.search_index_ok(db_path)
+    assert [row["id"] for row in models.list_receipts(db_path, search="bread")["receipts"]] == ["r2"]
+
+
+def test_writes_keep_the_search_index_in_step(db_path):
+    models.init_db(db_path)
+    record = dict.fromkeys(models.RECEIPT_FIELDS, "")
+    models.insert_receipt(db_path, dict(record, id="r1", vendor="Corner Shop", raw_text="MILK 1.20"))
+    models.insert_receipts(db_path, [dict(record, id=f"r{i}", vendor="Bakery", raw_text="BREAD") for i in (1, 2)])
+    models.update_receipt(db_path, "r2", {"vendor": "Pharmacy", "raw_text": "ASPIRIN 4.99"})
+    models.delete_receipt(db_path, "r1")
+
+    def search(words):
+        return [row["id"] for row in models.list_receipts(db_path, search=words)["receipts"]]
+
+    assert models.search_index_ok(db_path)
+    assert search("bread") == []
+    assert search("pharm aspirin") == ["r2"]
@@ -0,0 +1,28 @@
+import pytest
+
+from app import ocr
+
+
+@pytest.mark.parametrize(
+    "word", [*ocr.TOTAL_KEYWORDS, *ocr.TAX_KEYWORDS, *ocr.CURRENCY_SYMBOLS, *ocr.CURRENCY_SYMBOLS.values()]
+)
+def test_totals_whitelist_spells_every_keyword_and_currency(word):
+    for spelling in (word.upper(), word.lower()):
+        assert set(spelling.replace(" ", "")) <= set(ocr.TOTALS_WHITELIST), spelling
+
+
+@pytest.mark.parametrize(
+    "text, total, currency",
+    [
+        ("AMOUNT DUE: 12.50 EUR", 12.50, "EUR"),
+        ("GRAND TOTAL 7.25\nGBP", 7.25, "GBP"),
+        ("Total\n£3.10", 3.10, "GBP"),
+    ],
+)
+def test_parser_reads_totals_pass_text(text, total, currency):
+    fields = ocr.ReceiptParser().parse(text)
+    assert (fields["total_amount"], fields["currency"]) == (total, currency)
+
+
+def test_totals_whitelist_spells_numeric_dates():
+    assert set("12/03/2024 2024-03-12") - {" "} <= set(ocr.TOTALS_WHITELIST)
@@ -0,0 +1,26 @@
+import pytest
+
+from app import models
+from benchmarks import check_query_plans
+
+
+@pytest.fixture(scope="module")
+def seeded_db(tmp_path_factory):
+    db_path = str(tmp_path_factory.mktemp("plans") / "receipts.db")
+    models.init_db(db_path)
+    check_query_plans.seed(db_path, 2000)
+    yield db_path
+    models.close_connections()
+
+
+def test_fresh_database_is_fully_migrated(seeded_db):
+    assert models.schema_version(models.get_connection(seeded_db)) == len(models.MIGRATIONS)
+
+
+@pytest.mark.parametrize(
+    "call, index",
+    [case[1:] for case in check_query_plans.CASES],
+    ids=[case[0] for case in check_query_plans.CASES],
+)
+def test_query_uses_its_index_without_scans_or_sorts(seeded_db, call, index):
+    assert check_query_plans.check_case(seeded_db, call, index) == []
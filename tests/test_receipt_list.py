@@ -0,0 +1,58 @@
+from app import jobs, models
+
+
+def _add(db_path, count, category, vendor):
+    for i in range(count):
+        record = jobs.pending_record(f"{category}-{i}", "")
+        record.update(date=f"2024-01-{i + 1:02d}", category=category, vendor=vendor)
+        models.insert_receipt(db_path, record)
+
+
+def test_browsing_totals_come_from_the_rollups(app, db_path):
+    _add(db_path, 12, "Dining", "Cafe")
+    _add(db_path, 3, "Groceries", "Market")
+
+    assert models.list_receipts(db_path)["total"] == 15
+    assert models.list_receipts(db_path, category="Dining")["total"] == 12
+    assert models.list_receipts(db_path, category="Nothing")["total"] == 0
+
+
+def test_search_pages_do_not_count_matches(app, client, db_path):
+    _add(db_path, 12, "Dining", "Cafe")
+    counts = []
+    conn = models.get_connection(db_path)
+    conn.set_trace_callback(lambda sql: counts.append(sql) if "COUNT(" in sql else None)
+    try:
+        page = client.get("/receipts?search=cafe").get_data(as_text=True)
+    finally:
+        conn.set_trace_callback(None)
+
+    assert counts == []
+    assert "Next" in page
+    assert "Last" not in page
+    assert "receipts</span>" not in page
+
+
+def test_browsing_shows_the_total_and_last_page(app, client, db_path):
+    _add(db_path, 12, "Dining", "Cafe")
+
+    page = client.get("/receipts").get_data(as_text=True)
+
+    assert "12 receipts</span>" in page
+    assert "Last" in page
+
+
+def test_search_snippets_mark_the_matched_words(app, db_path):
+    record = jobs.pending_record("r1", "")
+    text = "CORNER SHOP\n" + "\n".join(f"ITEM{i} 1.00" for i in range(20)) + "\nCRÈME BRÛLÉE 4.50\nTOTAL 24.50"
+    record.update(vendor="Corner Shop", raw_text=text)
+    models.insert_receipt(db_path, record)
+
+    (receipt,) = models.list_receipts(db_path, search="creme")["receipts"]
+    (by_vendor,) = models.list_receipts(db_path, search="corner")["receipts"]
+
+    start, end = models.SNIPPET_START, models.SNIPPET_END
+    assert receipt["snippet"].startswith("…")
+    assert f"{start}CRÈME{end} BRÛLÉE 4.50\nTOTAL 24.50" in receipt["snippet"]
+    assert by_vendor["snippet"].startswith(f"{start}CORNER{end} SHOP\nITEM0")
+    assert by_vendor["snippet"].endswith("…")
@@ -0,0 +1,113 @@
+import os
+import socket
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from app import capture_service, main
+
+
+def _fake_daemon(monkeypatch, image_dir, captures):
+    """Camera daemon whose preview captures one frame per ``captures`` digest."""
+
+    def preview_stream(auto_dir):
+        yield {}, b"jpeg"
+        for i, digest in enumerate(captures):
+            name = f"auto-{i}.jpg"
+            with open(os.path.join(image_dir, name), "wb") as f:
+                f.write(b"jpeg")
+            yield {"captured": os.path.join(auto_dir, name), "sha256": digest}, b"jpeg"
+
+    monkeypatch.setattr(main, "preview_stream", preview_stream)
+    monkeypatch.setattr(
+        main, "send_request", lambda request, timeout: ({"preview_state": "steady", "auto_captures": 0}, None)
+    )
+
+
+def test_auto_captures_are_reported_by_status_not_flashed(app, client, monkeypatch):
+    _fake_daemon(monkeypatch, app.config["IMAGE_DIR"], ["a" * 64, "a" * 64])
+
+    response = client.get("/scan/preview?auto=1&client=page1")
+    assert response.get_data().count(b"--frame") == 3
+
+    with client.session_transaction() as session:
+        assert "_flashes" not in session
+    captures = client.get("/scan/status?client=page1").get_json()["captures"]
+    assert [c["existing"] for c in captures] == [False, True]
+    assert captures[0]["receipt_id"] == captures[1]["receipt_id"]
+    assert captures[0]["url"] == f"/receipts/{captures[0]['receipt_id']}"
+
+    assert client.get(f"/scan/status?client=page1&after={captures[0]['id']}").get_json()["captures"] == captures[1:]
+    assert client.get("/scan/status?client=page2").get_json()["captures"] == []
+    assert "captures" not in client.get("/scan/status").get_json()
+
+
+@pytest.mark.parametrize("error", [socket.timeout("timed out"), ConnectionResetError("reset by peer")])
+def test_scan_reports_a_failed_daemon_connection(app, client, monkeypatch, error):
+    def capture_receipt(image_path, queue_db, client):
+        raise error
+
+    monkeypatch.setattr(main, "capture_receipt", capture_receipt)
+
+    response = client.post("/scan", data={"client": "page1"})
+
+    assert response.status_code == 302
+    assert response.headers["Location"].endswith("/scan")
+    with client.session_transaction() as session:
+        assert session["_flashes"] == [("danger", f"Capture failed: {error}")]
+
+
+def test_a_hung_daemon_raises_runtime_error(tmp_path):
+    socket_path = str(tmp_path / "camera.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen(1)  # never accepts or answers
+        start = time.monotonic()
+        with pytest.raises(RuntimeError, match="capture daemon"):
+            capture_service.send_request({"cmd": "status"}, socket_path, timeout=0.2)
+    assert time.monotonic() - start < 5
+
+
+def test_duplicate_scans_are_discarded_by_the_daemon(app, client, monkeypatch):
+    captured, discarded = [], []
+
+    def capture_receipt(image_path, queue_db, client):
+        captured.append(image_path)
+        with open(image_path, "wb") as f:
+            f.write(b"jpeg")
+        return "b" * 64
+
+    monkeypatch.setattr(main, "capture_receipt", capture_receipt)
+    monkeypatch.setattr(main, "discard_capture", discarded.append)
+
+    first = client.post("/scan")
+    second = client.post("/scan")
+
+    assert first.headers["Location"] == second.headers["Location"]
+    assert discarded == captured[1:]
+    assert all(os.path.exists(path) for path in captured)
+
+
+def test_daemon_discards_a_capture_after_writing_it(tmp_path, monkeypatch):
+    cv2.imwrite(str(tmp_path / "frame.png"), np.full((48, 64, 3), 200, dtype=np.uint8))
+
+    def slow_write(frame, path):
+        time.sleep(0.2)
+        with open(path, "wb") as f:
+            f.write(b"jpeg")
+
+    monkeypatch.setattr(capture_service, "write_jpeg", slow_write)
+    source = capture_service.FakeFrameSource(str(tmp_path))
+    server = capture_service.CaptureServer(str(tmp_path / "camera.sock"), source)
+    path = str(tmp_path / "capture.jpg")
+    try:
+        server.capture_to(path)
+        assert server.discard(path)
+        assert not server.discard(path)
+        assert not server.discard(str(tmp_path / "frame.png"))
+    finally:
+        server.server_close()
+    assert not os.path.exists(path)
+    assert os.path.exists(tmp_path / "frame.png")